@@ -0,0 +1,113 @@
+"""
+Micro-benchmark of the inspection of uploaded archives. Realistic chart
+archives are inspected using the pure Python parser of YAML, the parser
+of libyaml if it is available, and with the cache of parsed definitions.
+
+    python benchmarks/definitions.py --archives 200 --rounds 5
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from zipfile import ZipFile, ZIP_DEFLATED
+
+import yaml
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from swing_server import chart  # noqa: E402
+from swing_server.cache import MemoryCache  # noqa: E402
+
+
+def make_definition(number):
+    """
+    Return the chart definition similar to the definitions
+    of public charts, with maintainers, keywords and dependencies.
+    """
+    return {
+        'name': f'chart-{chr(ord("a") + number % 26)}',
+        'version': f'1.{number}.0',
+        'appVersion': f'2.{number}.1',
+        'description': f'Synthetic chart number {number} deploying a replicated service with persistent storage, '
+                       'metrics exporter, configurable ingress and autoscaling.',
+        'home': 'https://example.com/charts',
+        'keywords': ['database', 'cache', 'storage', 'replication', f'service-{number}'],
+        'maintainers': [{'name': f'Maintainer {x}', 'email': f'maintainer{x}@example.com'} for x in range(3)],
+        'sources': [f'https://github.com/example/chart-{number}', 'https://example.com/docs'],
+        'dependencies': [
+            {'name': name, 'version': f'~{x}.2.0', 'repository': 'https://charts.example.com', 'condition': f'{name}.enabled'}
+            for x, name in enumerate(['common', 'redis', 'postgresql', 'metrics'])
+        ],
+        'annotations': {f'example.com/annotation-{x}': f'value {x}' for x in range(5)},
+    }
+
+
+def make_archive(number):
+    archive = io.BytesIO()
+
+    with ZipFile(archive, 'w', ZIP_DEFLATED) as zip_archive:
+        zip_archive.writestr('chart.yaml', yaml.safe_dump(make_definition(number), sort_keys=False))
+        zip_archive.writestr('values.yaml', 'replicas: 3\nimage:\n  repository: example/service\n  tag: latest\n')
+        zip_archive.writestr('deployment.yaml', 'services:\n  service:\n    image: "{{ image.repository }}"\n')
+
+    return archive.getvalue()
+
+
+def run(archives, rounds, definition_cache=None):
+    """
+    Inspect all archives in every round and return
+    the best average time of the inspection in microseconds.
+    """
+    best = None
+
+    for _ in range(rounds):
+        started_at = time.perf_counter()
+
+        for data in archives:
+            with ZipFile(io.BytesIO(data)) as zip_archive:
+                chart.inspect_chart_archive(zip_archive, definition_cache=definition_cache)
+
+        elapsed = (time.perf_counter() - started_at) / len(archives) * 1000000
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the inspection of uploaded archives.')
+    parser.add_argument('--archives', type=int, default=200, help='number of distinct archives')
+    parser.add_argument('--rounds', type=int, default=5, help='number of rounds, the best one is reported')
+    args = parser.parse_args()
+
+    archives = [make_archive(x) for x in range(args.archives)]
+    loaders = [('python', yaml.SafeLoader)]
+
+    if hasattr(yaml, 'CSafeLoader'):
+        loaders.append(('libyaml', yaml.CSafeLoader))
+    else:
+        print('PyYAML is built without libyaml, only the pure Python parser is measured.')
+
+    default_loader = chart.SafeLoader
+    results = {}
+
+    try:
+        for name, loader in loaders:
+            chart.SafeLoader = loader
+            results[name] = run(archives, args.rounds)
+    finally:
+        chart.SafeLoader = default_loader
+
+    # the first round fills the cache, so the best round is served by it
+    results['cached'] = run(archives, args.rounds, MemoryCache(args.archives, 60))
+
+    baseline = results['python']
+    print(f'{"parser":<10} {"us/archive":>10} {"speedup":>8}')
+
+    for name, elapsed in results.items():
+        print(f'{name:<10} {elapsed:>10.1f} {baseline / elapsed:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
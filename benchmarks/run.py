@@ -0,0 +1,284 @@
+"""
+Benchmark of the hot endpoints of the server. The repository is seeded
+with synthetic charts, then every scenario is driven by concurrent clients
+and its latency, throughput and number of SQL queries per request are
+reported. The results can be saved and compared with a baseline.
+
+    python benchmarks/run.py --charts 100 --releases 10 --save baseline.json
+    python benchmarks/run.py --charts 100 --releases 10 --compare baseline.json
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+USER_EMAIL = 'bench@example.com'
+USER_PASSWORD = 'bench123'
+
+
+def setup_environment(workdir):
+    """
+    Configure the server to use the working directory, unless
+    the database or the storage are configured by the environment.
+    """
+    os.environ.setdefault('DATABASE_URI', f'sqlite:///{os.path.join(workdir, "swing.db")}')
+    os.environ.setdefault('STORAGE_LOCAL_DIR', os.path.join(workdir, 'uploads'))
+    os.environ.setdefault('SESSION_FILE_DIR', os.path.join(workdir, 'sessions'))
+    os.environ.setdefault('SESSION_TYPE', 'filesystem')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ['INIT_USER_EMAIL'] = ''
+
+    sys.path.insert(0, ROOT_DIR)
+    sys.path.insert(0, os.path.join(ROOT_DIR, 'tests'))
+
+
+def make_chart_name(number):
+    """
+    Return the name of the chart with the number encoded
+    using letters, as chart names can not contain digits.
+    """
+    letters = ''
+
+    while True:
+        number, digit = divmod(number, 26)
+        letters = chr(ord('a') + digit) + letters
+        if not number:
+            return f'chart-{letters}'
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Client:
+    """
+    Client of the application bound to the thread, which counts
+    the SQL queries executed while its requests are handled.
+    """
+    local = threading.local()
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+        self.queries = 0
+
+        credentials = b64encode(f'{USER_EMAIL}:{USER_PASSWORD}'.encode()).decode()
+        self.client.post('/login', headers={'Authorization': f'Basic {credentials}'})
+
+    @classmethod
+    def get(cls, app):
+        if not hasattr(cls.local, 'client'):
+            cls.local.client = Client(app)
+        return cls.local.client
+
+    @classmethod
+    def count_query(cls, *args, **kwargs):
+        client = getattr(cls.local, 'client', None)
+        if client:
+            client.queries += 1
+
+
+class Benchmark:
+    def __init__(self, app, charts, releases, seed=0):
+        self.app = app
+        self.charts = charts
+        self.releases = releases
+        self.random = random.Random(seed)
+        self.versions = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def get_chart_name(self):
+        with self.lock:
+            return make_chart_name(self.random.randrange(self.charts))
+
+    def get_release_name(self):
+        with self.lock:
+            number = self.random.randrange(self.charts)
+            return f'{make_chart_name(number)}-1.0.{self.random.randrange(self.releases)}'
+
+    def publish(self, client, name, version):
+        from helpers import create_chart_zip
+
+        archive = create_chart_zip(name, version, f'Synthetic chart {name} for benchmarks')
+        data = {'chart': (archive, f'{name}-{version}.zip')}
+        return client.post('/release', data=data, content_type='multipart/form-data')
+
+    def seed(self):
+        """
+        Create the user and publish all releases of all charts.
+        """
+        from swing_server.models import db, make_user
+
+        with self.app.app_context():
+            db.session.add(make_user(USER_EMAIL, USER_PASSWORD))
+            db.session.commit()
+
+        client = Client.get(self.app).client
+
+        for i in range(self.charts):
+            for j in range(self.releases):
+                response = self.publish(client, make_chart_name(i), f'1.0.{j}')
+                if response.status_code != 200:
+                    raise RuntimeError(f'Seeding failed: {response.get_data(as_text=True)}')
+
+    def get_scenarios(self):
+        def publish(client):
+            with self.lock:
+                version = f'2.{next(self.versions)}.0'
+            return self.publish(client, self.get_chart_name(), version)
+
+        return {
+            'list_charts': lambda client: client.get('/chart'),
+            'search_charts': lambda client: client.get('/chart', query_string={'query': 'synthetic chart'}),
+            'list_releases': lambda client: client.get('/release', query_string={'chart': self.get_chart_name()}),
+            'download_release': lambda client: client.get(f'/release/{self.get_release_name()}.zip'),
+            'publish_release': publish,
+        }
+
+    def run_scenario(self, scenario, requests, concurrency):
+        """
+        Send the requests of the scenario from concurrent clients
+        and return the statistics of their responses.
+        """
+        latencies = []
+        errors = []
+        queries = []
+
+        def send(_):
+            client = Client.get(self.app)
+            before = client.queries
+
+            started_at = time.perf_counter()
+            response = scenario(client.client)
+            response.get_data()
+            latency = time.perf_counter() - started_at
+
+            with self.lock:
+                latencies.append(latency)
+                queries.append(client.queries - before)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+        started_at = time.perf_counter()
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(send, range(requests)))
+
+        elapsed = time.perf_counter() - started_at
+
+        return {
+            'requests': requests,
+            'errors': len(errors),
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'throughput': requests / elapsed,
+            'queries': sum(queries) / requests,
+        }
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Return the descriptions of scenarios, which are slower than in
+    the baseline by more than the threshold, or run more queries.
+    The number of queries varies with hits of the metadata cache,
+    so only an additional query per every other request is reported.
+    """
+    regressions = []
+
+    for name, result in results.items():
+        expected = baseline.get(name)
+
+        if not expected:
+            continue
+
+        if result['p99_ms'] > expected['p99_ms'] * (1 + threshold):
+            regressions.append(f'{name}: p99 {expected["p99_ms"]:.2f} ms -> {result["p99_ms"]:.2f} ms')
+
+        if result['throughput'] < expected['throughput'] * (1 - threshold):
+            regressions.append(f'{name}: throughput {expected["throughput"]:.1f} -> {result["throughput"]:.1f} req/s')
+
+        if result['queries'] > expected['queries'] + 0.5:
+            regressions.append(f'{name}: queries {expected["queries"]:.2f} -> {result["queries"]:.2f} per request')
+
+    return regressions
+
+
+def print_results(results):
+    print(f'{"scenario":<18} {"requests":>8} {"errors":>6} {"p50 ms":>8} {"p99 ms":>8} {"req/s":>9} {"queries":>7}')
+
+    for name, result in results.items():
+        print(f'{name:<18} {result["requests"]:>8} {result["errors"]:>6} {result["p50_ms"]:>8.2f} '
+              f'{result["p99_ms"]:>8.2f} {result["throughput"]:>9.1f} {result["queries"]:>7.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the hot endpoints of the server.')
+    parser.add_argument('--charts', type=int, default=100, help='number of seeded charts')
+    parser.add_argument('--releases', type=int, default=10, help='number of releases of every chart')
+    parser.add_argument('--requests', type=int, default=1000, help='number of requests of every scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of concurrent clients')
+    parser.add_argument('--scenario', action='append', help='run only the scenario, can be repeated')
+    parser.add_argument('--save', help='save the results to the JSON file')
+    parser.add_argument('--compare', help='compare the results with the JSON file of the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='tolerated relative slowdown')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='swing-bench-')
+
+    try:
+        setup_environment(workdir)
+
+        from sqlalchemy import event
+        from swing_server.app import create_app
+        from swing_server.models import db
+
+        app = create_app()
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', Client.count_query)
+
+        benchmark = Benchmark(app, args.charts, args.releases)
+
+        started_at = time.perf_counter()
+        benchmark.seed()
+        print(f'Seeded {args.charts} charts with {args.releases} releases in {time.perf_counter() - started_at:.1f} s')
+
+        results = {}
+
+        for name, scenario in benchmark.get_scenarios().items():
+            if args.scenario and name not in args.scenario:
+                continue
+            results[name] = benchmark.run_scenario(scenario, args.requests, args.concurrency)
+
+        print_results(results)
+
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump(results, f, indent=2)
+
+        if args.compare:
+            with open(args.compare) as f:
+                regressions = compare_results(results, json.load(f), args.threshold)
+
+            for regression in regressions:
+                print(f'REGRESSION {regression}')
+
+            if regressions:
+                sys.exit(1)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,44 +1,304 @@
+import io
+import os
+import shutil
+import sys
+import tarfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urlencode
 from zipfile import ZipFile, BadZipFile
 
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, current_app, json, jsonify, redirect, request, send_file, stream_with_context
 from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import FileStorage
 from werkzeug.exceptions import NotFound, BadRequest, Forbidden, InternalServerError
+from werkzeug.http import is_resource_modified
 
-from .chart import validate_chart_archive, read_definition
+from .cache import CacheType, MemoryCache, RedisCache
+from .chart import ArchiveLimits, inspect_chart_archive
 from .config import Config
 from .errors import InvalidChartError
 from .helpers import to_dicts, is_valid_chart_name, is_valid_version, is_valid_filename, parse_archive_filename
-from .models import Chart, Release, db
-from .storage import LocalStorage
-from .storage import StorageType
+from .helpers import encode_cursor, decode_cursor
+from .index import IndexFormat, get_repository_index
+from .metrics import METRICS_MIMETYPE, MeteredStorage, record_download, registry, validation_duration
+from .models import Chart, Release, db, get_repository, touch_repository
+from .search import get_search_engine
+from .s3 import S3Client
+from .storage import LocalStorage, ContentStorage, S3Storage, CachedStorage
+from .storage import CHUNK_SIZE, StorageType, DownloadMode, get_upload_file
 
 main = Blueprint('main', __name__)
 
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
 if Config.STORAGE_TYPE == StorageType.LOCAL:
     storage = LocalStorage(Config.STORAGE_LOCAL_DIR)
+elif Config.STORAGE_TYPE == StorageType.CONTENT:
+    storage = ContentStorage(Config.STORAGE_LOCAL_DIR)
+elif Config.STORAGE_TYPE == StorageType.S3:
+    s3_client = S3Client(Config.STORAGE_S3_ENDPOINT,
+                         Config.STORAGE_S3_BUCKET,
+                         Config.STORAGE_S3_ACCESS_KEY,
+                         Config.STORAGE_S3_SECRET_KEY,
+                         Config.STORAGE_S3_REGION)
+    storage = S3Storage(s3_client, Config.STORAGE_S3_PREFIX)
+
+if Config.STORAGE_CACHE_DIR:
+    storage = CachedStorage(storage, Config.STORAGE_CACHE_DIR, Config.STORAGE_CACHE_SIZE)
+
+if Config.METRICS_ENABLED:
+    storage = MeteredStorage(storage)
+
+archive_limits = ArchiveLimits(Config.ARCHIVE_MAX_ENTRIES,
+                               Config.ARCHIVE_MAX_ENTRY_SIZE,
+                               Config.ARCHIVE_MAX_SIZE,
+                               Config.DEFINITION_MAX_NODES,
+                               Config.DEFINITION_MAX_DEPTH,
+                               Config.DEFINITION_MAX_SIZE)
+
+# stored archives are not checked against the limits lowered after they were published
+stored_archive_limits = ArchiveLimits(*[sys.maxsize] * 6)
+
+# definitions are cached under the digest of their content, so they can not become stale
+definition_cache = MemoryCache(Config.DEFINITION_CACHE_SIZE, 24 * 60 * 60) if Config.DEFINITION_CACHE_SIZE else None
+
+if Config.CACHE_TYPE == CacheType.REDIS:
+    metadata_cache = RedisCache(Config.CACHE_REDIS_URL, Config.SECRET_KEY, Config.CACHE_SIZE, Config.CACHE_TTL)
+else:
+    metadata_cache = MemoryCache(Config.CACHE_SIZE, Config.CACHE_TTL)
+
+
+def make_not_modified(etag, last_modified):
+    """
+    Return an empty response with the Not Modified status if the client
+    already has the current representation of the resource.
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+
+    response = current_app.response_class(status=304)
+    return set_validators(response, etag, last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
+
+def get_repository_state():
+    """
+    Return the state of the repository, which is cached
+    for a short time as it is checked by most of the requests.
+    """
+    state = metadata_cache.get('repository')
+
+    if state is None:
+        state = get_repository().get_state()
+        metadata_cache.set('repository', state)
+
+    return state
+
+
+def get_release_key(chart_name, version):
+    return f'release:{chart_name}:{version}'
+
+
+def get_release_info(chart_name, version):
+    """
+    Return the metadata of the release needed for its download,
+    which are loaded from the cache if possible.
+    """
+    release_key = get_release_key(chart_name, version)
+    release_info = metadata_cache.get(release_key)
+
+    if release_info:
+        return release_info
+
+    chart = Chart.query.filter_by(name=chart_name).first()
+
+    if not chart:
+        raise NotFound(f'No chart called \'{chart_name}\' was found.')
+
+    release = Release.query.filter_by(chart_id=chart.id, version=version).first()
+
+    if not release:
+        raise NotFound(f'No release with version \'{version}\' was found.')
+
+    release_info = release.get_info()
+    metadata_cache.set(release_key, release_info)
+
+    return release_info
+
+
+def refresh_metadata(chart_name, versions=()):
+    """
+    Invalidate the cached metadata and update the indexes kept
+    in memory after the change of the chart was committed.
+    """
+    refresh_charts({chart_name: versions})
+
+
+def refresh_charts(versions):
+    """
+    Invalidate the cached metadata and update the indexes kept in memory
+    after the change of the charts was committed in a single revision,
+    where the changed versions are given under the names of their charts.
+    """
+    keys = [get_release_key(name, x) for name, chart_versions in versions.items() for x in chart_versions]
+    metadata_cache.invalidate('repository', *keys)
+    get_repository_index().update_charts(list(versions), get_repository_state())
+
+
+def wants_ndjson():
+    """
+    Check if the client prefers the listing to be streamed
+    as newline-delimited JSON objects.
+    """
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def get_listing_etag(repository):
+    etag = repository.get_etag()
+
+    if wants_ndjson():
+        return f'{etag}-ndjson'
+    return etag
+
+
+def get_page_limit():
+    """
+    Return the maximal number of listed items requested by the client.
+    """
+    limit = request.args.get('limit')
+
+    if limit is None:
+        return None
+
+    if not limit.isdigit() or not 0 < int(limit) <= MAX_PAGE_SIZE:
+        raise BadRequest(f'The limit has to be a number between 1 and {MAX_PAGE_SIZE}.')
+
+    return int(limit)
+
+
+def get_page_cursor(length):
+    """
+    Return the values of the cursor pointing to the requested page.
+    """
+    cursor = request.args.get('cursor')
+
+    if not cursor:
+        return None
+
+    try:
+        values = decode_cursor(cursor)
+    except ValueError:
+        raise BadRequest('Provided cursor is not valid.')
+
+    if len(values) != length:
+        raise BadRequest('Provided cursor is not valid.')
+
+    return values
+
+
+def take_page(rows, limit, make_cursor):
+    """
+    Take one page of the rows, which contain one row more than
+    the limit if there is a next page, and return the page together
+    with the cursor pointing to the next page.
+    """
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(make_cursor(rows[limit - 1]))
+    return rows, None
+
+
+def make_listing(rows, etag, last_modified, next_cursor=None):
+    """
+    Create the response with the listed rows, which are either serialized
+    into a JSON array or streamed row by row as newline-delimited JSON.
+    If there is a next page, then its address is sent in the Link header.
+    """
+    if wants_ndjson():
+        def generate():
+            for row in rows:
+                yield json.dumps(row.to_dict()) + '\n'
+
+        response = current_app.response_class(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+    else:
+        response = jsonify(to_dicts(rows))
+
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{Config.PUBLIC_URL}{request.path}?{urlencode(args)}>; rel="next"'
+
+    response.vary.add('Accept')
+    return set_validators(response, etag, last_modified)
 
 
 @main.route('/chart', methods=['GET'])
 def list_charts():
     """
     Return list of all charts. If the query is specified,
-    then filter charts by their name or description.
+    then filter charts by their name or description, and
+    order them by the relevance. If the limit is specified,
+    then return only one page of the charts.
     """
+    repository = get_repository_state()
+    etag = get_listing_etag(repository)
+
+    not_modified = make_not_modified(etag, repository.updated_at)
+    if not_modified:
+        return not_modified
+
     query = request.args.get('query')
+    limit = get_page_limit()
+    cursor = get_page_cursor(1)
+    next_cursor = None
 
-    chart_query = Chart.query.order_by(Chart.name.asc())
+    if not query and not limit and not cursor and not wants_ndjson():
+        charts_key = f'charts:{repository.revision}'
+        charts = metadata_cache.get(charts_key)
+
+        if charts is None:
+            charts = to_dicts(Chart.query.order_by(Chart.name.asc()))
+            metadata_cache.set(charts_key, charts)
+
+        response = jsonify(charts)
+        response.vary.add('Accept')
+        return set_validators(response, etag, repository.updated_at)
 
     if query:
-        name_filter = (Chart.name.ilike(f'%{query}%') | Chart.description.ilike(f'%{query}%'))
-        charts = chart_query.filter(name_filter).all()
+        offset = cursor[0] if cursor else 0
+
+        if type(offset) is not int or offset < 0:
+            raise BadRequest('Provided cursor is not valid.')
+
+        charts = get_search_engine().search(query, repository.revision, offset, limit and limit + 1)
+
+        if limit:
+            charts, next_cursor = take_page(charts, limit, lambda _: [offset + limit])
     else:
-        charts = chart_query.all()
+        chart_query = Chart.query.order_by(Chart.name.asc())
 
-    if not charts:
-        return jsonify([])
+        if cursor:
+            if not isinstance(cursor[0], str):
+                raise BadRequest('Provided cursor is not valid.')
 
-    response = to_dicts(charts)
-    return jsonify(response)
+            chart_query = chart_query.filter(Chart.name > cursor[0])
+
+        if limit:
+            charts, next_cursor = take_page(chart_query.limit(limit + 1).all(), limit, lambda x: [x.name])
+        else:
+            charts = chart_query.yield_per(STREAM_BATCH_SIZE)
+
+    return make_listing(charts, etag, repository.updated_at, next_cursor)
 
 
 @main.route('/chart/<chart_name>', methods=['DELETE'])
@@ -72,19 +332,54 @@ def remove_chart(chart_name):
 
         storage.delete(release.id)
 
+        response = release.to_dict()
+
         db.session.delete(release)
+        touch_repository()
         db.session.commit()
 
-        return release.to_dict()
+        refresh_metadata(chart_name, [version])
+
+        return response
+
+    versions = []
 
     for release in chart.releases:
         storage.delete(release.id)
         db.session.delete(release)
+        versions.append(release.version)
+
+    response = chart.to_dict()
 
     db.session.delete(chart)
+    touch_repository(charts=-1)
     db.session.commit()
 
-    return chart.to_dict()
+    refresh_metadata(chart_name, versions)
+
+    return response
+
+
+def inspect_uploaded_archive(file):
+    """
+    Validate the uploaded archive and return its manifest.
+    It does not need the context of the request, so archives
+    of the bulk upload can be validated by multiple threads.
+    """
+    if not is_valid_filename(file.filename.split('/')[-1]):
+        raise BadRequest('Provided archive file has not a valid extension.')
+
+    started_at = time.perf_counter()
+
+    try:
+        with ZipFile(file.stream, 'r') as zip_file:
+            return inspect_chart_archive(zip_file, archive_limits, definition_cache)
+    except BadZipFile:
+        raise BadRequest('Provided file is not a valid ZIP archive.')
+    except InvalidChartError as e:
+        raise BadRequest(e.message)
+    finally:
+        validation_duration.observe(time.perf_counter() - started_at)
 
 
 @main.route('/release', methods=['POST'])
@@ -101,54 +396,313 @@ def publish_release():
     if not file or file.filename == '':
         raise BadRequest('The archived chart was not provided.')
 
-    if not is_valid_filename(file.filename.split('/')[-1]):
-        raise BadRequest('Provided archive file has not a valid extension.')
+    manifest = inspect_uploaded_archive(file)
+    definition = manifest.definition
+
+    notes = request.form.get('notes')
+    upload_file = get_upload_file(file)
+
+    # when the first release of a new chart is published concurrently,
+    # then the chart is created by the other request, so it is loaded again
+    for attempt in range(2):
+        chart = Chart.query.filter_by(name=definition.name).first()
+
+        if chart and chart.user_id != current_user.id:
+            raise Forbidden('You are not allowed to publish a release of the chart you do not own.')
+
+        created = not chart
+
+        if created:
+            chart = Chart(name=definition.name, user_id=current_user.id)
+            db.session.add(chart)
+
+        chart.description = definition.description
+
+        release = Release(chart=chart, version=definition.version, notes=notes, manifest=manifest.to_dict())
+
+        if upload_file:
+            release.digest = upload_file.digest
+            release.size = upload_file.size
+
+        db.session.add(release)
 
-    with ZipFile(file, 'r') as zip_file:
         try:
-            validate_chart_archive(zip_file)
-            definition = read_definition(zip_file)
-        except BadZipFile:
-            raise BadRequest('Provided file is not a valid ZIP archive.')
-        except InvalidChartError as e:
-            raise BadRequest(e.message)
+            db.session.flush()
+            break
+        except IntegrityError:
+            db.session.rollback()
 
-    chart = Chart.query.filter_by(name=definition.name).first()
+            # releases of the new chart can not conflict, so its name does
+            if not created:
+                raise BadRequest(f'Release with version \'{definition.version}\' already exists.')
 
-    if chart and chart.user_id != current_user.id:
-        raise Forbidden('You are not allowed to publish a release of the chart you do not own.')
-    else:
-        chart = Chart(
-            name=definition.name,
-            description=definition.description,
-            user_id=current_user.id)
+            if attempt:
+                raise BadRequest(f'Chart \'{definition.name}\' was changed concurrently, try it again.')
 
-        db.session.add(chart)
-        db.session.commit()
+    release_id = release.id
+    response = release.to_dict()
 
-    release = Release.query.filter_by(chart_id=chart.id, version=definition.version).first()
+    touch_repository(charts=1 if created else 0)
+    db.session.commit()
 
-    if release:
-        raise BadRequest(f'Release with version \'{release.version}\' already exists.')
-    else:
-        notes = request.form.get('notes')
+    storage.upload(release_id, file)
+    refresh_metadata(definition.name, [definition.version])
+
+    return response
+
+
+class BulkItem:
+    """
+    Archive of the bulk upload and the result of its publication.
+    """
+    def __init__(self, file, error=None):
+        self.file = file
+        self.error = error
+        self.manifest = None
+        self.release = None
+        self.release_id = None
+        self.response = None
+
+    def to_dict(self):
+        result = {'file': self.file.filename}
+
+        if self.error:
+            result.update(status='failed', error=self.error)
+        elif self.response:
+            result.update(status='published', release=self.response)
+        else:
+            result.update(status='skipped')
+
+        return result
+
+
+def get_bulk_executor():
+    executor = current_app.extensions.get('swing_bulk_executor')
+
+    if executor is None:
+        executor = ThreadPoolExecutor(Config.BULK_THREADS, thread_name_prefix='swing-bulk')
+        current_app.extensions['swing_bulk_executor'] = executor
+
+    return executor
+
+
+def extract_bundles(bundles, items):
+    """
+    Extract the archived charts from the uploaded tar bundles. The bundles
+    are read sequentially, and every archive is written to its upload file,
+    so it can be moved to the storage without copying. The members, which
+    are skipped, are decompressed too, so the number and the declared sizes
+    of all members are limited before any of them is read.
+    """
+    members = 0
+    size = 0
+
+    for bundle in bundles:
+        try:
+            with tarfile.open(fileobj=bundle.stream, mode='r|*') as tar_file:
+                for member in tar_file:
+                    members += 1
+                    size += member.size
+
+                    if members > Config.BULK_MAX_MEMBERS:
+                        raise BadRequest(f'The bundles can not contain more than {Config.BULK_MAX_MEMBERS} files.')
+
+                    if size > Config.BULK_MAX_CONTENT_LENGTH:
+                        raise BadRequest('The extracted bundles exceed the maximal size.')
+
+                    if not member.isfile() or not member.name.endswith('.zip'):
+                        continue
+
+                    if len(items) >= Config.BULK_MAX_ARCHIVES:
+                        raise BadRequest(f'At most {Config.BULK_MAX_ARCHIVES} archives can be published at once.')
+
+                    file_name = member.name.split('/')[-1]
+
+                    if member.size > Config.MAX_CONTENT_LENGTH:
+                        error = 'The archive exceeds the maximal size.'
+                        items.append(BulkItem(FileStorage(io.BytesIO(), filename=file_name), error))
+                        continue
+
+                    upload_file = storage.create_upload()
+                    items.append(BulkItem(FileStorage(upload_file, filename=file_name)))
+
+                    shutil.copyfileobj(tar_file.extractfile(member), upload_file, CHUNK_SIZE)
+                    upload_file.seek(0)
+        except (tarfile.TarError, EOFError, zlib.error):
+            raise BadRequest('Provided bundle is not a valid tar archive.')
+
+
+def validate_bulk_item(item, logger):
+    if item.error:
+        return
+
+    upload_file = get_upload_file(item.file)
+
+    if upload_file and upload_file.size > Config.MAX_CONTENT_LENGTH:
+        item.error = 'The archive exceeds the maximal size.'
+        return
+
+    try:
+        item.manifest = inspect_uploaded_archive(item.file)
+    except BadRequest as e:
+        item.error = e.description
+    except Exception:
+        # an unexpected fault of a single archive does not fail the whole bulk
+        logger.exception(f'Validation of the archive {item.file.filename} failed.')
+        item.error = 'The archive could not be validated.'
+
+
+def check_bulk_items(items):
+    """
+    Check that the releases do not exist yet, they are not duplicated
+    in the bulk, and that their charts are owned by the current user.
+    Return the existing charts of the releases by their names.
+    """
+    valid_items = [x for x in items if not x.error]
+
+    if not valid_items:
+        return {}
+
+    names = {x.manifest.definition.name for x in valid_items}
+    versions = {x.manifest.definition.version for x in valid_items}
+
+    charts = {x.name: x for x in Chart.query.filter(Chart.name.in_(names))}
+    existing = db.session.query(Chart.name, Release.version).join(Release.chart)
+    existing = existing.filter(Chart.name.in_(names), Release.version.in_(versions))
+    existing = {(name, version) for name, version in existing}
+    published = set()
+
+    for item in valid_items:
+        definition = item.manifest.definition
+        chart = charts.get(definition.name)
+        key = (definition.name, definition.version)
+
+        if chart and chart.user_id != current_user.id:
+            item.error = 'You are not allowed to publish a release of the chart you do not own.'
+        elif key in existing:
+            item.error = f'Release with version \'{definition.version}\' already exists.'
+        elif key in published:
+            item.error = 'The release is included in the bulk more than once.'
+
+        published.add(key)
+
+    return charts
+
+
+def publish_bulk_items(items, charts):
+    """
+    Create the charts and releases of the valid archives in a single
+    transaction, which changes the repository in a single revision.
+    """
+    created = 0
+
+    for item in items:
+        if item.error:
+            continue
+
+        definition = item.manifest.definition
+        chart = charts.get(definition.name)
+
+        if not chart:
+            chart = charts[definition.name] = Chart(name=definition.name, user_id=current_user.id)
+            db.session.add(chart)
+            created += 1
 
-        release = Release(chart_id=chart.id, version=definition.version, notes=notes)
         chart.description = definition.description
 
-        db.session.add(release)
-        db.session.commit()
+        item.release = Release(chart=chart, version=definition.version, manifest=item.manifest.to_dict())
+        upload_file = get_upload_file(item.file)
 
-        storage.upload(release.id, file)
+        if upload_file:
+            item.release.digest = upload_file.digest
+            item.release.size = upload_file.size
 
-        return release.to_dict()
+        db.session.add(item.release)
+
+    db.session.flush()
+
+    for item in items:
+        if item.release:
+            item.release_id = item.release.id
+            item.response = item.release.to_dict()
+
+    touch_repository(charts=created)
+    db.session.commit()
+
+
+@main.route('/release/bulk', methods=['POST'])
+@login_required
+def publish_releases():
+    """
+    Create releases of many uploaded archives at once. The archives are
+    sent as a multipart form under the `charts` key, or as a tar bundle
+    under the `bundle` key. They are validated in parallel, and all
+    releases are created in a single transaction. If the bulk is atomic,
+    which it is by default, then nothing is published when any archive
+    is not valid, otherwise the valid archives are published anyway.
+    """
+    atomic = request.args.get('atomic', 'true').lower() not in ['0', 'false']
+    items = [BulkItem(x) for x in request.files.getlist('charts') if x.filename]
+
+    try:
+        extract_bundles(request.files.getlist('bundle'), items)
+
+        if not items:
+            raise BadRequest('The archived charts were not provided.')
+
+        if len(items) > Config.BULK_MAX_ARCHIVES:
+            raise BadRequest(f'At most {Config.BULK_MAX_ARCHIVES} archives can be published at once.')
+
+        executor = get_bulk_executor()
+        logger = current_app.logger
+        list(executor.map(lambda x: validate_bulk_item(x, logger), items))
+
+        # charts or releases created concurrently are checked again,
+        # so they are reported as failed items of the bulk
+        for attempt in range(2):
+            charts = check_bulk_items(items)
+            failed = sum(1 for x in items if x.error)
+
+            if failed and atomic:
+                return {'published': 0, 'failed': failed, 'results': [x.to_dict() for x in items]}, 400
+
+            if failed == len(items):
+                break
+
+            try:
+                publish_bulk_items(items, charts)
+                break
+            except IntegrityError:
+                db.session.rollback()
+
+                if attempt:
+                    raise BadRequest('Some of the releases were published concurrently, try it again.')
+
+                for item in items:
+                    item.release = None
+
+        if failed < len(items):
+            published = [x for x in items if x.release_id]
+            list(executor.map(lambda x: storage.upload(x.release_id, x.file), published))
+
+            versions = {}
+            for item in published:
+                definition = item.manifest.definition
+                versions.setdefault(definition.name, []).append(definition.version)
+            refresh_charts(versions)
+
+        return {'published': len(items) - failed, 'failed': failed, 'results': [x.to_dict() for x in items]}
+    finally:
+        for item in items:
+            item.file.close()
 
 
 @main.route('/release', methods=['GET'])
 def list_releases():
     """
     Return list of all releases for the specific chart.
-    Releases are ordered by the version.
+    Releases are ordered by the version from the latest one.
+    If the limit is specified, then return only one page of the releases.
     """
     chart_name = request.args.get('chart')
 
@@ -163,14 +717,129 @@ def list_releases():
     if not chart:
         raise NotFound(f'No chart called \'{chart_name}\' was found.')
 
-    release_query = Release.query.order_by(Release.version.desc())
-    releases = release_query.filter_by(chart_id=chart.id).all()
+    repository = get_repository_state()
+    etag = get_listing_etag(repository)
+
+    not_modified = make_not_modified(etag, repository.updated_at)
+    if not_modified:
+        return not_modified
+
+    limit = get_page_limit()
+    cursor = get_page_cursor(2)
+    next_cursor = None
 
-    if not releases:
-        return jsonify([])
+    release_query = Release.query.order_by(Release.version_key.desc(), Release.id.desc())
+    release_query = release_query.join(Release.chart).options(db.contains_eager(Release.chart))
+    release_query = release_query.filter(Release.chart_id == chart.id)
+
+    if cursor:
+        version_key, release_id = cursor
+
+        if not isinstance(version_key, str) or not isinstance(release_id, int):
+            raise BadRequest('Provided cursor is not valid.')
+
+        release_query = release_query.filter(db.or_(
+            Release.version_key < version_key,
+            db.and_(Release.version_key == version_key, Release.id < release_id)))
+
+    if limit:
+        releases = release_query.limit(limit + 1).all()
+        releases, next_cursor = take_page(releases, limit, lambda x: [x.version_key, x.id])
+    else:
+        releases = release_query.yield_per(STREAM_BATCH_SIZE)
+
+    return make_listing(releases, etag, repository.updated_at, next_cursor)
+
+
+@main.route('/release/latest', methods=['GET'])
+def get_latest_release():
+    """
+    Return the latest release of the specific chart. The release
+    is looked up by a single query using the index of versions.
+    """
+    chart_name = request.args.get('chart')
+
+    if not chart_name:
+        raise BadRequest('Chart name has to be provided.')
+
+    if not is_valid_chart_name(chart_name):
+        raise BadRequest('Provided name is not a valid chart name.')
+
+    release_query = Release.query.join(Release.chart).options(db.contains_eager(Release.chart))
+    release_query = release_query.filter(Chart.name == chart_name)
+    release_query = release_query.order_by(Release.version_key.desc(), Release.id.desc())
+    release = release_query.first()
+
+    if not release:
+        raise NotFound(f'No release of the chart \'{chart_name}\' was found.')
+
+    repository = get_repository_state()
+    etag = repository.get_etag()
+
+    not_modified = make_not_modified(etag, repository.updated_at)
+    if not_modified:
+        return not_modified
+
+    response = jsonify(release.to_dict())
+    return set_validators(response, etag, repository.updated_at)
+
+
+@main.route('/release/manifest', methods=['GET'])
+def get_release_manifest():
+    """
+    Return the manifest of the specific release, which was created
+    when the archive was published, so the archive is not opened.
+    The manifest of releases published before is created once.
+    """
+    chart_name = request.args.get('chart')
+    version = request.args.get('version')
+
+    if not chart_name or not version:
+        raise BadRequest('Chart name and version have to be provided.')
+
+    if not is_valid_chart_name(chart_name) or not is_valid_version(version):
+        raise BadRequest('Provided name or version is not valid.')
+
+    release_query = Release.query.join(Release.chart)
+    release_query = release_query.options(db.contains_eager(Release.chart), db.undefer(Release.manifest))
+    release = release_query.filter(Chart.name == chart_name, Release.version == version).first()
+
+    if not release:
+        raise NotFound(f'No release with version \'{version}\' was found.')
+
+    etag = f'{release.digest or release.id}-manifest'
+
+    not_modified = make_not_modified(etag, release.release_date)
+    if not_modified:
+        return not_modified
+
+    if release.manifest is None:
+        release.manifest = read_manifest(release.id).to_dict()
+        db.session.commit()
 
-    response = to_dicts(releases)
-    return jsonify(response)
+    response = jsonify(release.manifest)
+    return set_validators(response, etag, release.release_date)
+
+
+def read_manifest(release_id):
+    """
+    Inspect the stored archive of the release published before
+    the manifests were introduced. The definition is not cached,
+    because it is parsed without the limits of published archives.
+    """
+    file = storage.download(release_id)
+
+    if not file:
+        raise InternalServerError('The release could not be loaded from the server filesystem.')
+
+    with file, SpooledTemporaryFile(CHUNK_SIZE) as archive:
+        shutil.copyfileobj(file, archive, CHUNK_SIZE)
+
+        try:
+            with ZipFile(archive, 'r') as zip_file:
+                return inspect_chart_archive(zip_file, stored_archive_limits)
+        except (BadZipFile, InvalidChartError):
+            raise InternalServerError('The stored archive of the release is not valid.')
 
 
 @main.route('/release/<filename>', methods=['GET'])
@@ -178,34 +847,152 @@ def download_release(filename):
     """
     Download specific release of the chart. The name of the chart
     and version is parsed from the requested filename. The archive
-    is sent in the response body as an attachment.
+    is sent in the response body as an attachment, or the transfer
+    is handed over to the front proxy or the storage if configured so.
     """
     if not is_valid_filename(filename):
         raise BadRequest('The requested release has not got a valid format.')
 
     chart_name, version = parse_archive_filename(filename)
+    release = get_release_info(chart_name, version)
 
-    chart = Chart.query.filter_by(name=chart_name).first()
+    if release.digest:
+        not_modified = make_not_modified(release.digest, release.release_date)
+        if not_modified:
+            return not_modified
 
-    if not chart:
-        raise NotFound(f'No chart called \'{chart_name}\' was found.')
+    file_name = f'{release.get_name()}.zip'
 
-    release = Release.query.filter_by(chart_id=chart.id, version=version).first()
+    if Config.DOWNLOAD_MODE == DownloadMode.REDIRECT:
+        download_url = storage.get_download_url(release.id, file_name)
 
-    if not release:
-        raise NotFound(f'No release with version \'{version}\' was found.')
+        if download_url:
+            count_download(release.size)
+            return redirect(download_url)
 
-    file_data = storage.download(release.id)
+    # the opened archive is not evicted from the local cache until the response
+    # is closed, but the front proxy opens it only after that, so the cached
+    # archives are always sent directly
+    local_file = storage.open_local(release.id)
+    hand_over = Config.DOWNLOAD_MODE != DownloadMode.DIRECT and not storage.evicts_local()
 
-    if not file_data:
-        raise InternalServerError('The release could not be loaded from the server filesystem.')
+    if local_file and hand_over:
+        response = make_proxy_download(local_file.name, file_name)
+        response.call_on_close(local_file.close)
 
-    file_name = f'{release.get_name()}.zip'
+        if release.digest:
+            set_validators(response, release.digest, release.release_date)
+
+        # the range is sent by the front proxy
+        file_size = release.size or os.fstat(local_file.fileno()).st_size
+        content_range = request.range.range_for_length(file_size) if request.range else (0, file_size)
+
+        if content_range:
+            count_download(content_range[1] - content_range[0])
+        return response
+
+    if local_file:
+        file_data = local_file.name
+        file_size = os.fstat(local_file.fileno()).st_size
+    else:
+        file_data = storage.download(release.id)
+
+        if not file_data:
+            # the release could have been deleted by another process after
+            # it was cached, and then it is either not found in the database,
+            # or it was published again with the same version
+            metadata_cache.invalidate(get_release_key(chart_name, version))
+            published = get_release_info(chart_name, version)
+
+            if published.id != release.id:
+                release = published
+                file_data = storage.download(release.id)
+
+            if not file_data:
+                raise InternalServerError('The release could not be loaded from the server filesystem.')
+
+        file_size = release.size
+
+    try:
+        response = send_file(file_data,
+                             mimetype='application/zip',
+                             as_attachment=True,
+                             attachment_filename=file_name,
+                             add_etags=not release.digest)
+
+        if release.digest:
+            set_validators(response, release.digest, release.release_date)
+
+        response = response.make_conditional(request, accept_ranges=True, complete_length=file_size)
+    except Exception:
+        if local_file:
+            local_file.close()
+        raise
+
+    if local_file:
+        response.call_on_close(local_file.close)
+
+    # the length of the whole archive is not set for the file object
+    if response.status_code in [200, 206]:
+        count_download(response.content_length or file_size)
+    return response
+
+
+def count_download(size):
+    if Config.METRICS_ENABLED:
+        record_download(size)
+
+
+def make_proxy_download(file_path, file_name):
+    """
+    Create an empty response instructing the front proxy to send
+    the archive from the filesystem, including handling of ranges.
+    """
+    response = current_app.response_class(mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=file_name)
+
+    if Config.DOWNLOAD_MODE == DownloadMode.X_ACCEL_REDIRECT:
+        relative_path = os.path.relpath(file_path, os.path.abspath(storage.basedir))
+        prefix = Config.DOWNLOAD_ACCEL_PREFIX.rstrip('/')
+        response.headers['X-Accel-Redirect'] = f'{prefix}/{relative_path}'
+    else:
+        response.headers['X-Sendfile'] = file_path
 
-    return send_file(file_data,
-                     mimetype='application/zip',
-                     as_attachment=True,
-                     attachment_filename=file_name)
+    return response
+
+
+@main.route('/index.<index_format>', methods=['GET'])
+def get_index(index_format):
+    """
+    Return the index of all charts and their releases either in the YAML
+    or the JSON format. The index is generated only when the repository
+    changes, and it is sent compressed if the client accepts it.
+    """
+    if index_format not in [IndexFormat.YAML, IndexFormat.JSON]:
+        raise NotFound(f'No index in the \'{index_format}\' format is available.')
+
+    compressed = request.accept_encodings['gzip'] > 0
+
+    repository = get_repository_state()
+    etag = f'{repository.get_etag()}-{index_format}'
+
+    if compressed:
+        etag = f'{etag}-gzip'
+
+    not_modified = make_not_modified(etag, repository.updated_at)
+    if not_modified:
+        return not_modified
+
+    document = get_repository_index().get_document(repository, index_format)
+
+    if compressed:
+        response = current_app.response_class(document.compressed_data, mimetype=document.mimetype)
+        response.content_encoding = 'gzip'
+    else:
+        response = current_app.response_class(document.data, mimetype=document.mimetype)
+
+    response.vary.add('Accept-Encoding')
+    return set_validators(response, etag, repository.updated_at)
 
 
 @main.route('/status', methods=['GET'])
@@ -213,9 +1000,82 @@ def status():
     """
     Return current server status and a number of created charts.
     Useful when need to check the health of the application.
+    The number of charts is maintained, so they are not counted.
     """
-    charts_total = Chart.query.count()
-    return {
+    repository = get_repository_state()
+
+    result = {
         'status': 'ok',
-        'charts': charts_total
+        'charts': repository.charts,
+        'cache': metadata_cache.get_stats()
+    }
+
+    storage_stats = storage.get_stats()
+
+    if storage_stats:
+        result['storage'] = storage_stats
+
+    return result
+
+
+@main.route('/health/live', methods=['GET'])
+def check_liveness():
+    """
+    Return ok if the process is able to handle requests,
+    which does not need any other service to be reachable.
+    """
+    return {'status': 'ok'}
+
+
+@main.route('/health/ready', methods=['GET'])
+def check_readiness():
+    """
+    Check that the database, storage and cache are reachable, so the
+    server is ready to handle requests. The deep check also verifies
+    that the repository can be read and the storage can store data.
+    An unreachable cache is reported, but it does not fail the check.
+    """
+    deep = request.args.get('deep', '').lower() in ['1', 'true']
+
+    def check_database():
+        if deep:
+            get_repository()
+        else:
+            db.session.execute('SELECT 1')
+
+    checks = {
+        'database': check_database,
+        'storage': lambda: storage.check_health(deep),
+        'cache': metadata_cache.check_health
     }
+
+    # the metadata cache falls back to misses when it is not reachable,
+    # so its failure is reported, but the server is still ready
+    optional = ['cache']
+
+    results = {}
+
+    for name, check in checks.items():
+        try:
+            check()
+            results[name] = 'ok'
+        except Exception as e:
+            current_app.logger.warning(f'Readiness check of the {name} failed: {e}')
+            results[name] = 'failed'
+
+    healthy = all(x == 'ok' for name, x in results.items() if name not in optional)
+    result = {'status': 'ok' if healthy else 'failed', 'checks': results}
+
+    return result, 200 if healthy else 503
+
+
+@main.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Return metrics of the requests, SQL queries, storage
+    and validation of archives in the Prometheus format.
+    """
+    if not Config.METRICS_ENABLED:
+        raise NotFound('Metrics are not enabled.')
+
+    return current_app.response_class(registry.render(), mimetype=METRICS_MIMETYPE)
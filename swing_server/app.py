@@ -1,16 +1,45 @@
-from flask import Flask, json
+from flask import Flask, Request, current_app, json
 from flask_session import Session
 from werkzeug import exceptions
 
-from .api import main as main_blueprint
-from .auth import auth as auth_blueprint, login_manager
+from .api import main as main_blueprint, storage
+from .auth import auth as auth_blueprint, login_manager, TokenSessionInterface
 from .config import Config, validate_config
-from .models import db
+from .metrics import init_metrics
+from .migrations import upgrade_schema
+from .models import db, get_repository
 from .errors import InvalidConfigError
 
 session = Session()
 
 
+def get_max_content_length(app, endpoint):
+    """
+    Return the maximal length of requests handled by the endpoint.
+    Bulk uploads of many archives are limited separately.
+    """
+    if endpoint == 'main.publish_releases':
+        return Config.BULK_MAX_CONTENT_LENGTH
+    return app.config['MAX_CONTENT_LENGTH']
+
+
+class UploadRequest(Request):
+    """
+    Request streaming uploaded files directly into the storage,
+    where the digest and size of the files are computed on the fly.
+    Uploads exceeding the maximal length are aborted while streaming,
+    even if the length of the request is not known in advance.
+    """
+    @property
+    def max_content_length(self):
+        return get_max_content_length(current_app, self.endpoint)
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        upload_file = storage.create_upload()
+        upload_file.max_size = self.max_content_length
+        return upload_file
+
+
 def create_app():
     """
     Create Flask application and setup all configurations.
@@ -19,6 +48,7 @@ def create_app():
     place and returned as a JSON object with an error description.
     """
     app = Flask(__name__)
+    app.request_class = UploadRequest
 
     try:
         validate_config()
@@ -32,14 +62,19 @@ def create_app():
     app.config['SESSION_FILE_DIR'] = Config.SESSION_FILE_DIR
     app.config['SECRET_KEY'] = Config.SECRET_KEY
     app.config['SESSION_PERMANENT'] = Config.SESSION_PERMANENT
+    app.config['MAX_CONTENT_LENGTH'] = Config.MAX_CONTENT_LENGTH
 
     db.init_app(app)
     session.init_app(app)
+    app.session_interface = TokenSessionInterface(app.session_interface)
     login_manager.init_app(app)
 
     app.register_blueprint(auth_blueprint)
     app.register_blueprint(main_blueprint)
 
+    if Config.METRICS_ENABLED:
+        init_metrics(app)
+
     @app.errorhandler(exceptions.HTTPException)
     def handle_exception(e):
         response = e.get_response()
@@ -53,4 +88,8 @@ def create_app():
 
     db.create_all(app=app)
 
+    with app.app_context():
+        upgrade_schema(db.engine)
+        get_repository()
+
     return app
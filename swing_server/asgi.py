@@ -0,0 +1,307 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import ClientDisconnected, HTTPException, RequestEntityTooLarge
+from werkzeug.wsgi import FileWrapper
+
+from .app import create_app, get_max_content_length
+from .config import Config
+from .storage import CHUNK_SIZE
+
+
+class AsyncFileWrapper(FileWrapper):
+    """
+    Wrapper of the files sent by the application, which are streamed
+    to the client by the event loop instead of the worker thread.
+    """
+
+
+class AsgiResponse:
+    """
+    Response of the WSGI application, either with the buffered body,
+    or with the file which is going to be streamed asynchronously.
+    """
+    def __init__(self):
+        self.status = 500
+        self.headers = []
+        self.body = []
+        self.file = None
+        self.length = None
+        self.closable = None
+
+    def start_response(self, status, headers, exc_info=None):
+        self.status = int(status.split(' ', 1)[0])
+        self.headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        return self.body.append
+
+
+class AsgiInput(io.RawIOBase):
+    """
+    Body of the request read by the thread handling the request, which
+    receives the messages of the client from the event loop on demand,
+    so the body is streamed to the application without being stored first.
+    Reading fails when the client disconnects, or when the body exceeds
+    the maximal length, even if the length was not declared.
+    """
+    def __init__(self, receive, loop, max_length):
+        self.receive = receive
+        self.loop = loop
+        self.max_length = max_length
+        self.chunk = memoryview(b'')
+        self.length = 0
+        self.more_body = True
+        self.disconnected = False
+
+    def readable(self):
+        return True
+
+    def receive_chunk(self):
+        message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+
+        if message['type'] == 'http.disconnect':
+            self.disconnected = True
+            self.more_body = False
+            raise ClientDisconnected()
+
+        chunk = message.get('body', b'')
+        self.length += len(chunk)
+
+        if self.max_length is not None and self.length > self.max_length:
+            # the rest of the body is not received
+            self.more_body = False
+            raise RequestEntityTooLarge()
+
+        self.chunk = memoryview(chunk)
+        self.more_body = message.get('more_body', False)
+
+    def readinto(self, buffer):
+        while not self.chunk and self.more_body:
+            self.receive_chunk()
+
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+
+def get_file_range(app_iter):
+    """
+    Return the file of the file wrapper, the position of the first byte
+    and the number of bytes to be sent, or none if it is not a file.
+    """
+    if isinstance(app_iter, AsyncFileWrapper):
+        return app_iter.file, None, None
+
+    # ranges of the file are wrapped by the response of werkzeug
+    wrapped = getattr(app_iter, 'iterable', None)
+    if isinstance(wrapped, AsyncFileWrapper) and hasattr(app_iter, 'start_byte'):
+        return wrapped.file, app_iter.start_byte, app_iter.byte_range
+
+    return None
+
+
+def build_environ(scope, body):
+    """
+    Translate the scope of the ASGI connection to the WSGI environment.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': AsyncFileWrapper,
+    }
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+
+    return environ
+
+
+class AsgiApp:
+    """
+    ASGI application serving the Flask application. Archives are sent
+    by the event loop, so slow clients downloading them do not occupy any
+    thread. The handling of the request, including reading of its body
+    and the access to the database, runs in the pool of threads.
+    """
+    def __init__(self, app, max_threads):
+        self.app = app
+        self.max_threads = max_threads
+        self.executor = None
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.max_threads, thread_name_prefix='swing')
+        return self.executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.handle(scope, receive, send)
+        else:
+            raise ValueError(f'Unsupported connection type {scope["type"]}.')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                self.get_executor()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.executor:
+                    self.executor.shutdown(wait=False)
+                    self.executor = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def get_max_length(self, scope):
+        """
+        Return the maximal length of the request handled by the endpoint
+        matching the path of the request, if the length is limited.
+        """
+        adapter = self.app.url_map.bind('localhost')
+
+        try:
+            endpoint, _ = adapter.match(scope['path'], scope['method'])
+        except HTTPException:
+            endpoint = None
+
+        return get_max_content_length(self.app, endpoint)
+
+    def call_app(self, environ, loop, send):
+        """
+        Call the WSGI application. Unless the response is a file, which is
+        streamed later by the event loop, the body is sent by the thread
+        chunk by chunk, so streamed responses are not buffered. Generators
+        of streamed responses can use the context of the request, so all
+        chunks have to be produced by the same thread.
+        """
+        response = AsgiResponse()
+        app_iter = self.app(environ, response.start_response)
+
+        file_range = get_file_range(app_iter)
+
+        if file_range:
+            response.file, start, response.length = file_range
+            response.closable = app_iter
+
+            if start is not None:
+                response.file.seek(start)
+            return response
+
+        def send_message(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        try:
+            send_message({'type': 'http.response.start', 'status': response.status, 'headers': response.headers})
+
+            # every chunk is sent once the next one is known, so bodies
+            # of chunks which are not streamed are sent by a single message
+            pending = b''.join(response.body)
+
+            for chunk in app_iter:
+                if not chunk:
+                    continue
+
+                if pending:
+                    send_message({'type': 'http.response.body', 'body': pending, 'more_body': True})
+                pending = chunk
+
+            send_message({'type': 'http.response.body', 'body': pending})
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+        return None
+
+    async def handle(self, scope, receive, send):
+        loop = asyncio.get_event_loop()
+        executor = self.get_executor()
+
+        max_length = self.get_max_length(scope)
+        environ = build_environ(scope, None)
+        declared_length = environ.get('CONTENT_LENGTH', '')
+
+        if max_length is not None and declared_length.isdigit() and int(declared_length) > max_length:
+            # the declared length is rejected by the application right away
+            body = io.BytesIO()
+        else:
+            body = io.BufferedReader(AsgiInput(receive, loop, max_length), CHUNK_SIZE)
+
+            # the body of unknown length is read until the client ends it
+            if not declared_length:
+                environ['wsgi.input_terminated'] = True
+
+        environ['wsgi.input'] = body
+
+        try:
+            response = await loop.run_in_executor(executor, self.call_app, environ, loop, send)
+        finally:
+            body.close()
+
+        if not response:
+            return
+
+        await send({'type': 'http.response.start', 'status': response.status, 'headers': response.headers})
+
+        try:
+            await self.send_file(loop, executor, response, send)
+        finally:
+            await loop.run_in_executor(executor, response.closable.close)
+
+    async def send_file(self, loop, executor, response, send):
+        """
+        Send the file in chunks, where every chunk is read by the pool
+        of threads, but the client is awaited by the event loop.
+        """
+        remaining = response.length
+
+        while remaining is None or remaining > 0:
+            size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+            chunk = await loop.run_in_executor(executor, response.file.read, size)
+
+            if not chunk:
+                break
+
+            if remaining is not None:
+                remaining -= len(chunk)
+
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+def create_asgi_app(app=None):
+    """
+    Create ASGI application serving the Flask application,
+    which is created unless it is passed as the argument.
+    """
+    return AsgiApp(app or create_app(), Config.ASGI_THREADS)
@@ -1,12 +1,25 @@
+import hashlib
+import hmac
+import os
+
 from flask import Blueprint, request
+from flask.sessions import SecureCookieSession, SessionInterface
 from flask_login import login_user, LoginManager, current_user, logout_user
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 from werkzeug.exceptions import NotFound, BadRequest, Unauthorized, Forbidden
 
+from .cache import MemoryCache
 from .config import Config
-from .models import User, db, make_user
+from .helpers import hash_password, needs_rehash
+from .models import TokenUser, User, db, make_user
 
 login_manager = LoginManager()
 
+# verified credentials are identified by their HMAC using the key
+# generated by every process, so the passwords are never kept in memory
+credential_cache = MemoryCache(1024, Config.CREDENTIAL_CACHE_TTL)
+credential_key = os.urandom(32)
+
 auth = Blueprint('auth', __name__)
 
 
@@ -31,15 +44,93 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 
-@auth.route('/login', methods=['POST'])
-def login():
+def get_token_serializer():
+    return URLSafeTimedSerializer(Config.SECRET_KEY, salt='swing-token')
+
+
+def make_token(user):
     """
-    Make user login using encoded credentials sent in the Authorization
-    header of the request. The user's account has to be activated.
+    Return the token signed by the secret key, which identifies the user.
     """
-    if current_user.is_authenticated:
-        return current_user.to_dict()
+    return get_token_serializer().dumps([user.id, user.email])
+
+
+def is_token_request(request):
+    return request.headers.get('Authorization', '').startswith('Bearer ')
+
+
+@login_manager.request_loader
+def load_token_user(request):
+    """
+    Load the user from the bearer token sent in the Authorization header.
+    The signature and age of the token are verified using the secret key,
+    so the user is authenticated without querying the database.
+    """
+    if not is_token_request(request):
+        return None
+
+    authorization = request.headers['Authorization']
+
+    try:
+        user_id, email = get_token_serializer().loads(authorization[7:].strip(), max_age=Config.TOKEN_TTL)
+    except (BadSignature, ValueError, TypeError):
+        return None
+
+    return TokenUser(user_id, email)
+
+
+class TokenSessionInterface(SessionInterface):
+    """
+    Session interface, which does not load nor store the session of requests
+    authenticated by the bearer token, because server-side sessions would
+    cost a database round trip even if the session is not used.
+    """
+    def __init__(self, interface):
+        self.interface = interface
+
+    def open_session(self, app, request):
+        if is_token_request(request):
+            return SecureCookieSession()
+        return self.interface.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        if is_token_request(request):
+            return
+        self.interface.save_session(app, session, response)
+
+
+def get_credential_key(user, password):
+    message = '\0'.join([str(user.id), user.hashed_password, password])
+    return hmac.new(credential_key, message.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def verify_password(user, password):
+    """
+    Check the password of the user. Successfully verified credentials are
+    cached for a short time, so repeated logins of the same client do not
+    compute the deliberately slow hash again. Changing the password changes
+    the key of the credentials, so the old password is not accepted anymore.
+    """
+    if not Config.CREDENTIAL_CACHE_TTL:
+        return user.check_password(password)
+
+    key = get_credential_key(user, password)
+
+    if credential_cache.get(key):
+        return True
+
+    if not user.check_password(password):
+        return False
+
+    credential_cache.set(key, True)
+    return True
 
+
+def authenticate():
+    """
+    Return the user identified by the encoded credentials sent
+    in the Authorization header of the request.
+    """
     credentials = request.authorization
 
     if not credentials:
@@ -56,17 +147,54 @@ def login():
     if not user:
         raise NotFound(f'No user with email \'{email}\' was found.')
 
-    if not user.check_password(password):
+    if not verify_password(user, password):
         raise Unauthorized('Provided credentials do not match any account.')
 
     if not user.is_active():
         raise Forbidden('The account is not activated, so it could not be logged in.')
 
+    if needs_rehash(user.hashed_password, Config.PASSWORD_HASH_METHOD):
+        user.hashed_password = hash_password(password, Config.PASSWORD_HASH_METHOD)
+        db.session.commit()
+
+    return user
+
+
+@auth.route('/login', methods=['POST'])
+def login():
+    """
+    Make user login using encoded credentials sent in the Authorization
+    header of the request. The user's account has to be activated.
+    """
+    if current_user.is_authenticated:
+        return current_user.to_dict()
+
+    user = authenticate()
     login_user(user)
 
     return user.to_dict()
 
 
+@auth.route('/token', methods=['POST'])
+def create_token():
+    """
+    Create the signed token of the user authenticated either by encoded
+    credentials or by the session. The token is sent in the Authorization
+    header of the requests using the Bearer type, and it expires
+    after its time to live. Tokens can not be renewed by other tokens,
+    so the account is checked again at least once per time to live.
+    """
+    user = current_user._get_current_object()
+
+    if not isinstance(user, User):
+        user = authenticate()
+
+    return {
+        'token': make_token(user),
+        'expiresIn': Config.TOKEN_TTL
+    }
+
+
 @auth.route('/logout', methods=['POST'])
 def logout():
     """
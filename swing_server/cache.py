@@ -0,0 +1,383 @@
+import hashlib
+import hmac
+import os
+import pickle
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+INVALIDATION_CHANNEL = 'invalidate'
+SIGNATURE_SIZE = hashlib.sha256().digest_size
+
+
+class CacheType:
+    MEMORY = 'memory'
+    REDIS = 'redis'
+
+
+class CacheInterface(ABC):
+    """
+    Interface for creating different types of cache for the metadata.
+    Every cache has to implement methods for reading, writing, and deleting
+    the entries. Entries deleted using the invalidate method are removed
+    from the caches of all server processes.
+    """
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        pass
+
+    @abstractmethod
+    def delete(self, *keys):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    @abstractmethod
+    def get_stats(self):
+        pass
+
+    def invalidate(self, *keys):
+        self.delete(*keys)
+
+    def check_health(self):
+        """
+        Raise an exception if the cache is not reachable.
+        """
+        pass
+
+
+class MemoryCache(CacheInterface):
+    """
+    Cache of the metadata kept in the memory of the process. The number
+    of entries is bounded, and the least recently used entries are evicted
+    first. Every entry also expires after its time to live in seconds.
+    """
+    def __init__(self, max_size=1024, ttl=10):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Return the cached value, or none if the key is not cached.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if entry:
+                del self.entries[key]
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl or self.ttl)
+
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.entries)
+        }
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """
+    Connection to the server speaking the Redis protocol.
+    """
+    def __init__(self, host, port, password=None, database=0, timeout=1.0):
+        self.socket = socket.create_connection((host, port), timeout=timeout)
+        self.reader = self.socket.makefile('rb')
+
+        if password:
+            self.execute('AUTH', password)
+
+        if database:
+            self.execute('SELECT', database)
+
+    def send(self, *args):
+        chunks = [f'*{len(args)}\r\n'.encode('ascii')]
+
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            chunks.append(f'${len(arg)}\r\n'.encode('ascii') + arg + b'\r\n')
+
+        self.socket.sendall(b''.join(chunks))
+
+    def read(self):
+        line = self.reader.readline()
+
+        if not line:
+            raise ConnectionError('The connection was closed by the server.')
+
+        kind, value = line[:1], line[1:-2]
+
+        if kind == b'+':
+            return value.decode('utf-8')
+        if kind == b'-':
+            raise RedisError(value.decode('utf-8'))
+        if kind == b':':
+            return int(value)
+        if kind == b'$':
+            if int(value) < 0:
+                return None
+            data = self.reader.read(int(value) + 2)
+            return data[:-2]
+        if kind == b'*':
+            if int(value) < 0:
+                return None
+            return [self.read() for _ in range(int(value))]
+
+        raise RedisError(f'Unknown reply type {kind!r}.')
+
+    def execute(self, *args):
+        self.send(*args)
+        return self.read()
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
+
+
+class RedisCache(CacheInterface):
+    """
+    Cache of the metadata shared by all server processes using a server
+    speaking the Redis protocol. Recently used entries are also kept in
+    the memory of the process, and they are dropped in all processes
+    when a process invalidates them. If the server is not available,
+    then the cache behaves as if it was empty. The entries are signed
+    using the secret key, so only the entries stored by the server
+    processes are unpickled.
+    """
+    def __init__(self, url, secret_key, max_size=1024, ttl=10, prefix='swing:'):
+        parsed = urlparse(url)
+
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.database = int(parsed.path.strip('/') or 0)
+        self.prefix = prefix
+        self.ttl = ttl
+        self.secret_key = secret_key.encode('utf-8')
+
+        self.local_cache = MemoryCache(max_size, ttl)
+        self.connections = []
+        self.lock = threading.Lock()
+        self.listener_pid = None
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def connect(self):
+        return RedisConnection(self.host, self.port, self.password, self.database)
+
+    def execute(self, *args):
+        """
+        Execute the command using an idle connection from the pool.
+        If the idle connection was closed meanwhile, then open a new one.
+        """
+        with self.lock:
+            connection = self.connections.pop() if self.connections else None
+
+        try:
+            try:
+                result = connection.execute(*args) if connection else None
+            except OSError:
+                connection.close()
+                connection = None
+
+            if connection is None:
+                connection = self.connect()
+                result = connection.execute(*args)
+        except RedisError:
+            self.errors += 1
+            if connection:
+                self.release(connection)
+            raise
+        except OSError:
+            self.errors += 1
+            if connection:
+                connection.close()
+            raise
+
+        self.release(connection)
+        return result
+
+    def release(self, connection):
+        with self.lock:
+            self.connections.append(connection)
+
+    def listen(self):
+        """
+        Receive the invalidation messages of other processes
+        and drop the invalidated entries from the local cache.
+        """
+        while True:
+            try:
+                connection = self.connect()
+                connection.socket.settimeout(None)
+                connection.execute('SUBSCRIBE', self.prefix + INVALIDATION_CHANNEL)
+                self.local_cache.clear()
+
+                while True:
+                    message = connection.read()
+                    if message and message[0] == b'message':
+                        keys = message[2].decode('utf-8').split('\n')
+                        self.local_cache.delete(*keys)
+            except (OSError, RedisError):
+                self.errors += 1
+                self.local_cache.clear()
+                time.sleep(1)
+
+    def start_listener(self):
+        """
+        Start the listener thread once in every process,
+        because the threads do not survive forking of the workers.
+        """
+        pid = os.getpid()
+
+        if self.listener_pid != pid:
+            with self.lock:
+                if self.listener_pid != pid:
+                    self.connections = []
+                    self.listener_pid = pid
+                    threading.Thread(target=self.listen, daemon=True).start()
+
+    def sign(self, key, data):
+        """
+        Return the signature of the entry, which includes its key,
+        so the signed entries can not be swapped.
+        """
+        return hmac.new(self.secret_key, key.encode('utf-8') + b'\0' + data, hashlib.sha256).digest()
+
+    def dumps(self, key, value):
+        data = pickle.dumps(value)
+        return self.sign(key, data) + data
+
+    def loads(self, key, payload):
+        """
+        Unpickle the entry, or return none if its signature is not valid.
+        """
+        signature, data = payload[:SIGNATURE_SIZE], payload[SIGNATURE_SIZE:]
+
+        if not hmac.compare_digest(signature, self.sign(key, data)):
+            return None
+
+        return pickle.loads(data)
+
+    def get(self, key):
+        self.start_listener()
+
+        value = self.local_cache.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        try:
+            data = self.execute('GET', self.prefix + key)
+        except (OSError, RedisError):
+            data = None
+
+        value = self.loads(key, data) if data is not None else None
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.local_cache.set(key, value)
+
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.start_listener()
+        self.local_cache.set(key, value, ttl)
+
+        ttl_ms = int((ttl or self.ttl) * 1000)
+
+        try:
+            self.execute('SET', self.prefix + key, self.dumps(key, value), 'PX', ttl_ms)
+        except (OSError, RedisError):
+            pass
+
+    def delete(self, *keys):
+        self.local_cache.delete(*keys)
+
+        if not keys:
+            return
+
+        try:
+            self.execute('DEL', *[self.prefix + x for x in keys])
+        except (OSError, RedisError):
+            pass
+
+    def check_health(self):
+        self.execute('PING')
+
+    def invalidate(self, *keys):
+        self.delete(*keys)
+
+        try:
+            self.execute('PUBLISH', self.prefix + INVALIDATION_CHANNEL, '\n'.join(keys))
+        except (OSError, RedisError):
+            pass
+
+    def clear(self):
+        self.local_cache.clear()
+
+        try:
+            cursor = '0'
+            while True:
+                cursor, keys = self.execute('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 1000)
+                if keys:
+                    self.execute('DEL', *keys)
+                if cursor in (b'0', '0'):
+                    break
+        except (OSError, RedisError):
+            pass
+
+    def get_stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': self.local_cache.get_stats()['size'],
+            'errors': self.errors
+        }
@@ -1,18 +1,200 @@
+import hashlib
+import zlib
+from functools import lru_cache
+
 import yaml
 
 from .errors import InvalidChartError
 from .helpers import is_valid_version, is_valid_chart_name
 
+# the parser of libyaml is used if PyYAML is built with it
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def get_list(json, key):
+    """
+    Return the list of the definition, which is empty if it is missing.
+    """
+    value = json.get(key)
+
+    if value is None:
+        return []
+
+    if not isinstance(value, list):
+        raise InvalidChartError(f'The {key} of the chart definition have not a valid format.')
+
+    return value
+
+
+def get_dicts(json, key):
+    values = get_list(json, key)
+
+    if not all(isinstance(x, dict) for x in values):
+        raise InvalidChartError(f'The {key} of the chart definition have not a valid format.')
+
+    return values
+
+
+def get_string(json, key):
+    value = json.get(key)
+    return None if value is None else str(value)
+
+
+class Maintainer:
+    __slots__ = ('name', 'email', 'url')
+
+    def __init__(self, name, email=None, url=None):
+        self.name = name
+        self.email = email
+        self.url = url
+
+    @classmethod
+    def from_dict(cls, json):
+        return cls(get_string(json, 'name'), get_string(json, 'email'), get_string(json, 'url'))
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'email': self.email,
+            'url': self.url
+        }
+
+
+class Dependency:
+    __slots__ = ('name', 'version', 'repository', 'condition')
+
+    def __init__(self, name, version=None, repository=None, condition=None):
+        self.name = name
+        self.version = version
+        self.repository = repository
+        self.condition = condition
+
+    @classmethod
+    def from_dict(cls, json):
+        return cls(get_string(json, 'name'), get_string(json, 'version'),
+                   get_string(json, 'repository'), get_string(json, 'condition'))
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'version': self.version,
+            'repository': self.repository,
+            'condition': self.condition
+        }
+
 
 class ChartDefinition:
-    def __init__(self, name, version, description):
+    """
+    Definition of the chart read from its manifest. The instances
+    do not have any dictionary of attributes, and their lists are kept
+    as tuples, so thousands of them can be kept in the memory cheaply.
+    """
+    __slots__ = ('name', 'version', 'description', 'app_version', 'keywords', 'maintainers', 'dependencies',
+                 'digest')
+
+    def __init__(self, name, version, description, app_version=None, keywords=(), maintainers=(), dependencies=(),
+                 digest=None):
         self.name = name
         self.version = version
         self.description = description
+        self.app_version = app_version
+        self.keywords = tuple(keywords)
+        self.maintainers = tuple(maintainers)
+        self.dependencies = tuple(dependencies)
+        self.digest = digest
 
     @classmethod
-    def from_dict(cls, json):
-        return cls(json.get('name'), json.get('version'), json.get('description'))
+    def from_dict(cls, json, digest=None):
+        return cls(json.get('name'),
+                   json.get('version'),
+                   json.get('description'),
+                   get_string(json, 'appVersion'),
+                   [str(x) for x in get_list(json, 'keywords')],
+                   [Maintainer.from_dict(x) for x in get_dicts(json, 'maintainers')],
+                   [Dependency.from_dict(x) for x in get_dicts(json, 'dependencies')],
+                   digest)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'version': self.version,
+            'description': self.description,
+            'appVersion': self.app_version,
+            'keywords': list(self.keywords),
+            'maintainers': [x.to_dict() for x in self.maintainers],
+            'dependencies': [x.to_dict() for x in self.dependencies],
+            'digest': self.digest
+        }
+
+
+class ArchiveLimits:
+    """
+    Limits of the uploaded archives, which protect the server against
+    archives expanding to huge files or definitions expensive to parse.
+    """
+    def __init__(self, max_entries=1000, max_entry_size=10 * 1024 * 1024, max_size=50 * 1024 * 1024,
+                 max_definition_nodes=1000, max_definition_depth=20, max_definition_size=64 * 1024):
+        self.max_entries = max_entries
+        self.max_entry_size = max_entry_size
+        self.max_size = max_size
+        self.max_definition_nodes = max_definition_nodes
+        self.max_definition_depth = max_definition_depth
+        self.max_definition_size = max_definition_size
+
+
+class ArchivedFile:
+    __slots__ = ('name', 'size', 'compressed_size')
+
+    def __init__(self, name, size, compressed_size):
+        self.name = name
+        self.size = size
+        self.compressed_size = compressed_size
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'size': self.size,
+            'compressedSize': self.compressed_size
+        }
+
+
+class ArchiveManifest:
+    """
+    Manifest of the archived chart, which describes its definition
+    and files, so the archive does not have to be opened again.
+    """
+    __slots__ = ('definition', 'files', 'values_digest', 'deployment_digest')
+
+    def __init__(self, definition, files, values_digest, deployment_digest):
+        self.definition = definition
+        self.files = tuple(files)
+        self.values_digest = values_digest
+        self.deployment_digest = deployment_digest
+
+    @property
+    def size(self):
+        return sum(x.size for x in self.files)
+
+    @property
+    def compressed_size(self):
+        return sum(x.compressed_size for x in self.files)
+
+    @property
+    def compression_ratio(self):
+        if not self.compressed_size:
+            return None
+        return round(self.size / self.compressed_size, 2)
+
+    def to_dict(self):
+        return {
+            'definition': self.definition.to_dict(),
+            'files': [x.to_dict() for x in self.files],
+            'size': self.size,
+            'compressedSize': self.compressed_size,
+            'compressionRatio': self.compression_ratio,
+            'valuesDigest': self.values_digest,
+            'deploymentDigest': self.deployment_digest
+        }
 
 
 def validate_chart_definition(definition):
@@ -26,12 +208,24 @@ def validate_chart_definition(definition):
     if not definition.version:
         raise InvalidChartError('The release version can not be empty.')
 
+    if not isinstance(definition.name, str):
+        raise InvalidChartError('Chart name has to be a string.')
+
+    if not isinstance(definition.version, str):
+        raise InvalidChartError('The release version has to be a string.')
+
     if not is_valid_chart_name(definition.name):
         raise InvalidChartError('Chart name has not a valid format.')
 
     if not is_valid_version(definition.version):
         raise InvalidChartError('The release version has not a valid format.')
 
+    if not all(x.name for x in definition.maintainers):
+        raise InvalidChartError('Maintainers of the chart have to be named.')
+
+    if not all(x.name for x in definition.dependencies):
+        raise InvalidChartError('Dependencies of the chart have to be named.')
+
 
 def validate_archive_files(files):
     """
@@ -52,28 +246,214 @@ def validate_archive_files(files):
         raise InvalidChartError('Recursive requirements are not currently supported.')
 
 
-def read_definition(zip_archive) -> ChartDefinition:
+def find_file(files, names):
+    return next((x for x in names if x in files), None)
+
+
+def read_member(zip_archive, name):
     """
-    Read the definition file from the archived chart.
+    Read the archived file. Errors of the decompression of corrupted
+    or unsupported data are raised as errors of the chart.
     """
-    zip_content = zip_archive.namelist()
+    try:
+        return zip_archive.read(name)
+    except (zlib.error, EOFError, NotImplementedError):
+        raise InvalidChartError(f'The archived file {name} can not be decompressed.')
+
 
-    if 'chart.yaml' in zip_content:
-        chart_yaml = zip_archive.read('chart.yaml')
+def get_member_digest(zip_archive, name):
+    sha256 = hashlib.sha256()
+
+    try:
+        with zip_archive.open(name) as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                sha256.update(chunk)
+    except (zlib.error, EOFError, NotImplementedError):
+        raise InvalidChartError(f'The archived file {name} can not be decompressed.')
+
+    return sha256.hexdigest()
+
+
+def validate_archive_limits(members, limits):
+    """
+    Check the number and sizes of the archived files declared in the
+    directory of the archive. The files can not be extracted to more bytes
+    than declared, so the archive does not have to be decompressed first.
+    """
+    if len(members) > limits.max_entries:
+        raise InvalidChartError(f'The archive can not contain more than {limits.max_entries} files.')
+
+    total_size = 0
+
+    for member in members:
+        if member.file_size > limits.max_entry_size:
+            raise InvalidChartError(f'The archived file {member.filename} exceeds the maximal size.')
+
+        total_size += member.file_size
+
+        if total_size > limits.max_size:
+            raise InvalidChartError('The extracted archive exceeds the maximal size.')
+
+
+def measure_node(node, depth, limits, weights, active):
+    """
+    Return the number of nodes of the YAML document after its aliases are
+    expanded, which is computed without expanding them. Raise an error
+    if the document is too large, too deeply nested or recursive.
+    """
+    if depth > limits.max_definition_depth:
+        raise InvalidChartError('Chart definition file is nested too deeply.')
+
+    key = id(node)
+
+    if key in weights:
+        return weights[key]
+
+    if key in active:
+        raise InvalidChartError('Chart definition file can not contain recursive aliases.')
+
+    active.add(key)
+
+    if isinstance(node, yaml.SequenceNode):
+        children = node.value
+    elif isinstance(node, yaml.MappingNode):
+        children = [x for pair in node.value for x in pair]
     else:
-        chart_yaml = zip_archive.read('chart.yml')
+        children = []
 
-    definition_dict = yaml.safe_load(chart_yaml)
-    definition = ChartDefinition.from_dict(definition_dict)
+    weight = 1
 
-    return definition
+    for child in children:
+        weight += measure_node(child, depth + 1, limits, weights, active)
+
+        if weight > limits.max_definition_nodes:
+            raise InvalidChartError('Chart definition file is too complex.')
+
+    active.discard(key)
+    weights[key] = weight
+
+    return weight
+
+
+class DefinitionComposer(yaml.composer.Composer):
+    """
+    Composer checking the nesting depth and the number of nodes of the
+    definition before every node is composed. Nodes are composed recursively,
+    so deeply nested documents could overflow the stack of the process.
+    The composer takes precedence over the one of libyaml, so the events
+    of the parser are checked while the document is composed.
+    """
+    def compose_node(self, parent, index):
+        self.nodes += 1
+
+        if self.depth + 1 > self.limits.max_definition_depth:
+            raise InvalidChartError('Chart definition file is nested too deeply.')
+
+        if self.nodes > self.limits.max_definition_nodes:
+            raise InvalidChartError('Chart definition file is too complex.')
+
+        self.depth += 1
+
+        try:
+            return super().compose_node(parent, index)
+        finally:
+            self.depth -= 1
 
 
-def validate_chart_archive(zip_archive):
+@lru_cache(maxsize=None)
+def get_definition_loader(loader):
     """
-    Make validation of both the files and the chart definition.
+    Return the loader class parsing by the loader,
+    and composing by the definition composer.
     """
-    validate_archive_files(zip_archive.namelist())
+    def __init__(self, stream, limits):
+        loader.__init__(self, stream)
+        yaml.composer.Composer.__init__(self)
+        self.limits = limits
+        self.depth = 0
+        self.nodes = 0
 
-    definition = read_definition(zip_archive)
+    return type('DefinitionLoader', (DefinitionComposer, loader), {'__init__': __init__})
+
+
+def load_definition(data, limits):
+    """
+    Parse the chart definition file in a single pass. The document is
+    composed with the limits checked, and it is constructed only if it
+    does not exceed the limits with its aliases expanded.
+    """
+    loader = get_definition_loader(SafeLoader)(data, limits)
+
+    try:
+        node = loader.get_single_node()
+
+        if node is None:
+            return None
+
+        measure_node(node, 1, limits, {}, set())
+        return loader.construct_document(node)
+    except yaml.YAMLError:
+        raise InvalidChartError('Chart definition file is not a valid YAML document.')
+    except RecursionError:
+        raise InvalidChartError('Chart definition file is nested too deeply.')
+    finally:
+        loader.dispose()
+
+
+def parse_definition(data, limits, definition_cache=None) -> ChartDefinition:
+    """
+    Parse and validate the chart definition file. Valid definitions are
+    cached under the digest of the file, so the same definition uploaded
+    again, or read from the stored archive, is not parsed again.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    key = None
+
+    if definition_cache is not None:
+        key = f'definition:{digest}'
+        definition = definition_cache.get(key)
+
+        if definition is not None:
+            return definition
+
+    definition_dict = load_definition(data, limits)
+
+    if not isinstance(definition_dict, dict):
+        raise InvalidChartError('Chart definition file has not a valid format.')
+
+    definition = ChartDefinition.from_dict(definition_dict, digest)
     validate_chart_definition(definition)
+
+    if key:
+        definition_cache.set(key, definition)
+
+    return definition
+
+
+def inspect_chart_archive(zip_archive, limits=None, definition_cache=None) -> ArchiveManifest:
+    """
+    Validate the archived chart and return its manifest. The directory
+    of the archive is scanned only once, and the definition is parsed once.
+    """
+    limits = limits or ArchiveLimits()
+    infolist = [x for x in zip_archive.infolist() if not x.is_dir()]
+    validate_archive_limits(infolist, limits)
+
+    members = {x.filename: x for x in infolist}
+    validate_archive_files(members)
+
+    definition_file = find_file(members, ['chart.yaml', 'chart.yml'])
+
+    # the file can not be extracted to more bytes than declared
+    if members[definition_file].file_size > limits.max_definition_size:
+        raise InvalidChartError('Chart definition file exceeds the maximal size.')
+
+    data = read_member(zip_archive, definition_file)
+    definition = parse_definition(data, limits, definition_cache)
+
+    files = [ArchivedFile(x.filename, x.file_size, x.compress_size) for x in members.values()]
+    values_digest = get_member_digest(zip_archive, find_file(members, ['values.yaml', 'values.yml']))
+    deployment_digest = get_member_digest(zip_archive, find_file(members, ['deployment.yaml', 'deployment.yml']))
+
+    return ArchiveManifest(definition, files, values_digest, deployment_digest)
+
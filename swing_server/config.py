@@ -2,8 +2,9 @@ from os import environ, path
 
 from dotenv import load_dotenv
 
-from .helpers import create_directory
-from .storage import StorageType
+from .helpers import create_directory, hash_password
+from .cache import CacheType
+from .storage import StorageType, DownloadMode
 from .errors import InvalidConfigError
 
 basedir = path.abspath(path.dirname(__file__))
@@ -13,9 +14,40 @@ load_dotenv(path.join(basedir, '.env'))
 class Config:
     SECRET_KEY = environ.get('SECRET_KEY')
     DATABASE_URI = environ.get('DATABASE_URI')
+    PASSWORD_HASH_METHOD = environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:150000')
+    CREDENTIAL_CACHE_TTL = int(environ.get('CREDENTIAL_CACHE_TTL', 300))
+    TOKEN_TTL = int(environ.get('TOKEN_TTL', 24 * 60 * 60))
     PUBLIC_URL = environ.get('PUBLIC_URL', 'http://localhost:5000')
+    MAX_CONTENT_LENGTH = int(environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+    BULK_MAX_CONTENT_LENGTH = int(environ.get('BULK_MAX_CONTENT_LENGTH', 256 * 1024 * 1024))
+    BULK_MAX_ARCHIVES = int(environ.get('BULK_MAX_ARCHIVES', 100))
+    BULK_MAX_MEMBERS = int(environ.get('BULK_MAX_MEMBERS', 1000))
+    BULK_THREADS = int(environ.get('BULK_THREADS', 4))
+    ARCHIVE_MAX_ENTRIES = int(environ.get('ARCHIVE_MAX_ENTRIES', 1000))
+    ARCHIVE_MAX_ENTRY_SIZE = int(environ.get('ARCHIVE_MAX_ENTRY_SIZE', 10 * 1024 * 1024))
+    ARCHIVE_MAX_SIZE = int(environ.get('ARCHIVE_MAX_SIZE', 50 * 1024 * 1024))
+    DEFINITION_MAX_NODES = int(environ.get('DEFINITION_MAX_NODES', 1000))
+    DEFINITION_MAX_DEPTH = int(environ.get('DEFINITION_MAX_DEPTH', 20))
+    DEFINITION_MAX_SIZE = int(environ.get('DEFINITION_MAX_SIZE', 64 * 1024))
+    DEFINITION_CACHE_SIZE = int(environ.get('DEFINITION_CACHE_SIZE', 256))
     STORAGE_TYPE = environ.get('STORAGE_TYPE', StorageType.LOCAL)
     STORAGE_LOCAL_DIR = environ.get('STORAGE_LOCAL_DIR')
+    STORAGE_S3_ENDPOINT = environ.get('STORAGE_S3_ENDPOINT', 'https://s3.amazonaws.com')
+    STORAGE_S3_REGION = environ.get('STORAGE_S3_REGION', 'us-east-1')
+    STORAGE_S3_BUCKET = environ.get('STORAGE_S3_BUCKET')
+    STORAGE_S3_ACCESS_KEY = environ.get('STORAGE_S3_ACCESS_KEY')
+    STORAGE_S3_SECRET_KEY = environ.get('STORAGE_S3_SECRET_KEY')
+    STORAGE_S3_PREFIX = environ.get('STORAGE_S3_PREFIX', '')
+    STORAGE_CACHE_DIR = environ.get('STORAGE_CACHE_DIR')
+    STORAGE_CACHE_SIZE = int(environ.get('STORAGE_CACHE_SIZE', 1024 * 1024 * 1024))
+    DOWNLOAD_MODE = environ.get('DOWNLOAD_MODE', DownloadMode.DIRECT)
+    DOWNLOAD_ACCEL_PREFIX = environ.get('DOWNLOAD_ACCEL_PREFIX', '/archives')
+    CACHE_TYPE = environ.get('CACHE_TYPE', CacheType.MEMORY)
+    CACHE_REDIS_URL = environ.get('CACHE_REDIS_URL')
+    CACHE_SIZE = int(environ.get('CACHE_SIZE', 1024))
+    CACHE_TTL = int(environ.get('CACHE_TTL', 10))
+    METRICS_ENABLED = (environ.get('METRICS_ENABLED', 'True') == 'True')
+    ASGI_THREADS = int(environ.get('ASGI_THREADS', 16))
     INIT_USER_EMAIL = environ.get('INIT_USER_EMAIL')
     INIT_USER_PASSWORD = environ.get('INIT_USER_PASSWORD')
     SESSION_TYPE = environ.get('SESSION_TYPE', 'sqlalchemy')
@@ -33,10 +65,10 @@ def validate_config():
     if not Config.DATABASE_URI:
         raise InvalidConfigError('Database URI can not be empty.')
 
-    if Config.STORAGE_TYPE not in [StorageType.LOCAL]:
+    if Config.STORAGE_TYPE not in [StorageType.LOCAL, StorageType.CONTENT, StorageType.S3]:
         raise InvalidConfigError('Requested storage type is not valid.')
 
-    if Config.STORAGE_TYPE == StorageType.LOCAL:
+    if Config.STORAGE_TYPE in [StorageType.LOCAL, StorageType.CONTENT]:
         if not Config.STORAGE_LOCAL_DIR:
             raise InvalidConfigError('Local storage directory can not be empty.')
 
@@ -45,6 +77,36 @@ def validate_config():
         except OSError as e:
             raise InvalidConfigError('Local storage directory could not be created.')
 
+    if Config.STORAGE_TYPE == StorageType.S3:
+        if not Config.STORAGE_S3_BUCKET:
+            raise InvalidConfigError('S3 bucket can not be empty.')
+
+        if not Config.STORAGE_S3_ACCESS_KEY or not Config.STORAGE_S3_SECRET_KEY:
+            raise InvalidConfigError('S3 access key and secret key can not be empty.')
+
+    if Config.STORAGE_CACHE_DIR:
+        try:
+            create_directory(Config.STORAGE_CACHE_DIR)
+        except OSError as e:
+            raise InvalidConfigError('Storage cache directory could not be created.')
+
+    download_modes = [DownloadMode.DIRECT, DownloadMode.X_SENDFILE, DownloadMode.X_ACCEL_REDIRECT, DownloadMode.REDIRECT]
+
+    if Config.DOWNLOAD_MODE not in download_modes:
+        raise InvalidConfigError('Requested download mode is not valid.')
+
+    if Config.DOWNLOAD_MODE == DownloadMode.REDIRECT and Config.STORAGE_TYPE != StorageType.S3:
+        raise InvalidConfigError('Redirected downloads are supported only by the S3 storage.')
+
+    if Config.CACHE_TYPE not in [CacheType.MEMORY, CacheType.REDIS]:
+        raise InvalidConfigError('Requested cache type is not valid.')
+
+    if Config.CACHE_TYPE == CacheType.REDIS and not Config.CACHE_REDIS_URL:
+        raise InvalidConfigError('Redis URL of the cache can not be empty.')
+
+    if Config.BULK_THREADS < 1:
+        raise InvalidConfigError('Number of threads validating bulk uploads has to be positive.')
+
     if Config.SESSION_TYPE == 'filesystem':
         if not Config.SESSION_FILE_DIR:
             raise InvalidConfigError('Directory for the session files can not be empty.')
@@ -54,5 +116,10 @@ def validate_config():
         except OSError as e:
             raise InvalidConfigError('Directory for the session files could not be created.')
 
+    try:
+        hash_password('', Config.PASSWORD_HASH_METHOD)
+    except (ValueError, TypeError):
+        raise InvalidConfigError('Requested password hash method is not valid.')
+
     if Config.INIT_USER_EMAIL and not Config.INIT_USER_PASSWORD:
         raise InvalidConfigError('Initial user password can not be empty.')
@@ -1,7 +1,9 @@
+import base64
+import json
 import os
 import re
 
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
 
 version_regex = r'^\d+(?:\.\d+)+$'
 name_regex = r'^[a-z]+(?:-[a-z]+)*$'
@@ -24,20 +26,54 @@ def is_readable_dir(path: str) -> bool:
     return os.path.isdir(path) and os.access(path, os.R_OK)
 
 
+def make_version_key(version) -> str:
+    """
+    Convert the release version into a key, which is sorted
+    lexicographically in the same order as the versions semantically.
+    Every number is prefixed by the count of its digits.
+    """
+    numbers = [str(int(x)) for x in version.split('.')]
+    return '.'.join(f'{len(x):02d}{x}' for x in numbers)
+
+
 def to_dicts(arr):
     return [x.to_dict() for x in arr]
 
 
+def encode_cursor(values) -> str:
+    """
+    Encode the values of the last listed item into an opaque cursor.
+    """
+    data = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """
+    Decode the values of the last listed item from the cursor.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Provided cursor is not valid.')
+
+    if not isinstance(values, list):
+        raise ValueError('Provided cursor is not valid.')
+
+    return values
+
+
 def create_directory(path: str):
     if not os.path.exists(path):
         os.makedirs(path)
 
 
-def hash_password(password: str) -> str:
+def hash_password(password: str, method: str = 'pbkdf2:sha256') -> str:
     """
     Create a hash of the password using randomly generated salt.
     """
-    return generate_password_hash(password, salt_length=12)
+    return generate_password_hash(password, method=method, salt_length=12)
 
 
 def check_password(password: str, hashed_password: str) -> bool:
@@ -47,6 +83,17 @@ def check_password(password: str, hashed_password: str) -> bool:
     return check_password_hash(hashed_password, password)
 
 
+def needs_rehash(hashed_password: str, method: str) -> bool:
+    """
+    Check if the password was hashed using other method or parameters
+    than requested, so it should be hashed again when it is known.
+    """
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        method = f'{method}:{DEFAULT_PBKDF2_ITERATIONS}'
+
+    return hashed_password.split('$', 1)[0] != method
+
+
 def parse_archive_filename(filename):
     """
     Read the filename of the requested archive and return
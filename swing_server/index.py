@@ -0,0 +1,163 @@
+import gzip
+import threading
+
+import yaml
+from flask import current_app, json
+
+from .models import Chart, Release, db
+
+
+class IndexFormat:
+    YAML = 'yaml'
+    JSON = 'json'
+
+
+def make_entry(release, chart, definition=None):
+    created = release.release_date.replace(microsecond=0).isoformat() + 'Z'
+    entry = {
+        'name': chart.name,
+        'version': release.version,
+        'description': chart.description,
+        'digest': release.digest,
+        'created': created,
+        'archiveUrl': release.to_dict()['archiveUrl']
+    }
+
+    # fields of the definition are known only for releases with the manifest
+    definition = definition or {}
+
+    for key in ['appVersion', 'keywords', 'maintainers', 'dependencies']:
+        if definition.get(key):
+            entry[key] = definition[key]
+
+    return entry
+
+
+class IndexDocument:
+    """
+    Serialized index document, which is kept both in the plain
+    and the compressed form, so it can be sent without any processing.
+    """
+    def __init__(self, data, mimetype):
+        self.data = data
+        self.compressed_data = gzip.compress(data)
+        self.mimetype = mimetype
+
+
+class RepositoryIndex:
+    """
+    Index of all charts in the repository and their releases. Entries
+    of the charts are kept serialized, so when a single chart is changed,
+    then only its entries are loaded and serialized again. The index
+    is rebuilt from scratch when the repository was changed elsewhere.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.revision = None
+        self.updated_at = None
+        self.fragments = {}
+        self.documents = {}
+
+    @staticmethod
+    def make_fragments(entries):
+        """
+        Serialize entries of the single chart into both formats.
+        """
+        name = entries[0]['name']
+        yaml_fragment = yaml.safe_dump({name: entries}, sort_keys=False, default_flow_style=False)
+        yaml_fragment = ''.join(f'  {x}' for x in yaml_fragment.splitlines(True))
+        json_fragment = f'{json.dumps(name)}:{json.dumps(entries)}'
+        return {IndexFormat.YAML: yaml_fragment, IndexFormat.JSON: json_fragment}
+
+    def load_entries(self, chart_names=None):
+        """
+        Load entries of all charts, or of the given charts, where
+        releases are ordered from the latest version. Only the definition
+        is selected from the manifest, without the list of archived files.
+        """
+        release_query = db.session.query(Release, Chart, Release.manifest['definition']).join(Release.chart)
+        release_query = release_query.order_by(Chart.name.asc(), Release.version_key.desc())
+
+        if chart_names:
+            release_query = release_query.filter(Chart.name.in_(chart_names))
+
+        entries = {}
+
+        for release, chart, definition in release_query:
+            entries.setdefault(chart.name, []).append(make_entry(release, chart, definition))
+
+        return entries
+
+    def rebuild(self, repository):
+        entries = self.load_entries()
+        self.fragments = {x: self.make_fragments(y) for x, y in entries.items()}
+        self.set_revision(repository)
+
+    def set_revision(self, repository):
+        self.revision = repository.revision
+        self.updated_at = repository.updated_at
+        self.documents = {}
+
+    def update_charts(self, chart_names, repository):
+        """
+        Update entries of the charts changed by a single revision. It has to
+        be called after the change is committed with the current state
+        of the repository.
+        """
+        with self.lock:
+            if self.revision is None or repository.revision != self.revision + 1:
+                self.revision = None
+                return
+
+            entries = self.load_entries(chart_names)
+
+            for chart_name in chart_names:
+                if entries.get(chart_name):
+                    self.fragments[chart_name] = self.make_fragments(entries[chart_name])
+                else:
+                    self.fragments.pop(chart_name, None)
+
+            self.set_revision(repository)
+
+    def serialize(self, index_format):
+        generated = self.updated_at.replace(microsecond=0).isoformat() + 'Z'
+        names = sorted(self.fragments)
+
+        if index_format == IndexFormat.JSON:
+            entries = ','.join(self.fragments[x][IndexFormat.JSON] for x in names)
+            data = f'{{"apiVersion":"v1","entries":{{{entries}}},"generated":"{generated}"}}'
+            return IndexDocument(data.encode('utf-8'), 'application/json')
+
+        entries = ''.join(self.fragments[x][IndexFormat.YAML] for x in names)
+        entries = f'entries:\n{entries}' if entries else 'entries: {}\n'
+        data = f'apiVersion: v1\n{entries}generated: \'{generated}\'\n'
+        return IndexDocument(data.encode('utf-8'), 'application/x-yaml')
+
+    def get_document(self, repository, index_format):
+        """
+        Return the serialized index document matching the current
+        revision of the repository.
+        """
+        with self.lock:
+            if self.revision != repository.revision:
+                self.rebuild(repository)
+
+            document = self.documents.get(index_format)
+
+            if not document:
+                document = self.serialize(index_format)
+                self.documents[index_format] = document
+
+            return document
+
+
+def get_repository_index():
+    """
+    Return the repository index of the current application.
+    """
+    index = current_app.extensions.get('swing_index')
+
+    if index is None:
+        index = current_app.extensions['swing_index'] = RepositoryIndex()
+
+    return index
@@ -0,0 +1,291 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .storage import StorageInterface
+
+METRICS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=''):
+    labels = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def format_value(value):
+    if isinstance(value, float) and value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonically increasing value, such as the number of requests,
+    which is kept separately for every combination of the labels.
+    """
+    type = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+    def collect(self):
+        with self.lock:
+            values = sorted(self.values.items())
+
+        for labels, value in values:
+            yield f'{self.name}{format_labels(self.labels, labels)} {format_value(value)}'
+
+
+class Histogram:
+    """
+    Distribution of observed values, such as durations of requests,
+    counted in the cumulative buckets given by their upper bounds.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+
+        with self.lock:
+            entry = self.values.get(labels)
+
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def get_count(self, *labels):
+        entry = self.values.get(labels)
+        return entry[2] if entry else 0
+
+    def collect(self):
+        with self.lock:
+            values = sorted((labels, (list(entry[0]), entry[1], entry[2])) for labels, entry in self.values.items())
+
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+
+            for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket
+                bucket_labels = format_labels(self.labels, labels, f'le="{format_value(float(bound))}"')
+                yield f'{self.name}_bucket{bucket_labels} {cumulative}'
+
+            yield f'{self.name}_sum{format_labels(self.labels, labels)} {format_value(total)}'
+            yield f'{self.name}_count{format_labels(self.labels, labels)} {count}'
+
+
+class MetricsRegistry:
+    """
+    Registry of the metrics of the process,
+    which are rendered in the Prometheus text format.
+    """
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, description, labels=()):
+        metric = Counter(name, description, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, description, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.collect())
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    'swing_http_request_duration_seconds',
+    'Duration of handling of the requests until the response is returned.',
+    ('endpoint', 'method'))
+requests_total = registry.counter(
+    'swing_http_requests_total',
+    'Number of handled requests by their status code.',
+    ('endpoint', 'method', 'status'))
+db_queries_total = registry.counter(
+    'swing_db_queries_total',
+    'Number of executed SQL queries.',
+    ('endpoint',))
+db_query_seconds = registry.counter(
+    'swing_db_query_seconds_total',
+    'Time spent by executing SQL queries.',
+    ('endpoint',))
+storage_duration = registry.histogram(
+    'swing_storage_operation_duration_seconds',
+    'Duration of the operations of the storage.',
+    ('operation',))
+storage_bytes = registry.counter(
+    'swing_storage_bytes_total',
+    'Number of bytes of archives uploaded to the storage and downloaded by clients.',
+    ('operation',))
+validation_duration = registry.histogram(
+    'swing_chart_validation_duration_seconds',
+    'Duration of the validation of uploaded archives.')
+
+
+def get_endpoint():
+    """
+    Return the endpoint handling the current request, which keeps
+    the number of label values bounded unlike the requested path.
+    """
+    if has_request_context():
+        return request.endpoint or 'none'
+    return 'none'
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('swing_query_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info['swing_query_start'].pop()
+    endpoint = get_endpoint()
+
+    db_queries_total.inc(endpoint)
+    db_query_seconds.inc(endpoint, amount=time.perf_counter() - started_at)
+
+
+def handle_error(context):
+    if context.connection is not None and context.connection.info.get('swing_query_start'):
+        context.connection.info['swing_query_start'].pop()
+
+
+def start_request():
+    g.metrics_start = time.perf_counter()
+
+
+def finish_request(response):
+    started_at = g.pop('metrics_start', None)
+
+    if started_at is not None:
+        endpoint = get_endpoint()
+        request_duration.observe(time.perf_counter() - started_at, endpoint, request.method)
+        requests_total.inc(endpoint, request.method, str(response.status_code))
+
+    return response
+
+
+def init_metrics(app):
+    """
+    Measure the requests handled by the application and the SQL
+    queries executed by all engines, unless they are already measured.
+    """
+    app.before_request(start_request)
+    app.after_request(finish_request)
+
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(Engine, 'handle_error', handle_error)
+
+
+def record_download(size):
+    """
+    Count the bytes of the archive sent to the client, whichever way
+    the download is served, including the proxy and the redirect.
+    """
+    if size:
+        storage_bytes.inc('download', amount=size)
+
+
+class MeteredStorage(StorageInterface):
+    """
+    Storage measuring the duration of the operations
+    and the number of bytes of the wrapped storage.
+    """
+    def __init__(self, storage):
+        self.storage = storage
+
+    def measure(self, operation, method, *args):
+        started_at = time.perf_counter()
+
+        try:
+            return method(*args)
+        finally:
+            storage_duration.observe(time.perf_counter() - started_at, operation)
+
+    def create_upload(self):
+        return self.storage.create_upload()
+
+    def upload(self, release_id, file):
+        self.measure('upload', self.storage.upload, release_id, file)
+
+        size = getattr(getattr(file, 'stream', file), 'size', None)
+        if size is not None:
+            storage_bytes.inc('upload', amount=size)
+
+    def download(self, release_id):
+        return self.measure('download', self.storage.download, release_id)
+
+    def delete(self, release_id):
+        self.measure('delete', self.storage.delete, release_id)
+
+    def file_exists(self, release_id):
+        return self.measure('exists', self.storage.file_exists, release_id)
+
+    def get_local_path(self, release_id):
+        return self.measure('local_path', self.storage.get_local_path, release_id)
+
+    def open_local(self, release_id):
+        return self.measure('local_path', self.storage.open_local, release_id)
+
+    def evicts_local(self):
+        return self.storage.evicts_local()
+
+    def get_size(self, release_id):
+        return self.measure('size', self.storage.get_size, release_id)
+
+    def get_download_url(self, release_id, file_name):
+        return self.measure('download_url', self.storage.get_download_url, release_id, file_name)
+
+    def get_stats(self):
+        return self.storage.get_stats()
+
+    def check_health(self, deep=False):
+        self.storage.check_health(deep)
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
@@ -0,0 +1,104 @@
+from sqlalchemy import inspect, text
+
+from .helpers import make_version_key
+from .models import db
+from .search import create_search_index
+
+# key of the advisory lock serializing the upgrades of all processes
+SCHEMA_LOCK_KEY = 0x7377696e67
+
+
+def lock_schema(connection):
+    """
+    Wait until the schema is not upgraded by any other process. The lock
+    is released at the end of the transaction. Other databases than
+    PostgreSQL are expected to be used by a single server process.
+    """
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': SCHEMA_LOCK_KEY})
+
+
+def add_missing_columns(connection, table):
+    """
+    Add columns of the model, which are missing in the existing table.
+    The columns are added as nullable, so they can be filled afterwards.
+    """
+    existing = {x['name'] for x in inspect(connection).get_columns(table.name)}
+    added = []
+
+    for column in table.columns:
+        if column.name in existing:
+            continue
+
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        added.append(column.name)
+
+    return added
+
+
+def add_missing_indexes(connection, table):
+    """
+    Create indexes of the model, which are missing in the existing table.
+    """
+    existing = {x['name'] for x in inspect(connection).get_indexes(table.name)}
+
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(bind=connection)
+
+
+def fill_version_keys(connection):
+    """
+    Compute the sortable key for releases created before it was introduced.
+    """
+    rows = connection.execute(text('SELECT id, version FROM releases WHERE version_key IS NULL')).fetchall()
+
+    for release_id, version in rows:
+        connection.execute(
+            text('UPDATE releases SET version_key = :version_key WHERE id = :id'),
+            {'version_key': make_version_key(version), 'id': release_id})
+
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('ALTER TABLE releases ALTER COLUMN version_key SET NOT NULL'))
+
+
+def fill_chart_count(connection):
+    """
+    Count the charts created before the number was maintained.
+    """
+    connection.execute(text('UPDATE repository SET charts = (SELECT COUNT(*) FROM charts)'))
+
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('ALTER TABLE repository ALTER COLUMN charts SET NOT NULL'))
+
+
+def upgrade_schema(engine):
+    """
+    Upgrade the schema of an existing database to match the models.
+    Missing tables are created by SQLAlchemy, but the columns, indexes
+    and constraints introduced later have to be added here. Creating
+    the unique index fails if the database contains duplicate releases.
+    The schema is inspected only after the upgrades of other processes
+    starting concurrently are finished.
+    """
+    with engine.begin() as connection:
+        lock_schema(connection)
+        tables = inspect(connection).get_table_names()
+
+        for table in db.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+
+            added = add_missing_columns(connection, table)
+
+            if table.name == 'releases' and 'version_key' in added:
+                fill_version_keys(connection)
+
+            if table.name == 'repository' and 'charts' in added:
+                fill_chart_count(connection)
+
+            add_missing_indexes(connection, table)
+
+        if connection.dialect.name == 'postgresql':
+            create_search_index(connection)
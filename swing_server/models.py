@@ -2,15 +2,16 @@ from datetime import datetime
 
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 
 from .config import Config
-from .helpers import check_password, hash_password
+from .helpers import check_password, hash_password, make_version_key
 
 db = SQLAlchemy()
 
 
 def make_user(email, password):
-    password = hash_password(password)
+    password = hash_password(password, Config.PASSWORD_HASH_METHOD)
     user = User(
         email=email,
         hashed_password=password,
@@ -18,6 +19,41 @@ def make_user(email, password):
     return user
 
 
+def get_repository():
+    """
+    Return the state of the repository, which is created
+    when it does not exist yet. If the repository is created
+    by another process meanwhile, then that one is returned.
+    """
+    repository = Repository.query.get(Repository.ID)
+
+    if not repository:
+        repository = Repository(id=Repository.ID, revision=0, charts=Chart.query.count(), updated_at=datetime.utcnow())
+        db.session.add(repository)
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            repository = Repository.query.get(Repository.ID)
+
+    return repository
+
+
+def touch_repository(charts=0):
+    """
+    Increment the revision of the repository within the current
+    transaction. It has to be called whenever charts or releases change,
+    together with the number of created or removed charts, so the number
+    of charts is maintained without counting them.
+    """
+    Repository.query.filter_by(id=Repository.ID).update({
+        Repository.revision: Repository.revision + 1,
+        Repository.charts: Repository.charts + charts,
+        Repository.updated_at: datetime.utcnow()
+    }, synchronize_session=False)
+
+
 class User(UserMixin, db.Model):
     """
     Model of the user, where the user can log in to
@@ -45,6 +81,24 @@ class User(UserMixin, db.Model):
         }
 
 
+class TokenUser(UserMixin):
+    """
+    User authenticated by the signed token, which is not loaded
+    from the database, because the token carries its identity.
+    """
+    def __init__(self, user_id, email):
+        self.id = user_id
+        self.email = email
+
+    def get_id(self):
+        return self.id
+
+    def to_dict(self):
+        return {
+            'email': self.email
+        }
+
+
 class Chart(db.Model):
     """
     Model of the chart, where every chart is uniquely
@@ -71,17 +125,34 @@ class Release(db.Model):
     is uniquely identified by its version.
     """
     __tablename__ = 'releases'
+    __table_args__ = (
+        db.Index('ix_releases_chart_id_version', 'chart_id', 'version', unique=True),
+        db.Index('ix_releases_chart_id_version_key', 'chart_id', 'version_key'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     chart_id = db.Column(db.Integer, db.ForeignKey('charts.id'), nullable=False)
     version = db.Column(db.String, nullable=False)
+    version_key = db.Column(db.String, nullable=False)
     notes = db.Column(db.Text, nullable=True)
+    digest = db.Column(db.String(64), nullable=True)
+    size = db.Column(db.BigInteger, nullable=True)
+    # the manifest lists all archived files, so it is loaded only when requested
+    manifest = db.deferred(db.Column(db.JSON, nullable=True))
     release_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     chart = db.relationship('Chart', backref=db.backref('releases', lazy=True))
 
+    @db.validates('version')
+    def validate_version(self, key, version):
+        self.version_key = make_version_key(version)
+        return version
+
     def get_name(self):
         return f'{self.chart.name}-{self.version}'
 
+    def get_info(self):
+        return ReleaseInfo(self.id, self.get_name(), self.digest, self.size, self.release_date)
+
     def to_dict(self):
         return {
             'version': self.version,
@@ -89,3 +160,54 @@ class Release(db.Model):
             'notes': self.notes,
             'archiveUrl': f'{Config.PUBLIC_URL}/release/{self.get_name()}.zip'
         }
+
+
+class Repository(db.Model):
+    """
+    Model of the repository state, where the revision is incremented
+    with every change, so clients can cheaply check for updates.
+    """
+    __tablename__ = 'repository'
+
+    ID = 1
+
+    id = db.Column(db.Integer, primary_key=True)
+    revision = db.Column(db.BigInteger, nullable=False, default=0)
+    charts = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def get_etag(self):
+        return f'r{self.revision}'
+
+    def get_state(self):
+        return RepositoryState(self.revision, self.updated_at, self.charts)
+
+
+class RepositoryState:
+    """
+    State of the repository detached from the database session,
+    so it can be kept in the cache between requests.
+    """
+    def __init__(self, revision, updated_at, charts):
+        self.revision = revision
+        self.updated_at = updated_at
+        self.charts = charts
+
+    def get_etag(self):
+        return f'r{self.revision}'
+
+
+class ReleaseInfo:
+    """
+    Metadata of the release needed for its download, which are
+    detached from the database session, so they can be cached.
+    """
+    def __init__(self, release_id, name, digest, size, release_date):
+        self.id = release_id
+        self.name = name
+        self.digest = digest
+        self.size = size
+        self.release_date = release_date
+
+    def get_name(self):
+        return self.name
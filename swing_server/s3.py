@@ -0,0 +1,216 @@
+import hashlib
+import hmac
+import http.client
+from datetime import datetime
+from urllib.parse import quote, urlparse
+from xml.etree import ElementTree
+
+EMPTY_HASH = hashlib.sha256(b'').hexdigest()
+UNSIGNED_PAYLOAD = 'UNSIGNED-PAYLOAD'
+ALGORITHM = 'AWS4-HMAC-SHA256'
+
+
+class S3Error(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        self.message = f'S3 request failed with status {status}: {message}'
+        super().__init__(self.message)
+
+
+def hmac_sha256(key, message):
+    return hmac.new(key, message.encode('utf-8'), hashlib.sha256).digest()
+
+
+def canonical_query(params):
+    return '&'.join(f'{quote(k, safe="-_.~")}={quote(str(v), safe="-_.~")}' for k, v in sorted(params.items()))
+
+
+class S3Object:
+    """
+    Body of the downloaded object, which is read directly from the connection.
+    """
+    def __init__(self, connection, response):
+        self.connection = connection
+        self.response = response
+        self.size = int(response.getheader('Content-Length', 0))
+
+    def read(self, size=-1):
+        return self.response.read(None if size is None or size < 0 else size)
+
+    def close(self):
+        self.response.close()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class S3Client:
+    """
+    Client of the storage compatible with the S3 API. Requests are signed
+    using the AWS Signature Version 4, and objects are addressed using
+    the path style, which is supported also by MinIO and similar servers.
+    """
+    def __init__(self, endpoint_url, bucket, access_key, secret_key, region='us-east-1', timeout=60):
+        self.endpoint = urlparse(endpoint_url)
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.timeout = timeout
+
+    def get_url(self, key):
+        path = self.endpoint.path.rstrip('/')
+        return f'{self.endpoint.scheme}://{self.endpoint.netloc}{path}/{self.bucket}/{quote(key, safe="/~")}'
+
+    def get_scope(self, now):
+        return f'{now:%Y%m%d}/{self.region}/s3/aws4_request'
+
+    def get_signature(self, now, canonical_request):
+        string_to_sign = '\n'.join([
+            ALGORITHM,
+            f'{now:%Y%m%dT%H%M%SZ}',
+            self.get_scope(now),
+            hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+        ])
+
+        key = hmac_sha256(f'AWS4{self.secret_key}'.encode('utf-8'), f'{now:%Y%m%d}')
+        for value in [self.region, 's3', 'aws4_request']:
+            key = hmac_sha256(key, value)
+
+        return hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def sign_headers(self, method, url, params, headers, payload_hash, now=None):
+        """
+        Return the headers of the request including the Authorization header.
+        """
+        now = now or datetime.utcnow()
+        parsed = urlparse(url)
+
+        headers = {k.lower(): str(v).strip() for k, v in headers.items()}
+        headers['host'] = parsed.netloc
+        headers['x-amz-content-sha256'] = payload_hash
+        headers['x-amz-date'] = f'{now:%Y%m%dT%H%M%SZ}'
+
+        signed_headers = ';'.join(sorted(headers))
+        canonical_request = '\n'.join([
+            method,
+            parsed.path or '/',
+            canonical_query(params),
+            ''.join(f'{k}:{headers[k]}\n' for k in sorted(headers)),
+            signed_headers,
+            payload_hash
+        ])
+
+        signature = self.get_signature(now, canonical_request)
+        headers['authorization'] = (f'{ALGORITHM} Credential={self.access_key}/{self.get_scope(now)}, '
+                                    f'SignedHeaders={signed_headers}, Signature={signature}')
+        return headers
+
+    def presign(self, method, url, expires, params=None, now=None):
+        """
+        Return the address allowing anyone to make the request until it expires.
+        """
+        now = now or datetime.utcnow()
+        parsed = urlparse(url)
+
+        params = dict(params or {})
+        params.update({
+            'X-Amz-Algorithm': ALGORITHM,
+            'X-Amz-Credential': f'{self.access_key}/{self.get_scope(now)}',
+            'X-Amz-Date': f'{now:%Y%m%dT%H%M%SZ}',
+            'X-Amz-Expires': str(expires),
+            'X-Amz-SignedHeaders': 'host'
+        })
+
+        canonical_request = '\n'.join([
+            method,
+            parsed.path or '/',
+            canonical_query(params),
+            f'host:{parsed.netloc}\n',
+            'host',
+            UNSIGNED_PAYLOAD
+        ])
+
+        params['X-Amz-Signature'] = self.get_signature(now, canonical_request)
+        return f'{url}?{canonical_query(params)}'
+
+    def request(self, method, key, params=None, body=b'', headers=None, stream=False):
+        """
+        Send the signed request and return the response. If the response
+        is streamed, then the caller is responsible for closing it.
+        """
+        params = params or {}
+        url = self.get_url(key)
+        payload_hash = hashlib.sha256(body).hexdigest() if body else EMPTY_HASH
+        headers = self.sign_headers(method, url, params, headers or {}, payload_hash)
+
+        connection_class = http.client.HTTPSConnection if self.endpoint.scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(self.endpoint.netloc, timeout=self.timeout)
+
+        path = urlparse(url).path
+        if params:
+            path = f'{path}?{canonical_query(params)}'
+
+        try:
+            connection.request(method, path, body=body or None, headers=headers)
+            response = connection.getresponse()
+        except Exception:
+            connection.close()
+            raise
+
+        if stream and response.status == 200:
+            return S3Object(connection, response)
+
+        data = response.read()
+        connection.close()
+
+        if response.status >= 300 and not (method in ['GET', 'HEAD'] and response.status == 404):
+            raise S3Error(response.status, data.decode('utf-8', 'replace'))
+
+        return response, data
+
+    def put_object(self, key, data):
+        self.request('PUT', key, body=data)
+
+    def get_object(self, key):
+        result = self.request('GET', key, stream=True)
+        return result if isinstance(result, S3Object) else None
+
+    def head_bucket(self):
+        response, _ = self.request('HEAD', '')
+        return response.status == 200
+
+    def head_object(self, key):
+        response, _ = self.request('HEAD', key)
+        return response.status == 200
+
+    def get_object_size(self, key):
+        response, _ = self.request('HEAD', key)
+        if response.status != 200:
+            return None
+        return int(response.getheader('Content-Length'))
+
+    def delete_object(self, key):
+        self.request('DELETE', key)
+
+    def create_multipart_upload(self, key):
+        _, data = self.request('POST', key, params={'uploads': ''})
+        root = ElementTree.fromstring(data)
+        return next(x.text for x in root.iter() if x.tag.endswith('UploadId'))
+
+    def upload_part(self, key, upload_id, part_number, data):
+        response, _ = self.request('PUT', key, params={'partNumber': part_number, 'uploadId': upload_id}, body=data)
+        return response.getheader('ETag')
+
+    def complete_multipart_upload(self, key, upload_id, etags):
+        parts = ''.join(f'<Part><PartNumber>{i}</PartNumber><ETag>{x}</ETag></Part>'
+                        for i, x in enumerate(etags, start=1))
+        body = f'<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>'.encode('utf-8')
+        self.request('POST', key, params={'uploadId': upload_id}, body=body)
+
+    def abort_multipart_upload(self, key, upload_id):
+        self.request('DELETE', key, params={'uploadId': upload_id})
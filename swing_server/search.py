@@ -0,0 +1,173 @@
+import re
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+
+from flask import current_app
+from sqlalchemy import func, literal_column, text
+
+from .models import Chart, db
+
+token_regex = re.compile(r'\w+')
+
+NAME_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+
+# maximal number of charts loaded by a single query,
+# which keeps the number of bound parameters limited
+LOAD_BATCH_SIZE = 500
+
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+SEARCH_INDEX = (
+    "CREATE INDEX IF NOT EXISTS ix_charts_search ON charts USING GIN (("
+    "setweight(to_tsvector('simple'::regconfig, name), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, coalesce(description, '')), 'B')))"
+)
+
+
+def tokenize(value):
+    """
+    Split the text into lowercase words.
+    """
+    if not value:
+        return []
+    return token_regex.findall(value.lower())
+
+
+def create_search_index(connection):
+    """
+    Create the GIN index of chart names and descriptions in PostgreSQL.
+    """
+    connection.execute(text(SEARCH_INDEX))
+
+
+class SearchEngine(ABC):
+    """
+    Interface for searching the charts. Every word of the query has to match
+    a prefix of some word in the name or description of the chart, and
+    the charts are ranked higher when the words match their names.
+    Only the charts of the page given by the offset and limit are loaded.
+    """
+    @abstractmethod
+    def search(self, query, revision, offset=0, limit=None):
+        pass
+
+
+class PostgresSearch(SearchEngine):
+    """
+    Search the charts using the full-text search of PostgreSQL,
+    which is backed by the GIN index of the weighted text vectors.
+    """
+    @staticmethod
+    def get_vector():
+        name_vector = func.setweight(func.to_tsvector(SEARCH_CONFIG, Chart.name), literal_column("'A'"))
+        description = func.coalesce(Chart.description, literal_column("''"))
+        description_vector = func.setweight(func.to_tsvector(SEARCH_CONFIG, description), literal_column("'B'"))
+        return name_vector.op('||')(description_vector)
+
+    def search(self, query, revision, offset=0, limit=None):
+        tokens = tokenize(query)
+
+        if not tokens:
+            return []
+
+        ts_query = func.to_tsquery(SEARCH_CONFIG, ' & '.join(f'{x}:*' for x in tokens))
+        vector = self.get_vector()
+
+        chart_query = Chart.query.filter(vector.op('@@')(ts_query))
+        chart_query = chart_query.order_by(func.ts_rank(vector, ts_query).desc(), Chart.name.asc())
+
+        return chart_query.offset(offset).limit(limit).all()
+
+
+class InvertedIndexSearch(SearchEngine):
+    """
+    Search the charts using an inverted index kept in memory, which is
+    used for databases without full-text search. The index is rebuilt
+    when the revision of the repository changes.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+
+    def build(self, revision):
+        """
+        Create the index mapping every word to the charts including it.
+        """
+        postings = {}
+        names = {}
+
+        for chart_id, name, description in db.session.query(Chart.id, Chart.name, Chart.description):
+            names[chart_id] = name
+
+            for weight, value in [(NAME_WEIGHT, name), (DESCRIPTION_WEIGHT, description)]:
+                for token in tokenize(value):
+                    charts = postings.setdefault(token, {})
+                    charts[chart_id] = max(charts.get(chart_id, 0), weight)
+
+        return revision, sorted(postings), postings, names
+
+    def get_index(self, revision):
+        index = self.index
+
+        if index is None or index[0] != revision:
+            with self.lock:
+                if self.index is None or self.index[0] != revision:
+                    self.index = self.build(revision)
+                index = self.index
+
+        return index
+
+    def search(self, query, revision, offset=0, limit=None):
+        tokens = tokenize(query)
+
+        if not tokens:
+            return []
+
+        _, terms, postings, names = self.get_index(revision)
+        scores = None
+
+        for token in tokens:
+            token_scores = {}
+
+            position = bisect_left(terms, token)
+            while position < len(terms) and terms[position].startswith(token):
+                for chart_id, weight in postings[terms[position]].items():
+                    token_scores[chart_id] = max(token_scores.get(chart_id, 0), weight)
+                position += 1
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {x: scores[x] + token_scores[x] for x in scores if x in token_scores}
+
+            if not scores:
+                return []
+
+        chart_ids = sorted(scores, key=lambda x: (-scores[x], names[x]))
+        chart_ids = chart_ids[offset:offset + limit if limit else None]
+        charts = {}
+
+        for start in range(0, len(chart_ids), LOAD_BATCH_SIZE):
+            batch = chart_ids[start:start + LOAD_BATCH_SIZE]
+            charts.update((x.id, x) for x in Chart.query.filter(Chart.id.in_(batch)))
+
+        return [charts[x] for x in chart_ids if x in charts]
+
+
+def get_search_engine():
+    """
+    Return the search engine of the current application, which
+    is selected according to the type of the database.
+    """
+    engine = current_app.extensions.get('swing_search')
+
+    if engine is None:
+        if db.engine.dialect.name == 'postgresql':
+            engine = PostgresSearch()
+        else:
+            engine = InvertedIndexSearch()
+
+        current_app.extensions['swing_search'] = engine
+
+    return engine
@@ -1,9 +1,143 @@
+import fcntl
+import hashlib
 import os
+import shutil
+import tempfile
+import threading
+import uuid
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from .s3 import S3Error
+
+CHUNK_SIZE = 64 * 1024
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
 
 
 class StorageType:
     LOCAL = 'local'
+    CONTENT = 'content'
+    S3 = 's3'
+
+
+class DownloadMode:
+    DIRECT = 'direct'
+    X_SENDFILE = 'x-sendfile'
+    X_ACCEL_REDIRECT = 'x-accel-redirect'
+    REDIRECT = 'redirect'
+
+
+class UploadFile:
+    """
+    Temporary file receiving the uploaded archive. The SHA-256 digest
+    and the size of the archive are computed while the data are written,
+    so the data have to be written sequentially. If the file is closed
+    without being committed, then it is removed from the filesystem.
+    """
+    def __init__(self, directory=None, max_size=None):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.upload')
+        self.file = os.fdopen(fd, 'w+b')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.max_size = max_size
+        self.committed = False
+
+    @property
+    def digest(self):
+        return self.sha256.hexdigest()
+
+    def write(self, data):
+        """
+        Write the next chunk of the archive. If the archive exceeds its
+        maximal size, then the upload is aborted and the file is removed.
+        """
+        self.size += len(data)
+
+        if self.max_size is not None and self.size > self.max_size:
+            self.close()
+            raise RequestEntityTooLarge('The uploaded archive exceeds the maximal size.')
+
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def commit(self, path):
+        """
+        Atomically move the file to its final destination.
+        """
+        self.file.close()
+        os.replace(self.path, path)
+        self.committed = True
+
+    def in_directory(self, directory):
+        """
+        Check if the file was created in the directory, even if
+        the directory is relative to the working directory.
+        """
+        return os.path.dirname(self.path) == os.path.abspath(directory)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+        if not self.committed and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def get_upload_file(file):
+    """
+    Return the upload file backing the uploaded archive, if any.
+    """
+    stream = getattr(file, 'stream', file)
+    if isinstance(stream, UploadFile):
+        return stream
+    return None
+
+
+def lock_file(path, operation):
+    """
+    Open the file and lock it using the operation of flock. Return none
+    if the file does not exist, if it is locked by another file and the lock
+    is not blocking, or if the file was removed before it was locked.
+    """
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+
+    try:
+        fcntl.flock(file.fileno(), operation)
+
+        if os.fstat(file.fileno()).st_ino != os.stat(path).st_ino:
+            raise FileNotFoundError(path)
+    except (BlockingIOError, FileNotFoundError):
+        file.close()
+        return None
+
+    return file
+
+
+def check_directory(path, deep=False):
+    """
+    Check that the directory is writable, and if the check is deep,
+    that a file can be written to it and read back.
+    """
+    if not os.path.isdir(path) or not os.access(path, os.W_OK | os.X_OK):
+        raise OSError(f'Directory {path} is not writable.')
+
+    if deep:
+        with tempfile.TemporaryFile(dir=path) as f:
+            f.write(b'health')
+            f.seek(0)
+            if f.read() != b'health':
+                raise OSError(f'Directory {path} returned corrupted data.')
 
 
 class StorageInterface(ABC):
@@ -12,6 +146,69 @@ class StorageInterface(ABC):
     charts. Every storage has to implement at least four methods for uploading,
     downloading, deleting, and checking the existence of the archives.
     """
+    def create_upload(self):
+        """
+        Create a temporary file receiving the uploaded archive.
+        """
+        return UploadFile()
+
+    def get_local_path(self, release_id):
+        """
+        Return the path to the archive in the local filesystem,
+        or none if the storage does not keep archives locally.
+        """
+        return None
+
+    def open_local(self, release_id):
+        """
+        Open the archive in the local filesystem, or return none if the
+        storage does not keep archives locally. The archive is not evicted
+        from the path of the file until the file is closed.
+        """
+        path = self.get_local_path(release_id)
+
+        if path:
+            try:
+                return open(path, 'rb')
+            except FileNotFoundError:
+                pass
+        return None
+
+    def evicts_local(self):
+        """
+        Return whether the archives in the local filesystem can be removed
+        by the storage, once they are closed. Such archives can not be handed
+        over to the front proxy, which opens them after the response is sent.
+        """
+        return False
+
+    def get_size(self, release_id):
+        """
+        Return the size of the stored archive in bytes,
+        or none if it is not known without downloading it.
+        """
+        return None
+
+    def get_download_url(self, release_id, file_name):
+        """
+        Return the temporary address, where the archive can be downloaded
+        directly from, or none if the storage does not support it.
+        """
+        return None
+
+    def get_stats(self):
+        """
+        Return the statistics of the storage, or none if it has not any.
+        """
+        return None
+
+    def check_health(self, deep=False):
+        """
+        Raise an exception if the storage is not reachable. The deep check
+        also verifies that the data can be written and read back.
+        """
+        pass
+
     @abstractmethod
     def upload(self, release_id, data):
         pass
@@ -33,6 +230,17 @@ class LocalStorage(StorageInterface):
     def __init__(self, basedir):
         self.basedir = basedir
 
+    @property
+    def temp_dir(self):
+        return os.path.join(self.basedir, 'tmp')
+
+    def create_upload(self):
+        """
+        Create the temporary file in the storage directory, so it
+        can be moved to its final destination without copying.
+        """
+        return UploadFile(self.temp_dir)
+
     def get_file_path(self, release_id):
         """
         Get the ID of the release and return the path to the archive.
@@ -41,11 +249,15 @@ class LocalStorage(StorageInterface):
 
     def upload(self, release_id, file):
         """
-        If there is not any release with the same ID, then store
-        the archive in the filesystem.
+        Store the archive in the filesystem. The archive left by
+        a deleted release with the same ID is replaced.
         """
-        if not self.file_exists(release_id):
-            path = self.get_file_path(release_id)
+        path = self.get_file_path(release_id)
+        upload_file = get_upload_file(file)
+
+        if upload_file and upload_file.in_directory(self.temp_dir):
+            upload_file.commit(path)
+        else:
             file.seek(0)
             file.save(path)
 
@@ -73,3 +285,556 @@ class LocalStorage(StorageInterface):
         """
         path = self.get_file_path(release_id)
         return os.path.isfile(path)
+
+    def get_local_path(self, release_id):
+        if self.file_exists(release_id):
+            return os.path.abspath(self.get_file_path(release_id))
+        return None
+
+    def get_size(self, release_id):
+        try:
+            return os.path.getsize(self.get_file_path(release_id))
+        except FileNotFoundError:
+            return None
+
+    def check_health(self, deep=False):
+        check_directory(self.basedir, deep)
+
+
+class ContentStorage(StorageInterface):
+    """
+    Content-addressed storage, where every archive is stored only once
+    under its SHA-256 digest. Releases reference the stored blobs using
+    hard links, so the link count of the blob is the number of releases
+    using it. Both blobs and references are sharded into subdirectories.
+    """
+    def __init__(self, basedir):
+        self.basedir = basedir
+
+    @property
+    def objects_dir(self):
+        return os.path.join(self.basedir, 'objects')
+
+    @property
+    def refs_dir(self):
+        return os.path.join(self.basedir, 'refs')
+
+    @property
+    def temp_dir(self):
+        return os.path.join(self.basedir, 'tmp')
+
+    def get_object_path(self, digest):
+        """
+        Get the SHA-256 digest of the archive and return the path to the blob.
+        """
+        return os.path.join(self.objects_dir, digest[:2], digest[2:4], f'{digest}.zip')
+
+    def get_file_path(self, release_id):
+        """
+        Get the ID of the release and return the path to the reference.
+        """
+        shard = f'{int(release_id) % 256:02x}'
+        return os.path.join(self.refs_dir, shard, f'{release_id}.zip')
+
+    def get_digest_path(self, release_id):
+        return self.get_file_path(release_id)[:-4] + '.sha256'
+
+    def get_digest(self, release_id):
+        """
+        Return the SHA-256 digest of the archive referenced by the release.
+        """
+        try:
+            with open(self.get_digest_path(release_id), 'r') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def reference_count(self, digest):
+        """
+        Return the number of releases referencing the blob.
+        """
+        try:
+            return os.stat(self.get_object_path(digest)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def create_upload(self):
+        return UploadFile(self.temp_dir)
+
+    def upload(self, release_id, file):
+        """
+        Store the archive as a blob unless a blob with the same
+        content already exists, and link the release to it.
+        """
+        if self.file_exists(release_id):
+            return
+
+        upload_file = get_upload_file(file)
+
+        if not upload_file or not upload_file.in_directory(self.temp_dir):
+            upload_file = self.create_upload()
+            file.seek(0)
+            shutil.copyfileobj(file, upload_file, CHUNK_SIZE)
+
+        upload_file.file.close()
+
+        digest = upload_file.digest
+        temp_path = upload_file.path
+
+        object_path = self.get_object_path(digest)
+        ref_path = self.get_file_path(release_id)
+
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+
+        try:
+            # the blob can vanish between both links when its last
+            # reference is deleted concurrently, so try it again
+            for _ in range(3):
+                try:
+                    os.link(temp_path, object_path)
+                except FileExistsError:
+                    pass
+
+                try:
+                    os.link(object_path, ref_path)
+                    break
+                except FileNotFoundError:
+                    continue
+            else:
+                shutil.copyfile(temp_path, ref_path)
+        finally:
+            upload_file.close()
+
+        with open(self.get_digest_path(release_id), 'w') as f:
+            f.write(digest)
+
+    def download(self, release_id):
+        """
+        Load archive from the filesystem using release ID.
+        """
+        if self.file_exists(release_id):
+            path = self.get_file_path(release_id)
+            file = open(path, 'rb')
+            return file
+        return None
+
+    def delete(self, release_id):
+        """
+        Delete the release reference and remove the blob
+        if no other release references it anymore.
+        """
+        ref_path = self.get_file_path(release_id)
+
+        try:
+            ref_stat = os.stat(ref_path)
+        except FileNotFoundError:
+            return
+
+        digest = self.get_digest(release_id)
+
+        os.remove(ref_path)
+
+        if os.path.isfile(self.get_digest_path(release_id)):
+            os.remove(self.get_digest_path(release_id))
+
+        if not digest:
+            return
+
+        object_path = self.get_object_path(digest)
+
+        try:
+            object_stat = os.stat(object_path)
+        except FileNotFoundError:
+            return
+
+        if object_stat.st_ino == ref_stat.st_ino and object_stat.st_nlink == 1:
+            os.remove(object_path)
+
+    def file_exists(self, release_id):
+        """
+        Check if the archive with the release ID is already stored.
+        """
+        path = self.get_file_path(release_id)
+        return os.path.isfile(path)
+
+    def get_local_path(self, release_id):
+        if self.file_exists(release_id):
+            return os.path.abspath(self.get_file_path(release_id))
+        return None
+
+    def get_size(self, release_id):
+        try:
+            return os.path.getsize(self.get_file_path(release_id))
+        except FileNotFoundError:
+            return None
+
+    def check_health(self, deep=False):
+        check_directory(self.basedir, deep)
+
+
+class S3Storage(StorageInterface):
+    """
+    Storage keeping the archives in a bucket of the storage compatible
+    with the S3 API. Large archives are uploaded in multiple parts,
+    and clients can be redirected to download the archives directly.
+    """
+    def __init__(self, client, prefix='', part_size=MULTIPART_PART_SIZE, url_expires=300):
+        self.client = client
+        self.prefix = prefix
+        self.part_size = part_size
+        self.url_expires = url_expires
+
+    def get_key(self, release_id):
+        return f'{self.prefix}{release_id}.zip'
+
+    def upload(self, release_id, file):
+        """
+        Upload the archive in a single request, or in multiple
+        parts if it is larger than the size of the part.
+        """
+        key = self.get_key(release_id)
+
+        file.seek(0)
+        data = file.read(self.part_size + 1)
+
+        if len(data) <= self.part_size:
+            self.client.put_object(key, data)
+            return
+
+        upload_id = self.client.create_multipart_upload(key)
+
+        try:
+            etags = []
+            file.seek(0)
+
+            for part in iter(lambda: file.read(self.part_size), b''):
+                etags.append(self.client.upload_part(key, upload_id, len(etags) + 1, part))
+
+            self.client.complete_multipart_upload(key, upload_id, etags)
+        except Exception:
+            self.client.abort_multipart_upload(key, upload_id)
+            raise
+
+    def download(self, release_id):
+        """
+        Return the body of the archive streamed from the bucket.
+        """
+        return self.client.get_object(self.get_key(release_id))
+
+    def delete(self, release_id):
+        self.client.delete_object(self.get_key(release_id))
+
+    def file_exists(self, release_id):
+        return self.client.head_object(self.get_key(release_id))
+
+    def get_size(self, release_id):
+        return self.client.get_object_size(self.get_key(release_id))
+
+    def check_health(self, deep=False):
+        """
+        Check that the bucket exists, and if the check is deep,
+        that an object can be written to it, read back and deleted.
+        """
+        if not self.client.head_bucket():
+            raise S3Error(404, f'Bucket {self.client.bucket} does not exist.')
+
+        if deep:
+            key = f'{self.prefix}.health-{uuid.uuid4().hex}'
+            self.client.put_object(key, b'health')
+
+            try:
+                file = self.client.get_object(key)
+                data = file.read() if file else None
+                if file:
+                    file.close()
+            finally:
+                self.client.delete_object(key)
+
+            if data != b'health':
+                raise S3Error(500, f'Bucket {self.client.bucket} returned corrupted data.')
+
+    def get_download_url(self, release_id, file_name):
+        url = self.client.get_url(self.get_key(release_id))
+        params = {'response-content-disposition': f'attachment; filename={file_name}'}
+        return self.client.presign('GET', url, self.url_expires, params)
+
+
+class CachedStorage(StorageInterface):
+    """
+    Storage keeping recently downloaded archives of the backing storage
+    in the local directory. The size of the cache is bounded, and the least
+    recently used archives are evicted first. Concurrent downloads of the
+    same missing archive wait for a single fetch from the backing storage.
+
+    Every server process accounts only for the archives it has cached itself
+    or found at its start, so processes sharing the directory can together
+    use up to their number times the maximal size. The archives being sent
+    are locked, so they are not evicted by any process, and the archives
+    removed by other processes are fetched again.
+    """
+    def __init__(self, backend, basedir, max_size):
+        self.backend = backend
+        self.basedir = basedir
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.fetches = {}
+        self.oversized = set()
+        self.lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.load_entries()
+
+    @property
+    def temp_dir(self):
+        return os.path.join(self.basedir, 'tmp')
+
+    def load_entries(self):
+        """
+        Adopt the archives cached before the restart of the server,
+        ordered by the time of their last access.
+        """
+        if not os.path.isdir(self.basedir):
+            return
+
+        cached = []
+
+        for entry in os.scandir(self.basedir):
+            if entry.is_file() and entry.name.endswith('.zip'):
+                stat = entry.stat()
+                cached.append((stat.st_atime, entry.name[:-4], stat.st_size))
+
+        for _, release_id, size in sorted(cached):
+            self.entries[release_id] = size
+            self.size += size
+
+        self.evict()
+
+    def get_file_path(self, release_id):
+        return os.path.join(self.basedir, f'{release_id}.zip')
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used archives until the cache fits its
+        size, skipping the archives being sent. Has to be called with
+        the lock being held.
+        """
+        for release_id in list(self.entries):
+            if self.size <= self.max_size:
+                break
+
+            if release_id == keep:
+                continue
+
+            path = self.get_file_path(release_id)
+            file = lock_file(path, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            if not file and os.path.exists(path):
+                continue
+
+            try:
+                self.remove(release_id)
+            finally:
+                if file:
+                    file.close()
+                    self.evictions += 1
+
+    def remove(self, release_id):
+        self.size -= self.entries.pop(release_id)
+
+        try:
+            os.remove(self.get_file_path(release_id))
+        except FileNotFoundError:
+            pass
+
+    def forget(self, release_id):
+        """
+        Stop accounting for the archive removed by another process.
+        """
+        with self.lock:
+            if release_id in self.entries:
+                self.size -= self.entries.pop(release_id)
+
+    def fetch(self, release_id):
+        """
+        Copy the archive from the backing storage to the cache, and return
+        its size, or none if the archive does not exist or is too large.
+        The archive cached by another process in the meantime is adopted.
+        """
+        path = self.get_file_path(release_id)
+
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+
+        size = self.backend.get_size(release_id)
+
+        if size is not None and size > self.max_size:
+            self.oversized.add(release_id)
+            return None
+
+        file = self.backend.download(release_id)
+
+        if not file:
+            return None
+
+        upload_file = UploadFile(self.temp_dir, self.max_size)
+
+        try:
+            with file:
+                shutil.copyfileobj(file, upload_file, CHUNK_SIZE)
+
+            upload_file.file.close()
+
+            try:
+                os.link(upload_file.path, path)
+            except FileExistsError:
+                pass
+
+            return os.path.getsize(path)
+        except RequestEntityTooLarge:
+            self.oversized.add(release_id)
+            return None
+        finally:
+            upload_file.close()
+
+    def get_local_path(self, release_id):
+        """
+        Return the path to the cached archive. If the archive is not cached,
+        then fetch it first, or wait for the fetch already in progress.
+        The archive can be evicted unless it is opened by open_local.
+        """
+        release_id = str(release_id)
+        path = os.path.abspath(self.get_file_path(release_id))
+
+        with self.lock:
+            if release_id in self.entries:
+                self.entries.move_to_end(release_id)
+                self.hits += 1
+                return path
+
+            if release_id in self.oversized:
+                return None
+
+            event = self.fetches.get(release_id)
+            leader = event is None
+
+            if leader:
+                event = self.fetches[release_id] = threading.Event()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            event.wait()
+
+            with self.lock:
+                if release_id in self.entries:
+                    self.entries.move_to_end(release_id)
+                    return path
+            return None
+
+        size = None
+
+        try:
+            size = self.fetch(release_id)
+        finally:
+            with self.lock:
+                del self.fetches[release_id]
+
+                if size is not None:
+                    self.entries[release_id] = size
+                    self.size += size
+                    self.evict(keep=release_id)
+
+            event.set()
+
+        return path if size is not None else None
+
+    def open_local(self, release_id):
+        """
+        Open the cached archive and lock it, so it is not evicted by
+        any process until the file is closed. If the archive has been
+        removed by another process, then it is fetched again.
+        """
+        for _ in range(2):
+            path = self.get_local_path(release_id)
+
+            if not path:
+                return None
+
+            file = lock_file(path, fcntl.LOCK_SH)
+
+            if file:
+                return file
+
+            self.forget(str(release_id))
+
+        return None
+
+    def evicts_local(self):
+        return True
+
+    def get_size(self, release_id):
+        return self.backend.get_size(release_id)
+
+    def upload(self, release_id, file):
+        self.backend.upload(release_id, file)
+
+    def create_upload(self):
+        return self.backend.create_upload()
+
+    def download(self, release_id):
+        """
+        Load the archive from the cache, or stream it from the backing
+        storage if it can not be cached.
+        """
+        return self.open_local(release_id) or self.backend.download(release_id)
+
+    def delete(self, release_id):
+        """
+        Remove the archive from the cache and the backing storage. The cached
+        file is removed even if it is not accounted by this process, because
+        an existing file is adopted by the fetch without checking it.
+        """
+        with self.lock:
+            if str(release_id) in self.entries:
+                self.size -= self.entries.pop(str(release_id))
+
+            try:
+                os.remove(self.get_file_path(release_id))
+            except FileNotFoundError:
+                pass
+
+            self.oversized.discard(str(release_id))
+
+        self.backend.delete(release_id)
+
+    def file_exists(self, release_id):
+        with self.lock:
+            if str(release_id) in self.entries:
+                return True
+
+        return self.backend.file_exists(release_id)
+
+    def get_download_url(self, release_id, file_name):
+        return self.backend.get_download_url(release_id, file_name)
+
+    def check_health(self, deep=False):
+        check_directory(self.basedir, deep)
+        self.backend.check_health(deep)
+
+    def get_stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'size': self.size,
+            'max_size': self.max_size
+        }
@@ -1,9 +1,19 @@
+import fnmatch
 import io
 import os
+import socketserver
+import threading
+import time
 import unittest
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
 from zipfile import ZipFile, ZipInfo
 from base64 import b64encode
 
+from sqlalchemy import event
+
+from swing_server.api import metadata_cache
 from swing_server.app import create_app
 from swing_server.models import db, make_user
 
@@ -26,6 +36,7 @@ class ApiTestCase(unittest.TestCase):
 
     @classmethod
     def setup_app(cls):
+        metadata_cache.clear()
         cls.app = create_app()
         cls.app.testing = True
         cls.client = cls.app.test_client()
@@ -71,6 +82,225 @@ def create_test_zip():
     return archive
 
 
+def create_chart_zip(name, version, description='Test chart', extra=''):
+    archive = io.BytesIO()
+    with ZipFile(archive, 'w') as zip_archive:
+        definition = f'name: {name}\nversion: {version}\ndescription: {description}\n{extra}'
+        zip_archive.writestr(ZipInfo('chart.yaml'), definition.encode('utf-8'))
+        zip_archive.writestr(ZipInfo('values.yaml'), b'replicas: 1\n')
+        zip_archive.writestr(ZipInfo('deployment.yaml'), b'version: "3.7"\nservices: {}\n')
+    archive.seek(0)
+    return archive
+
+
 def get_fixtures_path(folder=''):
     abs_path = os.path.abspath(os.path.dirname(__file__))
     return os.path.join(abs_path, 'fixtures', folder)
+
+
+class QueryCounter:
+    """
+    Count SQL statements executed by the engine within the block.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def callback(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self.callback)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self.engine, 'before_cursor_execute', self.callback)
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def write(self, value):
+        self.wfile.write(encode_reply(value))
+
+    def handle(self):
+        server = self.server
+
+        while True:
+            args = self.read_command()
+            if not args:
+                return
+
+            command = args[0].decode().upper()
+            server.commands.append(command)
+
+            if command == 'GET':
+                entry = server.data.get(args[1])
+                alive = entry and (entry[1] is None or entry[1] > time.monotonic())
+                self.write(entry[0] if alive else None)
+            elif command == 'SET':
+                expires_at = None
+                if len(args) > 3 and args[3].upper() == b'PX':
+                    expires_at = time.monotonic() + int(args[4]) / 1000
+                server.data[args[1]] = (args[2], expires_at)
+                self.write('+OK')
+            elif command == 'DEL':
+                self.write(sum(1 for x in args[1:] if server.data.pop(x, None)))
+            elif command == 'SCAN':
+                pattern = args[3].decode()
+                keys = [x for x in server.data if fnmatch.fnmatch(x.decode(), pattern)]
+                self.write([b'0', keys])
+            elif command == 'PUBLISH':
+                for subscriber in list(server.subscribers):
+                    subscriber.write([b'message', args[1], args[2]])
+                self.write(len(server.subscribers))
+            elif command == 'SUBSCRIBE':
+                self.write([b'subscribe', args[1], 1])
+                server.subscribers.append(self)
+            else:
+                self.write('+OK')
+
+
+def encode_reply(value):
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, str):
+        return f'{value}\r\n'.encode()
+    if isinstance(value, int):
+        return f':{value}\r\n'.encode()
+    if isinstance(value, list):
+        return f'*{len(value)}\r\n'.encode() + b''.join(encode_reply(x) for x in value)
+    return f'${len(value)}\r\n'.encode() + value + b'\r\n'
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """
+    Server speaking the subset of the Redis protocol used by the cache.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeRedisHandler)
+        self.data = {}
+        self.subscribers = []
+        self.commands = []
+
+    @property
+    def url(self):
+        return f'redis://127.0.0.1:{self.server_address[1]}/0'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def respond(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def parse(self):
+        parsed = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query, keep_blank_values=True).items()}
+        bucket, _, key = unquote(parsed.path).lstrip('/').partition('/')
+
+        signed = self.headers.get('Authorization', '').startswith('AWS4-HMAC-SHA256 Credential=')
+        signed = signed or 'X-Amz-Signature' in query
+
+        return bucket, key, query, signed
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def handle_request(self):
+        bucket, key, query, signed = self.parse()
+        server = self.server
+        server.requests.append((self.command, key, query))
+
+        if not signed or bucket != server.bucket:
+            return self.respond(403, b'<Error><Code>AccessDenied</Code></Error>')
+
+        if self.command == 'HEAD' and not key:
+            return self.respond(200)
+
+        if self.command == 'PUT' and 'partNumber' in query:
+            server.uploads[query['uploadId']][int(query['partNumber'])] = self.read_body()
+            return self.respond(200, headers={'ETag': f'"part-{query["partNumber"]}"'})
+
+        if self.command == 'PUT':
+            server.objects[key] = self.read_body()
+            return self.respond(200)
+
+        if self.command == 'POST' and 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            server.uploads[upload_id] = {}
+            body = f'<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>'
+            return self.respond(200, body.encode())
+
+        if self.command == 'POST' and 'uploadId' in query:
+            self.read_body()
+            parts = server.uploads.pop(query['uploadId'])
+            server.objects[key] = b''.join(parts[x] for x in sorted(parts))
+            return self.respond(200, b'<CompleteMultipartUploadResult/>')
+
+        if self.command == 'DELETE':
+            if 'uploadId' in query:
+                server.uploads.pop(query['uploadId'], None)
+            else:
+                server.objects.pop(key, None)
+            return self.respond(204)
+
+        if key not in server.objects:
+            return self.respond(404, b'<Error><Code>NoSuchKey</Code></Error>')
+
+        return self.respond(200, server.objects[key])
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = handle_request
+
+
+class FakeS3Server(ThreadingHTTPServer):
+    """
+    Server implementing the subset of the S3 API used by the storage.
+    """
+    daemon_threads = True
+
+    def __init__(self, bucket='charts'):
+        super().__init__(('127.0.0.1', 0), FakeS3Handler)
+        self.bucket = bucket
+        self.objects = {}
+        self.uploads = {}
+        self.requests = []
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -1,7 +1,50 @@
+import hashlib
+import io
+import json
 import os
+import tarfile
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from zipfile import ZipFile
 
-from swing_server.models import db, Chart, Release, make_user
-from helpers import get_fixtures_path, ApiTestCase
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from swing_server.api import metadata_cache, storage
+from swing_server.chart import ArchiveLimits, inspect_chart_archive
+from swing_server.config import Config
+from swing_server.helpers import encode_cursor
+from swing_server.models import db, Chart, Release, Repository, User, get_repository, make_user, touch_repository
+from swing_server.storage import DownloadMode
+from helpers import get_fixtures_path, create_chart_zip, ApiTestCase, QueryCounter
+
+
+class ConcurrentChart:
+    """
+    Create the chart using a separate connection right before the session
+    is flushed for the first time, as if it was created concurrently.
+    """
+    def __init__(self, name, email):
+        self.name = name
+        self.email = email
+        self.created = False
+
+    def create(self, session, *args):
+        if self.created:
+            return
+
+        self.created = True
+
+        with db.engine.connect() as connection:
+            user_id = connection.execute(db.select([User.id]).where(User.email == self.email)).scalar()
+            connection.execute(Chart.__table__.insert().values(name=self.name, user_id=user_id))
+
+    def __enter__(self):
+        event.listen(Session, 'before_flush', self.create)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(Session, 'before_flush', self.create)
 
 
 class ApiGeneralTest(ApiTestCase):
@@ -13,6 +56,52 @@ class ApiGeneralTest(ApiTestCase):
         self.assertEqual(response.json[0].get('name'), 'psql')
         self.assertEqual(response.json[1].get('name'), 'redis')
 
+    def test_list_charts_not_modified(self):
+        response = self.client.get('/chart')
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        self.assertIsNotNone(etag)
+        self.assertIsNotNone(last_modified)
+
+        response = self.client.get('/chart', headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        response = self.client.get('/chart', headers={'If-Modified-Since': last_modified})
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_charts_paginated(self):
+        response = self.client.get('/chart', query_string={'limit': 1})
+
+        self.assert200(response)
+        self.assertEqual([x.get('name') for x in response.json], ['psql'])
+
+        link = response.headers.get('Link')
+        self.assertTrue(link.endswith('>; rel="next"'))
+
+        next_url = link[1:link.index('>')].replace('http://localhost:5000', '')
+        response = self.client.get(next_url)
+
+        self.assert200(response)
+        self.assertEqual([x.get('name') for x in response.json], ['redis'])
+        self.assertIsNone(response.headers.get('Link'))
+
+    def test_list_charts_invalid_page(self):
+        self.assert400(self.client.get('/chart', query_string={'limit': 0}))
+        self.assert400(self.client.get('/chart', query_string={'limit': 1, 'cursor': 'foo'}))
+
+    def test_list_charts_ndjson(self):
+        response = self.client.get('/chart', headers={'Accept': 'application/x-ndjson'})
+
+        self.assert200(response)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+
+        lines = response.data.decode('utf-8').splitlines()
+        self.assertEqual([json.loads(x).get('name') for x in lines], ['psql', 'redis'])
+
     def test_search_charts(self):
         response = self.client.get('/chart', query_string={'query': 'postgres'})
 
@@ -21,6 +110,11 @@ class ApiGeneralTest(ApiTestCase):
         self.assertEqual(response.json[0].get('name'), 'psql')
         self.assertIsNotNone(response.json[0].get('description'))
 
+    def test_search_charts_forged_cursor(self):
+        for values in [[-1], [True]]:
+            query_string = {'query': 'postgres', 'limit': 1, 'cursor': encode_cursor(values)}
+            self.assert400(self.client.get('/chart', query_string=query_string))
+
     def test_search_charts_no_result(self):
         response = self.client.get('/chart', query_string={'query': 'foo'})
 
@@ -52,6 +146,59 @@ class ApiGeneralTest(ApiTestCase):
         self.assertEqual(response.json[0].get('version'), '1.0.0')
         self.assertEqual(response.json[0].get('notes'), 'First release')
 
+    def test_list_releases_ordered(self):
+        response = self.client.get('/release', query_string={'chart': 'psql'})
+
+        self.assert200(response)
+        self.assertEqual([x.get('version') for x in response.json], ['1.10.0', '1.9.0', '1.2.0'])
+
+    def test_list_releases_paginated(self):
+        versions = []
+        query_string = {'chart': 'psql', 'limit': 2}
+
+        while True:
+            response = self.client.get('/release', query_string=query_string)
+            self.assert200(response)
+            versions += [x.get('version') for x in response.json]
+
+            link = response.headers.get('Link')
+            if not link:
+                break
+
+            query_string['cursor'] = parse_qs(urlparse(link[1:link.index('>')]).query)['cursor'][0]
+
+        self.assertEqual(versions, ['1.10.0', '1.9.0', '1.2.0'])
+
+    def test_latest_release(self):
+        response = self.client.get('/release/latest', query_string={'chart': 'psql'})
+
+        self.assert200(response)
+        self.assertEqual(response.json.get('version'), '1.10.0')
+        self.assertEqual(response.json.get('archiveUrl'), 'http://localhost:5000/release/psql-1.10.0.zip')
+
+    def test_latest_release_same_key(self):
+        # versions differing in leading zeros have the same key,
+        # and then the release published later is the latest one
+        with self.app.app_context():
+            chart = Chart.query.filter_by(name='psql').one()
+            release = Release(chart_id=chart.id, version='1.010.0')
+            db.session.add(release)
+            db.session.commit()
+
+            try:
+                response = self.client.get('/release/latest', query_string={'chart': 'psql'})
+            finally:
+                db.session.delete(release)
+                db.session.commit()
+
+        self.assert200(response)
+        self.assertEqual(response.json.get('version'), '1.010.0')
+
+    def test_latest_release_not_found(self):
+        response = self.client.get('/release/latest', query_string={'chart': 'nginx'})
+
+        self.assert404(response)
+
     def test_list_releases_empty_chart_name(self):
         response = self.client.get('/release')
 
@@ -68,6 +215,69 @@ class ApiGeneralTest(ApiTestCase):
         self.assert200(response)
         self.assertEqual(response.json.get('charts'), 2)
 
+    def test_server_status_without_count(self):
+        metadata_cache.clear()
+
+        with self.app.app_context():
+            engine = db.engine
+
+        with QueryCounter(engine) as counter:
+            response = self.client.get('/status')
+
+        self.assert200(response)
+        self.assertEqual(counter.count, 1)
+
+    def test_liveness(self):
+        response = self.client.get('/health/live')
+
+        self.assert200(response)
+        self.assertEqual(response.json, {'status': 'ok'})
+
+    def test_readiness(self):
+        for query_string in [{}, {'deep': 'true'}]:
+            response = self.client.get('/health/ready', query_string=query_string)
+
+            self.assert200(response)
+            self.assertEqual(response.json['checks'], {'database': 'ok', 'storage': 'ok', 'cache': 'ok'})
+
+    def test_readiness_failed(self):
+        with mock.patch.object(storage, 'check_health', side_effect=OSError('unreachable')):
+            response = self.client.get('/health/ready')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json['status'], 'failed')
+        self.assertEqual(response.json['checks']['storage'], 'failed')
+
+    def test_readiness_cache_failed(self):
+        with mock.patch.object(metadata_cache, 'check_health', side_effect=OSError('unreachable')):
+            response = self.client.get('/health/ready')
+
+        self.assert200(response)
+        self.assertEqual(response.json['status'], 'ok')
+        self.assertEqual(response.json['checks']['cache'], 'failed')
+
+    def test_repository_created_concurrently(self):
+        with self.app.app_context():
+            state = get_repository().get_state()
+            Repository.query.delete()
+            db.session.commit()
+
+            def create(*args):
+                with db.engine.connect() as connection:
+                    connection.execute(Repository.__table__.insert().values(
+                        id=Repository.ID, revision=state.revision, charts=state.charts, updated_at=state.updated_at))
+
+            event.listen(Session, 'before_flush', create, once=True)
+
+            try:
+                repository = get_repository()
+            finally:
+                if event.contains(Session, 'before_flush', create):
+                    event.remove(Session, 'before_flush', create)
+
+            self.assertEqual(repository.revision, state.revision)
+            self.assertEqual(repository.charts, state.charts)
+
     @classmethod
     def setUpClass(cls):
         cls.setup_app()
@@ -91,6 +301,7 @@ class ApiGeneralTest(ApiTestCase):
                 description='Database PostgreSQL chart',
                 user_id=user1.id)
             db.session.add(chart2)
+            touch_repository(charts=2)
             db.session.commit()
 
             release = Release(
@@ -99,6 +310,10 @@ class ApiGeneralTest(ApiTestCase):
                 notes='First release'
             )
             db.session.add(release)
+
+            for version in ['1.9.0', '1.10.0', '1.2.0']:
+                db.session.add(Release(chart_id=chart2.id, version=version))
+
             db.session.commit()
 
     def tearDown(self):
@@ -106,6 +321,8 @@ class ApiGeneralTest(ApiTestCase):
 
 
 class ApiReleaseTest(ApiTestCase):
+    etag = None
+
     def test_a_publish_release(self):
         self.login('user123@gmail.com', 'pass123')
 
@@ -119,6 +336,14 @@ class ApiReleaseTest(ApiTestCase):
             self.assert200(response)
             self.assertEqual(response.json.get('version'), '1.0.0')
 
+        with open(chart_path, 'rb') as zip_archive:
+            content = zip_archive.read()
+
+        with self.app.app_context():
+            release = Release.query.filter_by(version='1.0.0').first()
+            self.assertEqual(release.digest, hashlib.sha256(content).hexdigest())
+            self.assertEqual(release.size, len(content))
+
     def test_b_list_charts(self):
         response = self.client.get('/chart')
 
@@ -135,6 +360,19 @@ class ApiReleaseTest(ApiTestCase):
         self.assertIsNotNone(response.json[0].get('releaseDate'))
         self.assertEqual(response.json[0].get('archiveUrl'), 'http://localhost:5000/release/redis-1.0.0.zip')
 
+    def test_c_list_releases_not_modified(self):
+        response = self.client.get('/release', query_string={'chart': 'redis'})
+        etag = response.headers.get('ETag')
+        ApiReleaseTest.etag = etag
+
+        response = self.client.get('/release', query_string={'chart': 'redis'}, headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+
+        for url in ['/release', '/release/latest']:
+            response = self.client.get(url, query_string={'chart': 'nginx'}, headers={'If-None-Match': etag})
+            self.assert404(response)
+
     def test_d_download_release_invalid(self):
         response = self.client.get(f'/release/redis-2.4.0.zip')
 
@@ -146,6 +384,96 @@ class ApiReleaseTest(ApiTestCase):
         self.assert200(response)
         self.assertIsNotNone(response.data)
 
+    def test_e_download_release_not_modified(self):
+        response = self.client.get(f'/release/redis-1.0.0.zip')
+        etag = response.headers.get('ETag')
+
+        with self.app.app_context():
+            release = Release.query.filter_by(version='1.0.0').first()
+            self.assertEqual(etag, f'"{release.digest}"')
+
+        response = self.client.get(f'/release/redis-1.0.0.zip', headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_e_download_release_range(self):
+        response = self.client.get(f'/release/redis-1.0.0.zip', headers={'Range': 'bytes=0-1'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, b'PK')
+        self.assertEqual(response.headers.get('Accept-Ranges'), 'bytes')
+
+    def test_e_download_release_x_accel(self):
+        Config.DOWNLOAD_MODE = DownloadMode.X_ACCEL_REDIRECT
+        try:
+            response = self.client.get(f'/release/redis-1.0.0.zip')
+        finally:
+            Config.DOWNLOAD_MODE = DownloadMode.DIRECT
+
+        self.assert200(response)
+        self.assertEqual(response.data, b'')
+        self.assertTrue(response.headers.get('X-Accel-Redirect').startswith('/archives/'))
+        self.assertIn('redis-1.0.0.zip', response.headers.get('Content-Disposition'))
+
+    def test_e_download_release_x_accel_evicted(self):
+        Config.DOWNLOAD_MODE = DownloadMode.X_ACCEL_REDIRECT
+        try:
+            with mock.patch.object(storage, 'evicts_local', return_value=True):
+                response = self.client.get(f'/release/redis-1.0.0.zip')
+        finally:
+            Config.DOWNLOAD_MODE = DownloadMode.DIRECT
+
+        self.assert200(response)
+        self.assertNotIn('X-Accel-Redirect', response.headers)
+        self.assertEqual(response.data[:2], b'PK')
+
+    def test_e_release_manifest(self):
+        response = self.client.get('/release/manifest', query_string={'chart': 'redis', 'version': '1.0.0'})
+
+        self.assert200(response)
+        self.assertEqual(response.json['definition']['name'], 'redis')
+        self.assertIn('chart.yaml', [x['name'] for x in response.json['files']])
+
+        response = self.client.get('/release/manifest', query_string={'chart': 'redis', 'version': '2.0.0'})
+        self.assert404(response)
+
+    def test_e_release_manifest_deferred(self):
+        with self.app.app_context():
+            release = Release.query.filter_by(version='1.0.0').first()
+            self.assertNotIn('manifest', release.__dict__)
+
+    def test_e_release_manifest_created(self):
+        with self.app.app_context():
+            release = Release.query.filter_by(version='1.0.0').first()
+            release.manifest = None
+            db.session.commit()
+
+        archive = io.BytesIO(self.client.get('/release/redis-1.0.0.zip').data)
+
+        with ZipFile(archive) as zip_file:
+            expected = inspect_chart_archive(zip_file).to_dict()
+
+        response = self.client.get('/release/manifest', query_string={'chart': 'redis', 'version': '1.0.0'})
+
+        self.assert200(response)
+        self.assertEqual(response.json, expected)
+
+        with self.app.app_context():
+            release = Release.query.filter_by(version='1.0.0').first()
+            self.assertEqual(release.manifest, expected)
+
+    def test_e_release_manifest_created_over_limits(self):
+        with self.app.app_context():
+            release = Release.query.filter_by(version='1.0.0').first()
+            release.manifest = None
+            db.session.commit()
+
+        with mock.patch('swing_server.api.archive_limits', ArchiveLimits(max_entries=1)):
+            response = self.client.get('/release/manifest', query_string={'chart': 'redis', 'version': '1.0.0'})
+
+        self.assert200(response)
+        self.assertGreater(len(response.json['files']), 1)
+
     def test_f_delete_release(self):
         response = self.client.delete('/chart/redis', query_string={'version': '1.0.0'})
 
@@ -157,6 +485,17 @@ class ApiReleaseTest(ApiTestCase):
         self.assert200(response)
         self.assertEqual(len(response.json), 0)
 
+    def test_g_list_releases_not_modified(self):
+        response = self.client.get('/release', query_string={'chart': 'redis'}, headers={'If-None-Match': self.etag})
+
+        self.assert200(response)
+        self.assertNotEqual(response.headers.get('ETag'), self.etag)
+
+        etag = response.headers.get('ETag')
+        response = self.client.get('/release', query_string={'chart': 'redis'}, headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+
     def test_h_delete_chart(self):
         response = self.client.delete('/chart/redis')
 
@@ -173,3 +512,237 @@ class ApiReleaseTest(ApiTestCase):
         cls.setup_app()
         cls.setup_user()
 
+
+class ApiQueryCountTest(ApiTestCase):
+    def count_queries(self, method, url, **kwargs):
+        with self.app.app_context():
+            engine = db.engine
+
+        metadata_cache.clear()
+
+        with QueryCounter(engine) as counter:
+            response = getattr(self.client, method)(url, **kwargs)
+            self.assert200(response)
+
+        return counter.count
+
+    def test_list_releases(self):
+        small = self.count_queries('get', '/release', query_string={'chart': 'psql'})
+        large = self.count_queries('get', '/release', query_string={'chart': 'redis'})
+
+        self.assertEqual(small, large)
+
+    def test_remove_chart(self):
+        self.login('user123@gmail.com', 'pass123')
+
+        small = self.count_queries('delete', '/chart/psql')
+        large = self.count_queries('delete', '/chart/redis')
+
+        self.assertEqual(small, large)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.setup_app()
+        cls.setup_user()
+        with cls.app.app_context():
+            user = User.query.first()
+
+            for name, releases_count in [('psql', 1), ('redis', 30)]:
+                chart = Chart(name=name, user_id=user.id)
+                db.session.add(chart)
+                db.session.flush()
+
+                for i in range(releases_count):
+                    db.session.add(Release(chart_id=chart.id, version=f'1.{i}.0'))
+
+            db.session.commit()
+
+
+class ApiPublishTest(ApiTestCase):
+    def publish(self, name, version):
+        archive = create_chart_zip(name, version)
+        data = dict(
+            chart=(archive, f'{name}-{version}.zip')
+        )
+        return self.client.post('/release', content_type='multipart/form-data', data=data)
+
+    def test_publish_versions(self):
+        self.assert200(self.publish('nginx', '1.0.0'))
+        self.assert200(self.publish('nginx', '1.1.0'))
+
+        response = self.client.get('/release', query_string={'chart': 'nginx'})
+
+        self.assertEqual([x.get('version') for x in response.json], ['1.1.0', '1.0.0'])
+
+    def test_publish_duplicate(self):
+        self.assert200(self.publish('traefik', '2.0.0'))
+        self.assert400(self.publish('traefik', '2.0.0'))
+
+        with self.app.app_context():
+            self.assertEqual(Chart.query.filter_by(name='traefik').count(), 1)
+            self.assertEqual(Release.query.filter_by(version='2.0.0').count(), 1)
+
+    def test_publish_concurrent_chart(self):
+        with ConcurrentChart('minio', 'user123@gmail.com') as concurrent:
+            self.assert200(self.publish('minio', '1.0.0'))
+
+        self.assertTrue(concurrent.created)
+
+        with self.app.app_context():
+            self.assertEqual(Release.query.join(Release.chart).filter(Chart.name == 'minio').count(), 1)
+
+    def test_publish_too_large(self):
+        max_content_length = self.app.config['MAX_CONTENT_LENGTH']
+        self.app.config['MAX_CONTENT_LENGTH'] = 256
+
+        try:
+            self.assertEqual(self.publish('consul', '1.0.0').status_code, 413)
+        finally:
+            self.app.config['MAX_CONTENT_LENGTH'] = max_content_length
+
+        with self.app.app_context():
+            self.assertIsNone(Chart.query.filter_by(name='consul').first())
+
+    @classmethod
+    def setUpClass(cls):
+        cls.setup_app()
+        cls.setup_user()
+
+    def setUp(self):
+        self.login('user123@gmail.com', 'pass123')
+
+    def tearDown(self):
+        self.logout()
+
+
+class ApiBulkPublishTest(ApiTestCase):
+    def publish(self, archives, atomic=True):
+        data = dict(
+            charts=[(create_chart_zip(name, version), f'{name}-{version}.zip') for name, version in archives]
+        )
+        query_string = {} if atomic else {'atomic': 'false'}
+        return self.client.post('/release/bulk', content_type='multipart/form-data', data=data,
+                                query_string=query_string)
+
+    def get_revision(self):
+        with self.app.app_context():
+            return get_repository().revision
+
+    def test_a_publish_releases(self):
+        revision = self.get_revision()
+        response = self.publish([('etcd', '1.0.0'), ('etcd', '1.1.0'), ('vault', '1.0.0')])
+
+        self.assert200(response)
+        self.assertEqual(response.json['published'], 3)
+        self.assertEqual([x['status'] for x in response.json['results']], ['published'] * 3)
+        self.assertEqual(self.get_revision(), revision + 1)
+
+        response = self.client.get('/release', query_string={'chart': 'etcd'})
+        self.assertEqual([x.get('version') for x in response.json], ['1.1.0', '1.0.0'])
+
+        response = self.client.get('/release/vault-1.0.0.zip')
+        self.assert200(response)
+        self.assertEqual(response.data[:2], b'PK')
+
+    def test_b_publish_atomic(self):
+        response = self.publish([('consul', '1.0.0'), ('etcd', '1.0.0')])
+
+        self.assert400(response)
+        self.assertEqual([x['status'] for x in response.json['results']], ['skipped', 'failed'])
+
+        with self.app.app_context():
+            self.assertIsNone(Chart.query.filter_by(name='consul').first())
+
+    def test_c_publish_partial(self):
+        response = self.publish([('consul', '1.0.0'), ('consul', '1.0.0'), ('etcd', '1.0.0')], atomic=False)
+
+        self.assert200(response)
+        self.assertEqual(response.json['published'], 1)
+        self.assertEqual([x['status'] for x in response.json['results']], ['published', 'failed', 'failed'])
+
+    def test_d_publish_bundle(self):
+        bundle = io.BytesIO()
+
+        with tarfile.open(fileobj=bundle, mode='w:gz') as tar_file:
+            for name, version in [('nomad', '1.0.0'), ('nomad', '1.1.0')]:
+                data = create_chart_zip(name, version).getvalue()
+                member = tarfile.TarInfo(f'charts/{name}-{version}.zip')
+                member.size = len(data)
+                tar_file.addfile(member, io.BytesIO(data))
+
+        bundle.seek(0)
+        response = self.client.post('/release/bulk', content_type='multipart/form-data',
+                                    data=dict(bundle=(bundle, 'charts.tar.gz')))
+
+        self.assert200(response)
+        self.assertEqual([x['file'] for x in response.json['results']], ['nomad-1.0.0.zip', 'nomad-1.1.0.zip'])
+
+        response = self.client.get('/release/nomad-1.1.0.zip')
+        self.assert200(response)
+
+    def test_e_publish_concurrent_chart(self):
+        with ConcurrentChart('zookeeper', 'user123@gmail.com') as concurrent:
+            response = self.publish([('zookeeper', '1.0.0'), ('zookeeper', '1.1.0')])
+
+        self.assert200(response)
+        self.assertTrue(concurrent.created)
+        self.assertEqual(response.json['published'], 2)
+
+    def test_f_publish_invalid(self):
+        self.assert400(self.client.post('/release/bulk', content_type='multipart/form-data', data={}))
+
+        data = dict(bundle=(io.BytesIO(b'not a tar'), 'charts.tar'))
+        self.assert400(self.client.post('/release/bulk', content_type='multipart/form-data', data=data))
+
+    def test_f_publish_large_bundle(self):
+        chart = ('charts/nomad-1.0.0.zip', create_chart_zip('nomad', '1.0.0').getvalue())
+
+        for members, limits in [([('README', bytes(2 * 1024 * 1024))], {'BULK_MAX_CONTENT_LENGTH': 1024 * 1024}),
+                                ([(f'docs/{x}', b'') for x in range(20)], {'BULK_MAX_MEMBERS': 10})]:
+            bundle = io.BytesIO()
+
+            with tarfile.open(fileobj=bundle, mode='w:xz') as tar_file:
+                for name, data in members + [chart]:
+                    member = tarfile.TarInfo(name)
+                    member.size = len(data)
+                    tar_file.addfile(member, io.BytesIO(data))
+
+            bundle.seek(0)
+
+            with mock.patch.multiple(Config, **limits), \
+                    mock.patch.object(storage, 'create_upload', wraps=storage.create_upload) as create_upload:
+                response = self.client.post('/release/bulk', content_type='multipart/form-data',
+                                            data=dict(bundle=(bundle, 'charts.tar.xz')))
+
+            self.assert400(response)
+            # only the uploaded bundle itself is received into the storage
+            self.assertEqual(create_upload.call_count, 1)
+
+    def test_g_publish_invalid_version(self):
+        response = self.publish([('consul', '1.0'), ('packer', '1.0.0')], atomic=False)
+
+        self.assert200(response)
+        self.assertEqual([x['status'] for x in response.json['results']], ['failed', 'published'])
+
+    def test_h_publish_unexpected_error(self):
+        def inspect(zip_file, *args):
+            if b'terraform' in zip_file.read('chart.yaml'):
+                raise RuntimeError('Unexpected error.')
+            return inspect_chart_archive(zip_file, *args)
+
+        with mock.patch('swing_server.api.inspect_chart_archive', side_effect=inspect):
+            response = self.publish([('terraform', '1.0.0'), ('boundary', '1.0.0')], atomic=False)
+
+        self.assert200(response)
+        self.assertEqual([x['status'] for x in response.json['results']], ['failed', 'published'])
+
+    @classmethod
+    def setUpClass(cls):
+        cls.setup_app()
+        cls.setup_user()
+
+    def setUp(self):
+        self.login('user123@gmail.com', 'pass123')
+
+    def tearDown(self):
+        self.logout()
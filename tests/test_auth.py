@@ -1,4 +1,14 @@
-from helpers import ApiTestCase
+from base64 import b64encode
+from unittest import mock
+
+from flask import request
+from itsdangerous import URLSafeTimedSerializer
+from werkzeug.security import check_password_hash
+
+from swing_server.auth import TokenSessionInterface, credential_cache
+from swing_server.helpers import hash_password
+from swing_server.models import User, db
+from helpers import ApiTestCase, QueryCounter, create_chart_zip
 
 
 class LoginTest(ApiTestCase):
@@ -30,3 +40,112 @@ class LoginTest(ApiTestCase):
 
     def tearDown(self):
         self.logout()
+
+
+class TokenTest(ApiTestCase):
+    def create_token(self):
+        credentials = b64encode(b'user123@gmail.com:pass123').decode('utf-8')
+        response = self.client.post('/token', headers={'Authorization': f'Basic {credentials}'})
+        self.assert200(response)
+        return response.json.get('token')
+
+    def publish(self, token, version):
+        archive = create_chart_zip('redis', version)
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        return self.client.post('/release', data={'chart': (archive, f'redis-{version}.zip')}, headers=headers)
+
+    def test_a_create_token(self):
+        response = self.client.post('/token')
+        self.assert400(response)
+
+        token = self.create_token()
+        self.assertTrue(token)
+
+        response = self.client.post('/token', headers={'Authorization': f'Bearer {token}'})
+        self.assert400(response)
+
+    def test_b_publish_release(self):
+        token = self.create_token()
+
+        response = self.publish(token, '1.0.0')
+        self.assert200(response)
+        self.assertNotIn('Set-Cookie', response.headers)
+
+        with self.app.app_context():
+            engine = db.engine
+
+        with QueryCounter(engine) as counter:
+            self.assert200(self.publish(token, '1.0.1'))
+
+        self.login('user123@gmail.com', 'pass123')
+
+        with QueryCounter(engine) as session_counter:
+            self.assert200(self.publish(None, '1.0.2'))
+
+        self.assertEqual(counter.count, session_counter.count - 1)
+
+    def test_c_skip_session(self):
+        interface = mock.Mock()
+        token_interface = TokenSessionInterface(interface)
+
+        with self.app.test_request_context(headers={'Authorization': 'Bearer token'}):
+            token_interface.save_session(self.app, token_interface.open_session(self.app, request), None)
+
+        with self.app.test_request_context():
+            token_interface.save_session(self.app, token_interface.open_session(self.app, request), None)
+
+        self.assertEqual(interface.open_session.call_count, 1)
+        self.assertEqual(interface.save_session.call_count, 1)
+
+    def test_d_invalid_token(self):
+        forged = URLSafeTimedSerializer('other-secret', salt='swing-token').dumps([1, 'user123@gmail.com'])
+
+        for token in ['invalid', forged]:
+            response = self.client.delete('/chart/redis', headers={'Authorization': f'Bearer {token}'})
+            self.assert401(response)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.setup_app()
+        cls.setup_user()
+
+    def tearDown(self):
+        self.logout()
+
+
+class CredentialCacheTest(ApiTestCase):
+    def test_a_cache_verified_credentials(self):
+        credential_cache.clear()
+
+        with mock.patch('swing_server.helpers.check_password_hash', wraps=check_password_hash) as check:
+            self.assert401(self.login('user123@gmail.com', 'secret456'))
+            self.assert401(self.login('user123@gmail.com', 'secret456'))
+
+            for _ in range(3):
+                self.assert200(self.login('user123@gmail.com', 'pass123'))
+                self.logout()
+
+        self.assertEqual(check.call_count, 3)
+
+    def test_b_rehash_password(self):
+        with self.app.app_context():
+            user = User.query.filter_by(email='user123@gmail.com').first()
+            user.hashed_password = hash_password('pass123', 'pbkdf2:sha256:1000')
+            db.session.commit()
+
+        self.assert200(self.login('user123@gmail.com', 'pass123'))
+
+        with self.app.app_context():
+            user = User.query.filter_by(email='user123@gmail.com').first()
+            self.assertTrue(user.hashed_password.startswith('pbkdf2:sha256:150000$'))
+
+        self.logout()
+        self.assert200(self.login('user123@gmail.com', 'pass123'))
+
+    @classmethod
+    def setUpClass(cls):
+        cls.setup_app()
+        cls.setup_user()
+
+    def tearDown(self):
+        self.logout()
@@ -0,0 +1,208 @@
+import pickle
+import time
+import unittest
+from unittest import mock
+
+from swing_server.api import metadata_cache, storage
+from swing_server.cache import MemoryCache, RedisCache
+from swing_server.models import db, Release
+from helpers import ApiTestCase, FakeRedisServer, create_chart_zip
+
+
+class MemoryCacheTestCase(unittest.TestCase):
+    def test_get(self):
+        cache = MemoryCache()
+        cache.set('redis', 1)
+
+        self.assertEqual(cache.get('redis'), 1)
+        self.assertIsNone(cache.get('nginx'))
+        self.assertEqual(cache.get_stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_evict_least_recently_used(self):
+        cache = MemoryCache(max_size=2)
+        cache.set('redis', 1)
+        cache.set('nginx', 2)
+        cache.get('redis')
+        cache.set('psql', 3)
+
+        self.assertEqual(cache.get('redis'), 1)
+        self.assertIsNone(cache.get('nginx'))
+        self.assertEqual(cache.get('psql'), 3)
+
+    def test_expire(self):
+        cache = MemoryCache(ttl=0.01)
+        cache.set('redis', 1)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get('redis'))
+        self.assertEqual(cache.get_stats().get('size'), 0)
+
+    def test_delete(self):
+        cache = MemoryCache()
+        cache.set('redis', 1)
+        cache.set('nginx', 2)
+        cache.delete('redis', 'nginx')
+
+        self.assertEqual(cache.get_stats().get('size'), 0)
+
+
+class ApiCacheTest(ApiTestCase):
+    def test_a_download_cached(self):
+        archive = create_chart_zip('redis', '1.0.0')
+        data = dict(
+            chart=(archive, 'redis-1.0.0.zip')
+        )
+        self.assert200(self.client.post('/release', content_type='multipart/form-data', data=data))
+        self.assert200(self.client.get('/release/redis-1.0.0.zip'))
+
+        hits = metadata_cache.hits
+        self.assert200(self.client.get('/release/redis-1.0.0.zip'))
+
+        self.assertGreater(metadata_cache.hits, hits)
+        self.assertIsNotNone(metadata_cache.get('release:redis:1.0.0'))
+
+    def test_b_invalidate_on_delete(self):
+        self.assert200(self.client.delete('/chart/redis', query_string={'version': '1.0.0'}))
+
+        self.assertIsNone(metadata_cache.get('release:redis:1.0.0'))
+        self.assert404(self.client.get('/release/redis-1.0.0.zip'))
+
+    def test_c_deleted_by_other_process(self):
+        archive = create_chart_zip('redis', '2.0.0')
+        self.assert200(self.client.post('/release', content_type='multipart/form-data',
+                                        data=dict(chart=(archive, 'redis-2.0.0.zip'))))
+        self.assert200(self.client.get('/release/redis-2.0.0.zip'))
+
+        # the release is deleted without invalidating the cache of this process
+        with self.app.app_context():
+            release = Release.query.filter_by(version='2.0.0').first()
+            storage.delete(release.id)
+            db.session.delete(release)
+            db.session.commit()
+
+        self.assertIsNotNone(metadata_cache.get('release:redis:2.0.0'))
+        self.assert404(self.client.get('/release/redis-2.0.0.zip'))
+
+    def test_c_published_again_by_other_process(self):
+        for name in ['redis', 'nginx']:
+            archive = create_chart_zip(name, '3.0.0')
+            self.assert200(self.client.post('/release', content_type='multipart/form-data',
+                                            data=dict(chart=(archive, f'{name}-3.0.0.zip'))))
+
+        self.assert200(self.client.get('/release/redis-3.0.0.zip'))
+        release_info = metadata_cache.get('release:redis:3.0.0')
+
+        # the release is deleted and published again with a new id
+        # without invalidating the cache of this process
+        with self.app.app_context():
+            release = Release.query.filter_by(version='3.0.0').first()
+            storage.delete(release.id)
+            db.session.delete(release)
+            db.session.commit()
+
+        archive = create_chart_zip('redis', '3.0.0', 'Published again')
+        data = archive.getvalue()
+        self.assert200(self.client.post('/release', content_type='multipart/form-data',
+                                        data=dict(chart=(archive, 'redis-3.0.0.zip'))))
+
+        metadata_cache.set('release:redis:3.0.0', release_info)
+
+        response = self.client.get('/release/redis-3.0.0.zip')
+        self.assert200(response)
+        self.assertEqual(response.data, data)
+        self.assertNotEqual(metadata_cache.get('release:redis:3.0.0').id, release_info.id)
+
+    def test_d_status(self):
+        response = self.client.get('/status')
+
+        self.assert200(response)
+        self.assertIn('hits', response.json.get('cache'))
+        self.assertIn('misses', response.json.get('cache'))
+
+    @classmethod
+    def setUpClass(cls):
+        cls.setup_app()
+        cls.setup_user()
+
+    def setUp(self):
+        self.login('user123@gmail.com', 'pass123')
+
+
+class RedisCacheTestCase(unittest.TestCase):
+    server = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeRedisServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def wait_for_subscribers(self, count):
+        for _ in range(100):
+            if len(self.server.subscribers) >= count:
+                return
+            time.sleep(0.01)
+
+    def test_shared_entries(self):
+        first = RedisCache(self.server.url, 'secret123')
+        second = RedisCache(self.server.url, 'secret123')
+
+        first.set('release:redis:1.0.0', {'id': 1})
+
+        self.assertEqual(second.get('release:redis:1.0.0'), {'id': 1})
+        self.assertEqual(second.get_stats().get('hits'), 1)
+
+    def test_forged_entries(self):
+        first = RedisCache(self.server.url, 'secret123')
+        second = RedisCache(self.server.url, 'secret123')
+
+        first.set('release:redis:1.0.0', {'id': 1})
+        first.set('release:redis:2.0.0', {'id': 2})
+
+        # the entry swapped between the keys is not valid either
+        data = self.server.data
+        data[b'swing:release:redis:1.0.0'] = data[b'swing:release:redis:2.0.0']
+        data[b'swing:repository'] = (pickle.dumps(1), None)
+
+        with mock.patch('pickle.loads') as loads:
+            self.assertIsNone(second.get('release:redis:1.0.0'))
+            self.assertIsNone(second.get('repository'))
+            loads.assert_not_called()
+
+        self.assertIsNone(RedisCache(self.server.url, 'other').get('release:redis:2.0.0'))
+        self.assertEqual(second.get('release:redis:2.0.0'), {'id': 2})
+
+    def test_invalidate(self):
+        subscribers = len(self.server.subscribers)
+        first = RedisCache(self.server.url, 'secret123')
+        second = RedisCache(self.server.url, 'secret123')
+
+        first.set('repository', 1)
+        self.assertEqual(second.get('repository'), 1)
+
+        self.wait_for_subscribers(subscribers + 2)
+        first.invalidate('repository')
+
+        for _ in range(100):
+            if second.local_cache.get('repository') is None:
+                break
+            time.sleep(0.01)
+
+        self.assertIsNone(second.get('repository'))
+
+    def test_clear(self):
+        cache = RedisCache(self.server.url, 'secret123')
+        cache.set('redis', 1)
+        cache.clear()
+
+        self.assertIsNone(cache.get('redis'))
+
+    def test_server_not_available(self):
+        cache = RedisCache('redis://127.0.0.1:1/0', 'secret123')
+        cache.set('redis', 1)
+        cache.local_cache.clear()
+
+        self.assertIsNone(cache.get('redis'))
+        self.assertGreater(cache.get_stats().get('errors'), 0)
@@ -1,7 +1,12 @@
 import pytest
+import hashlib
+import io
 import os
-from zipfile import ZipFile
+import yaml
+from zipfile import ZipFile, ZIP_DEFLATED
 
+from swing_server import chart
+from swing_server.cache import MemoryCache
 from swing_server.chart import *
 from swing_server.errors import InvalidChartError
 from helpers import get_fixtures_path
@@ -36,6 +41,14 @@ def test_valid_definition(definition):
         'name': 'psql-chart',
         'version': '2.'
     }),
+    ChartDefinition.from_dict({
+        'name': 'psql-chart',
+        'version': 1.0
+    }),
+    ChartDefinition.from_dict({
+        'name': 42,
+        'version': '1.0.0'
+    }),
 ])
 def test_invalid_definition(definition):
     with pytest.raises(InvalidChartError):
@@ -80,23 +93,175 @@ def test_invalid_archive_files(files):
         validate_archive_files(files)
 
 
-def test_read_definition():
+def test_inspect_chart_archive():
     chart_path = os.path.join(get_fixtures_path('charts'), 'valid.zip')
     with ZipFile(chart_path) as zip_archive:
-        definition = read_definition(zip_archive)
+        manifest = inspect_chart_archive(zip_archive)
+        names = zip_archive.namelist()
+        values = zip_archive.read('values.yaml' if 'values.yaml' in names else 'values.yml')
+
+    manifest_dict = manifest.to_dict()
 
-        assert definition.name == 'redis'
-        assert definition.version == '1.0.0'
-        assert definition.description is not None
+    assert manifest_dict['definition']['name'] == 'redis'
+    assert manifest_dict['definition']['version'] == '1.0.0'
+    assert manifest_dict['definition']['description'] is not None
+    assert {x['name'] for x in manifest_dict['files']} <= set(names)
+    assert manifest_dict['size'] == sum(x['size'] for x in manifest_dict['files'])
+    assert manifest_dict['valuesDigest'] == hashlib.sha256(values).hexdigest()
 
 
-@pytest.mark.parametrize('filename', [
-    'invalid-1.zip',
-    'invalid-2.zip',
-    'invalid-3.zip',
+@pytest.mark.parametrize('filename,message', [
+    ('invalid-1.zip', 'deployment specification'),
+    ('invalid-2.zip', 'chart definition'),
+    ('invalid-3.zip', 'deployment specification'),
 ])
-def test_invalid_archive(filename):
+def test_inspect_invalid_archive(filename, message):
     chart_path = os.path.join(get_fixtures_path('charts'), filename)
     with ZipFile(chart_path) as zip_archive:
+        with pytest.raises(InvalidChartError, match=message):
+            inspect_chart_archive(zip_archive)
+
+
+def test_inspect_invalid_fixture_definition():
+    chart_path = os.path.join(get_fixtures_path('charts'), 'invalid-3.zip')
+    with ZipFile(chart_path) as zip_archive:
+        definition = zip_archive.read('chart.yaml')
+
+    with pytest.raises(InvalidChartError, match='Chart name'):
+        inspect_chart_archive(make_archive(definition))
+
+
+def make_archive(definition, extra_files=()):
+    archive = io.BytesIO()
+    with ZipFile(archive, 'w', ZIP_DEFLATED) as zip_archive:
+        zip_archive.writestr('chart.yaml', definition)
+        zip_archive.writestr('values.yaml', 'replicas: 1\n')
+        zip_archive.writestr('deployment.yaml', 'services: {}\n')
+        for name, data in extra_files:
+            zip_archive.writestr(name, data)
+    archive.seek(0)
+    return ZipFile(archive)
+
+
+VALID_DEFINITION = 'name: redis\nversion: 1.0.0\n'
+LAUGHS = 'a: &a ["lol", "lol", "lol", "lol", "lol", "lol", "lol", "lol", "lol"]\n' + ''.join(
+    f'{x}: &{x} [*{p}, *{p}, *{p}, *{p}, *{p}, *{p}, *{p}, *{p}, *{p}]\n' for p, x in zip('abcdefgh', 'bcdefghi'))
+
+
+@pytest.mark.parametrize('zip_archive', [
+    make_archive(VALID_DEFINITION, [(f'configs/{x}', '') for x in range(10)]),
+    make_archive(VALID_DEFINITION, [('configs/large', 'x' * 2048)]),
+    make_archive(VALID_DEFINITION, [(f'configs/{x}', 'x' * 1000) for x in range(5)]),
+    make_archive(VALID_DEFINITION + LAUGHS),
+    make_archive(VALID_DEFINITION + 'nested: ' + '[' * 30 + ']' * 30 + '\n'),
+    make_archive(VALID_DEFINITION + 'loop: &loop [*loop]\n'),
+    make_archive('name: [redis\n'),
+    make_archive(VALID_DEFINITION + '# comment\n' * 50),
+])
+def test_archive_limits(zip_archive):
+    limits = ArchiveLimits(max_entries=10, max_entry_size=1024, max_size=4096,
+                           max_definition_nodes=100, max_definition_depth=10, max_definition_size=512)
+
+    with pytest.raises(InvalidChartError):
+        inspect_chart_archive(zip_archive, limits)
+
+
+def test_archive_limits_aliases():
+    definition = VALID_DEFINITION + 'defaults: &defaults {port: 80}\nservice: *defaults\n'
+    manifest = inspect_chart_archive(make_archive(definition), ArchiveLimits(max_definition_nodes=20))
+
+    assert manifest.definition.name == 'redis'
+
+
+def test_definition_cache():
+    definition_cache = MemoryCache()
+    zip_archive = make_archive(VALID_DEFINITION)
+
+    first = inspect_chart_archive(zip_archive, definition_cache=definition_cache)
+    second = inspect_chart_archive(zip_archive, definition_cache=definition_cache)
+
+    assert first.definition is second.definition
+    assert (definition_cache.hits, definition_cache.misses) == (1, 1)
+
+
+def test_definition_cache_invalid():
+    definition_cache = MemoryCache()
+
+    for _ in range(2):
         with pytest.raises(InvalidChartError):
-            validate_chart_archive(zip_archive)
+            inspect_chart_archive(make_archive('name: redis\n'), definition_cache=definition_cache)
+
+    assert definition_cache.hits == 0
+
+
+def test_full_definition():
+    data = VALID_DEFINITION + (
+        'appVersion: 6.0.9\n'
+        'keywords: [cache, database]\n'
+        'maintainers:\n'
+        '  - {name: John, email: john@example.com}\n'
+        'dependencies:\n'
+        '  - {name: common, version: 1.x.x, repository: "https://charts.example.com"}\n'
+    )
+    definition = inspect_chart_archive(make_archive(data)).definition
+
+    assert not hasattr(definition, '__dict__')
+    assert definition.app_version == '6.0.9'
+    assert definition.keywords == ('cache', 'database')
+    assert definition.maintainers[0].email == 'john@example.com'
+    assert definition.dependencies[0].repository == 'https://charts.example.com'
+    assert definition.digest == hashlib.sha256(data.encode('utf-8')).hexdigest()
+    assert definition.to_dict()['dependencies'][0]['version'] == '1.x.x'
+
+
+@pytest.mark.parametrize('data', [
+    'keywords: cache\n',
+    'maintainers: [John]\n',
+    'dependencies:\n  - {version: 1.0.0}\n',
+])
+def test_invalid_full_definition(data):
+    with pytest.raises(InvalidChartError):
+        inspect_chart_archive(make_archive(VALID_DEFINITION + data))
+
+
+@pytest.mark.parametrize('loader', [yaml.SafeLoader, getattr(yaml, 'CSafeLoader', yaml.SafeLoader)])
+def test_deeply_nested_definition(loader, monkeypatch):
+    monkeypatch.setattr(chart, 'SafeLoader', loader)
+    zip_archive = make_archive(VALID_DEFINITION + 'nested: ' + '[' * 50000 + '\n')
+
+    with pytest.raises(InvalidChartError):
+        inspect_chart_archive(zip_archive)
+
+
+def test_definition_parsed_once(monkeypatch):
+    loaders = []
+
+    class CountingLoader(chart.SafeLoader):
+        def __init__(self, stream):
+            super().__init__(stream)
+            loaders.append(self)
+
+    monkeypatch.setattr(chart, 'SafeLoader', CountingLoader)
+    inspect_chart_archive(make_archive(VALID_DEFINITION))
+
+    assert len(loaders) == 1
+
+
+@pytest.mark.parametrize('name', ['chart.yaml', 'values.yaml'])
+def test_corrupted_archive(name):
+    archive = io.BytesIO()
+    with ZipFile(archive, 'w', ZIP_DEFLATED) as zip_archive:
+        zip_archive.writestr('chart.yaml', VALID_DEFINITION * 20)
+        zip_archive.writestr('values.yaml', 'replicas: 1\n' * 20)
+        zip_archive.writestr('deployment.yaml', 'services: {}\n')
+
+    with ZipFile(archive) as zip_archive:
+        member = zip_archive.getinfo(name)
+
+    # the deflated data of the member are overwritten after its local header
+    data = bytearray(archive.getvalue())
+    offset = member.header_offset + 30 + len(member.filename)
+    data[offset:offset + member.compress_size] = b'\xff' * member.compress_size
+
+    with pytest.raises(InvalidChartError):
+        inspect_chart_archive(ZipFile(io.BytesIO(bytes(data))))
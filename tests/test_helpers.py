@@ -43,6 +43,17 @@ def test_validate_chart_name(name, expected):
     assert is_valid_chart_name(name) == expected
 
 
+@pytest.mark.parametrize('lower,higher', [
+    ('1.9.0', '1.10.0'),
+    ('1.0', '1.0.1'),
+    ('0.9.12', '1.0.0'),
+    ('2.01', '2.2'),
+    ('9.0', '10.0'),
+])
+def test_version_key(lower, higher):
+    assert make_version_key(lower) < make_version_key(higher)
+
+
 @pytest.mark.parametrize('password', [
     'test123',
     'supersecret'
@@ -50,3 +61,13 @@ def test_validate_chart_name(name, expected):
 def test_hash_password(password):
     hashed_password = hash_password(password)
     assert check_password(password, hashed_password)
+
+
+@pytest.mark.parametrize('method,requested,expected', [
+    ('pbkdf2:sha256', 'pbkdf2:sha256', False),
+    ('pbkdf2:sha256', 'pbkdf2:sha256:150000', False),
+    ('pbkdf2:sha256:1000', 'pbkdf2:sha256:150000', True),
+    ('pbkdf2:sha256', 'pbkdf2:sha512', True),
+])
+def test_needs_rehash(method, requested, expected):
+    assert needs_rehash(hash_password('pass123', method), requested) == expected
@@ -0,0 +1,84 @@
+import gzip
+import json
+from unittest import mock
+
+import yaml
+
+from swing_server.index import RepositoryIndex
+from helpers import ApiTestCase, create_chart_zip
+
+
+class IndexTest(ApiTestCase):
+    def publish(self, name, version, extra=''):
+        archive = create_chart_zip(name, version, extra=extra)
+        data = dict(
+            chart=(archive, f'{name}-{version}.zip')
+        )
+        return self.client.post('/release', content_type='multipart/form-data', data=data)
+
+    def test_a_empty_index(self):
+        response = self.client.get('/index.yaml')
+
+        self.assert200(response)
+        self.assertEqual(yaml.safe_load(response.data).get('entries'), {})
+
+    def test_b_yaml_index(self):
+        self.assert200(self.publish('redis', '1.0.0'))
+        self.assert200(self.publish('redis', '1.10.0'))
+        self.assert200(self.publish('nginx', '2.0.0', 'appVersion: 1.19.0\nkeywords: [proxy, http]\n'))
+
+        response = self.client.get('/index.yaml')
+
+        self.assert200(response)
+        self.assertEqual(response.mimetype, 'application/x-yaml')
+
+        entries = yaml.safe_load(response.data).get('entries')
+
+        self.assertEqual(list(entries), ['nginx', 'redis'])
+        self.assertEqual([x.get('version') for x in entries['redis']], ['1.10.0', '1.0.0'])
+        self.assertEqual(len(entries['redis'][0].get('digest')), 64)
+        self.assertEqual(entries['nginx'][0].get('archiveUrl'), 'http://localhost:5000/release/nginx-2.0.0.zip')
+        self.assertEqual(entries['nginx'][0].get('appVersion'), '1.19.0')
+        self.assertEqual(entries['nginx'][0].get('keywords'), ['proxy', 'http'])
+        self.assertNotIn('keywords', entries['redis'][0])
+
+    def test_c_json_index(self):
+        response = self.client.get('/index.json')
+
+        self.assert200(response)
+        self.assertEqual(sorted(response.json.get('entries')), ['nginx', 'redis'])
+
+    def test_d_compressed_index(self):
+        response = self.client.get('/index.json', headers={'Accept-Encoding': 'gzip'})
+
+        self.assert200(response)
+        self.assertEqual(response.headers.get('Content-Encoding'), 'gzip')
+        self.assertEqual(sorted(json.loads(gzip.decompress(response.data)).get('entries')), ['nginx', 'redis'])
+
+    def test_e_incremental_update(self):
+        with mock.patch.object(RepositoryIndex, 'rebuild', autospec=True) as rebuild:
+            self.assert200(self.publish('nginx', '2.1.0'))
+            self.assert200(self.client.delete('/chart/redis'))
+
+            response = self.client.get('/index.json')
+
+        rebuild.assert_not_called()
+        self.assertEqual(list(response.json.get('entries')), ['nginx'])
+        self.assertEqual([x.get('version') for x in response.json['entries']['nginx']], ['2.1.0', '2.0.0'])
+
+    def test_f_not_modified(self):
+        response = self.client.get('/index.yaml')
+        response = self.client.get('/index.yaml', headers={'If-None-Match': response.headers.get('ETag')})
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_g_unknown_format(self):
+        self.assert404(self.client.get('/index.xml'))
+
+    @classmethod
+    def setUpClass(cls):
+        cls.setup_app()
+        cls.setup_user()
+
+    def setUp(self):
+        self.login('user123@gmail.com', 'pass123')
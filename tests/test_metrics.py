@@ -0,0 +1,132 @@
+import io
+
+from werkzeug.datastructures import FileStorage
+
+from swing_server.api import metadata_cache
+from swing_server.config import Config
+from swing_server.metrics import MetricsRegistry, MeteredStorage, storage_bytes, storage_duration
+from swing_server.models import Release, db
+from swing_server.storage import DownloadMode, LocalStorage
+from helpers import ApiTestCase, create_chart_zip
+
+
+def test_counter_render():
+    registry = MetricsRegistry()
+    counter = registry.counter('requests_total', 'Number of requests.', ('path',))
+    counter.inc('/chart')
+    counter.inc('/chart', amount=2)
+    counter.inc('say "hi"\n')
+
+    assert registry.render() == (
+        '# HELP requests_total Number of requests.\n'
+        '# TYPE requests_total counter\n'
+        'requests_total{path="/chart"} 3\n'
+        'requests_total{path="say \\"hi\\"\\n"} 1\n'
+    )
+
+
+def test_histogram_render():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('duration_seconds', 'Duration.', buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(5.0)
+
+    assert registry.render().splitlines()[2:] == [
+        'duration_seconds_bucket{le="0.1"} 2',
+        'duration_seconds_bucket{le="1.0"} 2',
+        'duration_seconds_bucket{le="+Inf"} 3',
+        'duration_seconds_sum 5.15',
+        'duration_seconds_count 3',
+    ]
+
+
+def test_metered_storage(tmpdir):
+    storage = MeteredStorage(LocalStorage(str(tmpdir)))
+    uploads = storage_duration.get_count('upload')
+    downloads = storage_duration.get_count('download')
+
+    archive = create_chart_zip('redis', '1.0.0')
+    upload_file = storage.create_upload()
+    upload_file.write(archive.getvalue())
+    storage.upload(1, FileStorage(upload_file, filename='redis-1.0.0.zip'))
+
+    with storage.download(1) as file:
+        data = file.read()
+
+    assert data == archive.getvalue()
+    assert storage.basedir == str(tmpdir)
+    assert storage_duration.get_count('upload') == uploads + 1
+    assert storage_duration.get_count('download') == downloads + 1
+
+
+class MetricsTest(ApiTestCase):
+    def test_a_metrics(self):
+        self.login('user123@gmail.com', 'pass123')
+
+        archive = create_chart_zip('redis', '1.0.0')
+        self.client.post('/release', data={'chart': (archive, 'redis-1.0.0.zip')})
+        self.client.get('/chart')
+        self.client.get('/release/redis-1.0.0.zip')
+
+        response = self.client.get('/metrics')
+        metrics = response.get_data(as_text=True)
+
+        self.assert200(response)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        self.assertIn('swing_http_requests_total{endpoint="main.list_charts",method="GET",status="200"}', metrics)
+        self.assertIn('swing_http_request_duration_seconds_count{endpoint="main.publish_release",method="POST"}',
+                      metrics)
+        self.assertIn('swing_db_queries_total{endpoint="main.publish_release"}', metrics)
+        self.assertIn('swing_chart_validation_duration_seconds_count', metrics)
+        self.assertIn('swing_storage_operation_duration_seconds_count{operation="upload"}', metrics)
+
+    def test_b_download_bytes(self):
+        downloaded = storage_bytes.get('download')
+
+        for mode in [DownloadMode.DIRECT, DownloadMode.X_SENDFILE]:
+            Config.DOWNLOAD_MODE = mode
+            try:
+                response = self.client.get('/release/redis-1.0.0.zip')
+                self.assert200(response)
+
+                etag = response.headers.get('ETag')
+                response = self.client.get('/release/redis-1.0.0.zip', headers={'If-None-Match': etag})
+                self.assertEqual(response.status_code, 304)
+
+                response = self.client.get('/release/redis-1.0.0.zip', headers={'Range': 'bytes=0-9'})
+                self.assertIn(response.status_code, [200, 206])
+            finally:
+                Config.DOWNLOAD_MODE = DownloadMode.DIRECT
+
+        with self.app.app_context():
+            size = Release.query.filter_by(version='1.0.0').one().size
+
+        self.assertEqual(storage_bytes.get('download'), downloaded + 2 * (size + 10))
+
+    def test_c_download_not_modified_without_digest(self):
+        with self.app.app_context():
+            release = Release.query.filter_by(version='1.0.0').one()
+            digest, release.digest = release.digest, None
+            db.session.commit()
+
+        metadata_cache.clear()
+
+        try:
+            etag = self.client.get('/release/redis-1.0.0.zip').headers.get('ETag')
+            downloaded = storage_bytes.get('download')
+
+            response = self.client.get('/release/redis-1.0.0.zip', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(storage_bytes.get('download'), downloaded)
+        finally:
+            with self.app.app_context():
+                Release.query.filter_by(version='1.0.0').one().digest = digest
+                db.session.commit()
+
+            metadata_cache.clear()
+
+    @classmethod
+    def setUpClass(cls):
+        cls.setup_app()
+        cls.setup_user()
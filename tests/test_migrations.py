@@ -0,0 +1,81 @@
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from swing_server.helpers import make_version_key
+from swing_server.migrations import SCHEMA_LOCK_KEY, lock_schema, upgrade_schema
+
+
+class MigrationTestCase(unittest.TestCase):
+    engine = None
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                'CREATE TABLE releases (id INTEGER PRIMARY KEY, chart_id INTEGER NOT NULL, '
+                'version VARCHAR NOT NULL, notes TEXT, release_date DATETIME NOT NULL)'))
+            connection.execute(text(
+                "INSERT INTO releases (chart_id, version, release_date) VALUES "
+                "(1, '1.9.0', '2021-01-01'), (1, '1.10.0', '2021-02-01')"))
+
+    def test_upgrade_schema(self):
+        upgrade_schema(self.engine)
+
+        inspector = inspect(self.engine)
+        columns = {x['name'] for x in inspector.get_columns('releases')}
+        indexes = {x['name']: x for x in inspector.get_indexes('releases')}
+
+        self.assertTrue({'digest', 'size', 'version_key'} <= columns)
+        self.assertTrue(indexes['ix_releases_chart_id_version']['unique'])
+        self.assertIn('ix_releases_chart_id_version_key', indexes)
+
+        with self.engine.connect() as connection:
+            rows = connection.execute(text('SELECT version, version_key FROM releases')).fetchall()
+
+        for version, version_key in rows:
+            self.assertEqual(version_key, make_version_key(version))
+
+    def test_upgrade_schema_twice(self):
+        upgrade_schema(self.engine)
+        upgrade_schema(self.engine)
+
+    def test_unique_release(self):
+        upgrade_schema(self.engine)
+
+        with self.assertRaises(IntegrityError):
+            with self.engine.begin() as connection:
+                connection.execute(text(
+                    "INSERT INTO releases (chart_id, version, version_key, release_date) "
+                    "VALUES (1, '1.9.0', '01.19.010', '2021-03-01')"))
+
+    def test_fill_chart_count(self):
+        with self.engine.begin() as connection:
+            connection.execute(text('CREATE TABLE charts (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL)'))
+            connection.execute(text("INSERT INTO charts (name) VALUES ('redis'), ('psql')"))
+            connection.execute(text(
+                'CREATE TABLE repository (id INTEGER PRIMARY KEY, revision BIGINT NOT NULL, '
+                'updated_at DATETIME NOT NULL)'))
+            connection.execute(text("INSERT INTO repository VALUES (1, 5, '2021-01-01')"))
+
+        upgrade_schema(self.engine)
+
+        with self.engine.connect() as connection:
+            self.assertEqual(connection.execute(text('SELECT charts FROM repository')).scalar(), 2)
+
+    def test_lock_schema(self):
+        connection = mock.Mock()
+        connection.dialect.name = 'postgresql'
+        lock_schema(connection)
+
+        statement, params = connection.execute.call_args[0]
+        self.assertIn('pg_advisory_xact_lock', str(statement))
+        self.assertEqual(params, {'key': SCHEMA_LOCK_KEY})
+
+        connection.dialect.name = 'sqlite'
+        connection.execute.reset_mock()
+        lock_schema(connection)
+
+        connection.execute.assert_not_called()
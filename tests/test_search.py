@@ -0,0 +1,76 @@
+from unittest import mock
+
+import pytest
+
+from swing_server.models import db, Chart, User
+from swing_server.search import get_search_engine, tokenize
+from helpers import ApiTestCase
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('Database Redis chart', ['database', 'redis', 'chart']),
+    ('in-memory store', ['in', 'memory', 'store']),
+    (None, []),
+])
+def test_tokenize(value, expected):
+    assert tokenize(value) == expected
+
+
+class SearchTest(ApiTestCase):
+    def search(self, query):
+        response = self.client.get('/chart', query_string={'query': query})
+        self.assert200(response)
+        return [x.get('name') for x in response.json]
+
+    def test_rank_name_first(self):
+        self.assertEqual(self.search('redis'), ['redis', 'cache'])
+
+    def test_prefix(self):
+        self.assertEqual(self.search('postg'), ['psql'])
+
+    def test_all_words(self):
+        self.assertEqual(self.search('redis store'), ['redis'])
+        self.assertEqual(self.search('redis database'), [])
+
+    def test_paginated(self):
+        response = self.client.get('/chart', query_string={'query': 'redis', 'limit': 1})
+
+        self.assert200(response)
+        self.assertEqual([x.get('name') for x in response.json], ['redis'])
+
+        link = response.headers.get('Link')
+        response = self.client.get(link[1:link.index('>')].replace('http://localhost:5000', ''))
+
+        self.assert200(response)
+        self.assertEqual([x.get('name') for x in response.json], ['cache'])
+        self.assertIsNone(response.headers.get('Link'))
+
+        with self.app.app_context():
+            engine = get_search_engine()
+            self.assertEqual([x.name for x in engine.search('redis', 0, offset=1)], ['cache'])
+            self.assertEqual([x.name for x in engine.search('redis', 0, limit=1)], ['redis'])
+
+    def test_load_in_batches(self):
+        with mock.patch('swing_server.search.LOAD_BATCH_SIZE', 1):
+            self.assertEqual(self.search('redis'), ['redis', 'cache'])
+
+    def test_reindex(self):
+        self.assertEqual(self.search('nginx'), [])
+
+        self.login('user123@gmail.com', 'pass123')
+        self.client.delete('/chart/psql')
+        self.logout()
+
+        self.assertEqual(self.search('postgresql'), [])
+
+    @classmethod
+    def setUpClass(cls):
+        cls.setup_app()
+        cls.setup_user()
+        with cls.app.app_context():
+            user = User.query.first()
+
+            db.session.add(Chart(name='redis', description='In-memory store', user_id=user.id))
+            db.session.add(Chart(name='cache', description='Cache based on Redis', user_id=user.id))
+            db.session.add(Chart(name='psql', description='Database PostgreSQL', user_id=user.id))
+            db.session.commit()
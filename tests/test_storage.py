@@ -1,8 +1,20 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+from urllib.request import urlopen
+
 from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
 
-from swing_server.storage import LocalStorage
-from helpers import create_test_zip, get_fixtures_path
+from swing_server.s3 import S3Client, S3Error
+from swing_server.storage import LocalStorage, ContentStorage, S3Storage, CachedStorage, UploadFile
+from helpers import FakeS3Server, create_test_zip, get_fixtures_path
 
 
 class StorgeTestCase(unittest.TestCase):
@@ -30,7 +42,377 @@ class StorgeTestCase(unittest.TestCase):
         file = self.storage.download(self.release_id)
         self.assertIsNotNone(file)
         self.assertTrue(file.readable())
+        file.close()
+
+    def test_c_upload_replaced(self):
+        self.storage.upload(self.release_id, FileStorage(io.BytesIO(b'PK replaced'), filename='redis.zip'))
+
+        with self.storage.download(self.release_id) as file:
+            self.assertEqual(file.read(), b'PK replaced')
 
     def test_d_delete(self):
         self.storage.delete(self.release_id)
         self.assertFalse(self.storage.file_exists(self.release_id))
+
+
+def test_unconfigured_directory():
+    for storage_class in [LocalStorage, ContentStorage]:
+        storage = storage_class(None)
+        storage.basedir = '/srv/charts'
+
+        assert storage.temp_dir == os.path.join('/srv/charts', 'tmp')
+
+
+class ContentStorageTestCase(unittest.TestCase):
+    storage = None
+    basedir = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.basedir = tempfile.mkdtemp()
+        cls.storage = ContentStorage(cls.basedir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.basedir)
+
+    def upload(self, release_id):
+        archive = create_test_zip()
+        self.storage.upload(release_id, FileStorage(archive, filename='redis.zip'))
+        archive.close()
+
+    def test_a_deduplicate(self):
+        self.upload(1)
+        self.upload(2)
+
+        digest = self.storage.get_digest(1)
+        self.assertEqual(digest, self.storage.get_digest(2))
+        self.assertEqual(self.storage.reference_count(digest), 2)
+        self.assertTrue(self.storage.get_object_path(digest).startswith(
+            os.path.join(self.basedir, 'objects', digest[:2], digest[2:4])))
+
+    def test_b_download(self):
+        file = self.storage.download(2)
+        self.assertIsNotNone(file)
+        self.assertTrue(file.read().startswith(b'PK'))
+        file.close()
+
+    def test_c_delete(self):
+        digest = self.storage.get_digest(1)
+
+        self.storage.delete(1)
+        self.assertFalse(self.storage.file_exists(1))
+        self.assertEqual(self.storage.reference_count(digest), 1)
+
+        self.storage.delete(2)
+        self.assertFalse(self.storage.file_exists(2))
+        self.assertFalse(os.path.exists(self.storage.get_object_path(digest)))
+
+
+class UploadFileTestCase(unittest.TestCase):
+    def test_digest(self):
+        upload_file = UploadFile(tempfile.gettempdir())
+        upload_file.write(b'swing ')
+        upload_file.write(b'chart')
+
+        self.assertEqual(upload_file.size, 11)
+        self.assertEqual(upload_file.digest, hashlib.sha256(b'swing chart').hexdigest())
+
+        upload_file.seek(0)
+        self.assertEqual(upload_file.read(), b'swing chart')
+
+        upload_file.close()
+        self.assertFalse(os.path.exists(upload_file.path))
+
+    def test_max_size(self):
+        upload_file = UploadFile(max_size=8)
+        upload_file.write(b'swing')
+
+        with self.assertRaises(RequestEntityTooLarge):
+            upload_file.write(b' chart')
+
+        self.assertFalse(os.path.exists(upload_file.path))
+
+    def test_commit(self):
+        basedir = tempfile.mkdtemp()
+        storage = LocalStorage(basedir)
+
+        upload_file = storage.create_upload()
+        upload_file.write(create_test_zip().getvalue())
+        storage.upload(1, FileStorage(upload_file, filename='redis.zip'))
+        upload_file.close()
+
+        self.assertTrue(storage.file_exists(1))
+        self.assertEqual(os.listdir(storage.temp_dir), [])
+
+        shutil.rmtree(basedir)
+
+    def test_commit_relative_directory(self):
+        basedir = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        os.chdir(basedir)
+
+        try:
+            for storage_class in [LocalStorage, ContentStorage]:
+                storage = storage_class(storage_class.__name__)
+
+                upload_file = storage.create_upload()
+                upload_file.write(create_test_zip().getvalue())
+                inode = os.stat(upload_file.path).st_ino
+
+                storage.upload(1, FileStorage(upload_file, filename='redis.zip'))
+                upload_file.close()
+
+                self.assertEqual(os.stat(storage.get_file_path(1)).st_ino, inode)
+                self.assertEqual(os.listdir(storage.temp_dir), [])
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(basedir)
+
+
+class S3StorageTestCase(unittest.TestCase):
+    server = None
+    storage = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeS3Server().start()
+        client = S3Client(cls.server.url, 'charts', 'access', 'secret')
+        cls.storage = S3Storage(client, prefix='archives/', part_size=1024)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_upload(self):
+        archive = create_test_zip()
+        self.storage.upload(1, FileStorage(archive, filename='redis.zip'))
+
+        self.assertEqual(self.server.objects['archives/1.zip'], archive.getvalue())
+        self.assertTrue(self.storage.file_exists(1))
+        self.assertFalse(self.storage.file_exists(2))
+
+    def test_multipart_upload(self):
+        data = os.urandom(2500)
+        self.storage.upload(3, FileStorage(io.BytesIO(data), filename='redis.zip'))
+
+        parts = [x for x in self.server.requests if x[0] == 'PUT' and x[1] == 'archives/3.zip']
+        self.assertEqual(len(parts), 3)
+        self.assertEqual(self.server.objects['archives/3.zip'], data)
+        self.assertEqual(self.server.uploads, {})
+
+    def test_download(self):
+        self.server.objects['archives/4.zip'] = b'PK archive'
+
+        file = self.storage.download(4)
+        self.assertEqual(file.read(), b'PK archive')
+        file.close()
+
+        self.assertIsNone(self.storage.download(5))
+
+    def test_size(self):
+        self.server.objects['archives/9.zip'] = b'PK archive'
+
+        self.assertEqual(self.storage.get_size(9), 10)
+        self.assertIsNone(self.storage.get_size(10))
+
+    def test_cached_download(self):
+        self.server.objects['archives/8.zip'] = b'PK archive'
+        cache_dir = tempfile.mkdtemp()
+
+        try:
+            storage = CachedStorage(self.storage, cache_dir, 1024)
+
+            with open(storage.get_local_path(8), 'rb') as f:
+                self.assertEqual(f.read(), b'PK archive')
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_delete(self):
+        self.server.objects['archives/6.zip'] = b'PK archive'
+        self.storage.delete(6)
+
+        self.assertNotIn('archives/6.zip', self.server.objects)
+
+    def test_download_url(self):
+        self.server.objects['archives/7.zip'] = b'PK archive'
+        url = self.storage.get_download_url(7, 'redis-1.0.0.zip')
+
+        self.assertIn('X-Amz-Signature=', url)
+        self.assertIn('response-content-disposition=attachment%3B%20filename%3Dredis-1.0.0.zip', url)
+
+        with urlopen(url) as response:
+            self.assertEqual(response.read(), b'PK archive')
+
+
+class SlowStorage(LocalStorage):
+    """
+    Local storage counting the downloads, which take some time.
+    """
+    def __init__(self, basedir):
+        super().__init__(basedir)
+        self.downloads = 0
+
+    def download(self, release_id):
+        self.downloads += 1
+        time.sleep(0.05)
+        return super().download(release_id)
+
+
+class CachedStorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.backend = SlowStorage(os.path.join(self.basedir, 'backend'))
+        os.makedirs(self.backend.basedir)
+
+        for release_id in range(1, 4):
+            with open(self.backend.get_file_path(release_id), 'wb') as f:
+                f.write(os.urandom(100))
+
+        self.storage = CachedStorage(self.backend, os.path.join(self.basedir, 'cache'), 250)
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_hit(self):
+        path = self.storage.get_local_path(1)
+        self.assertEqual(self.storage.get_local_path(1), path)
+
+        with open(path, 'rb') as f, open(self.backend.get_file_path(1), 'rb') as g:
+            self.assertEqual(f.read(), g.read())
+
+        self.assertEqual(self.backend.downloads, 1)
+        self.assertEqual(self.storage.get_stats()['hits'], 1)
+        self.assertEqual(self.storage.get_stats()['misses'], 1)
+
+    def test_missing(self):
+        self.assertIsNone(self.storage.get_local_path(4))
+        self.assertIsNone(self.storage.download(4))
+        self.assertEqual(self.storage.get_stats()['entries'], 0)
+
+    def test_evict_least_recently_used(self):
+        self.storage.get_local_path(1)
+        self.storage.get_local_path(2)
+        self.storage.get_local_path(1)
+        self.storage.get_local_path(3)
+
+        stats = self.storage.get_stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['size'], 200)
+        self.assertFalse(os.path.exists(self.storage.get_file_path(2)))
+        self.assertTrue(os.path.exists(self.storage.get_file_path(1)))
+
+    def test_single_flight(self):
+        paths = []
+        threads = [threading.Thread(target=lambda: paths.append(self.storage.get_local_path(1))) for _ in range(8)]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.backend.downloads, 1)
+        self.assertEqual(len(set(paths)), 1)
+        self.assertIsNotNone(paths[0])
+        self.assertEqual(self.storage.get_stats()['misses'] + self.storage.get_stats()['coalesced'] +
+                         self.storage.get_stats()['hits'], 8)
+
+    def test_evict_opened(self):
+        file = self.storage.open_local(1)
+        self.storage.get_local_path(2)
+        self.storage.get_local_path(3)
+
+        self.assertTrue(os.path.exists(file.name))
+        self.assertFalse(os.path.exists(self.storage.get_file_path(2)))
+        self.assertEqual(len(file.read()), 100)
+
+        file.close()
+        self.storage.get_local_path(2)
+
+        self.assertFalse(os.path.exists(self.storage.get_file_path(1)))
+        self.assertEqual(self.storage.get_stats()['evictions'], 2)
+
+    def test_removed_by_other_process(self):
+        os.remove(self.storage.get_local_path(1))
+
+        with self.storage.open_local(1) as f, open(self.backend.get_file_path(1), 'rb') as g:
+            self.assertEqual(f.read(), g.read())
+
+        self.assertEqual(self.backend.downloads, 2)
+        self.assertEqual(self.storage.get_stats()['size'], 100)
+
+    def test_fetched_by_other_process(self):
+        os.makedirs(self.storage.basedir)
+        shutil.copyfile(self.backend.get_file_path(1), self.storage.get_file_path(1))
+
+        self.assertIsNotNone(self.storage.get_local_path(1))
+        self.assertEqual(self.backend.downloads, 0)
+
+    def test_oversized(self):
+        # the archive of unknown size is fetched only once and then
+        # streamed from the backing storage like the one of known size
+        for get_size, downloads in [(self.backend.get_size, 2), (lambda release_id: None, 3)]:
+            storage = CachedStorage(self.backend, self.storage.basedir, 50)
+            self.backend.downloads = 0
+
+            with mock.patch.object(self.backend, 'get_size', get_size):
+                for _ in range(2):
+                    storage.download(1).close()
+
+            self.assertEqual(self.backend.downloads, downloads)
+            self.assertEqual(storage.get_stats()['entries'], 0)
+
+        self.assertEqual(os.listdir(storage.temp_dir), [])
+
+    def test_delete(self):
+        path = self.storage.get_local_path(1)
+        self.storage.delete(1)
+
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(self.storage.file_exists(1))
+        self.assertEqual(self.storage.get_stats()['size'], 0)
+
+    def test_delete_cached_by_other_process(self):
+        os.makedirs(self.storage.basedir)
+        shutil.copyfile(self.backend.get_file_path(1), self.storage.get_file_path(1))
+        self.storage.delete(1)
+
+        self.assertFalse(os.path.exists(self.storage.get_file_path(1)))
+        self.assertIsNone(self.storage.get_local_path(1))
+
+    def test_reload(self):
+        self.storage.get_local_path(1)
+        storage = CachedStorage(self.backend, self.storage.basedir, 250)
+
+        self.assertEqual(storage.get_stats()['entries'], 1)
+        self.assertIsNotNone(storage.get_local_path(1))
+        self.assertEqual(self.backend.downloads, 1)
+
+
+class HealthCheckTestCase(unittest.TestCase):
+    def test_local_storage(self):
+        basedir = tempfile.mkdtemp()
+        storage = LocalStorage(basedir)
+
+        storage.check_health()
+        storage.check_health(deep=True)
+
+        shutil.rmtree(basedir)
+
+        with self.assertRaises(OSError):
+            storage.check_health()
+
+    def test_s3_storage(self):
+        server = FakeS3Server().start()
+
+        try:
+            storage = S3Storage(S3Client(server.url, 'charts', 'access', 'secret'))
+            storage.check_health()
+            storage.check_health(deep=True)
+            self.assertEqual(server.objects, {})
+
+            storage = S3Storage(S3Client(server.url, 'missing', 'access', 'secret'))
+            with self.assertRaises(S3Error):
+                storage.check_health()
+        finally:
+            server.stop()